@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""Load and latency benchmark for dashboard_service.
+
+Starts the service as a subprocess for every requested serving mode and
+storage engine against a fresh data directory, optionally pre-fills some
+history, then runs for --duration seconds:
+
+  * an open-loop ingest generator posting --ingest-rate points/s, one per
+    /ingest call or --ingest-batch points per /ingest/batch call
+  * --latest-readers clients polling /api/latest back to back
+  * --series-readers clients fetching /api/series (--series-query) back to back
+  * --scrapers Prometheus-style clients scraping /metrics every --scrape-interval
+  * --sse-clients /events streams counting delivered events
+
+and reports per-operation throughput and p50/p99 latency, SSE delivery and
+the server's resident memory (whole process tree, sampled every 0.5s).
+
+    python benchmarks/dashboard_bench.py --mode both --storage both --json before.json
+    git checkout my-branch
+    python benchmarks/dashboard_bench.py --mode both --storage both --json after.json --compare before.json
+
+Modes: ``wsgi`` is the Flask app under gunicorn gthread (as in the
+Dockerfile), ``asgi`` is asgi.py under uvicorn. Storage is DASH_STORAGE
+(sqlite or memory). --json writes the results plus the git commit, the
+arguments and the platform so runs can be compared across commits;
+--compare prints the change against an earlier --json file. Only the
+standard library is needed on the client side; the server needs
+dashboard_service's requirements. RSS is read from /proc (Linux only).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+SERVICE_DIR = os.path.join(REPO, 'dashboard_service')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, port, threads, workers=1):
+    if mode == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-k', 'gthread',
+                '--threads', str(threads), '--workers', str(workers), 'app:app']
+    if mode == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                '--log-level', 'warning']
+    raise ValueError(f'unknown mode {mode!r}')
+
+
+def start_server(mode, port, db_path, threads, extra_env=None, workers=1):
+    env = dict(os.environ, DASH_DB=db_path)
+    env.update(extra_env or {})
+    proc = subprocess.Popen(server_command(mode, port, threads, workers), cwd=SERVICE_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(f'{mode} server exited with {proc.returncode}')
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def tree_rss_kb(pid):
+    """Resident memory of ``pid`` and all its descendants in KiB (None without /proc)."""
+    if not os.path.isdir('/proc'):
+        return None
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+            for tid in os.listdir(f'/proc/{p}/task'):
+                with open(f'/proc/{p}/task/{tid}/children') as f:
+                    pending += [int(c) for c in f.read().split()]
+        except (OSError, ValueError):
+            # process exited between listing and reading
+            continue
+    return total
+
+
+async def http(port, method, path, body=b'', headers=None, timeout=10):
+    """Minimal HTTP/1.1 request on a fresh connection; returns (status, body)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        head = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', 'Connection: close',
+                f'Content-Length: {len(body)}']
+        head += [f'{k}: {v}' for k, v in (headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(data.split(b' ', 2)[1]) if data.startswith(b'HTTP/') else 0
+    return status, data.partition(b'\r\n\r\n')[2]
+
+
+class Recorder:
+    """Latencies, error counts and bytes received per operation."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = {}
+
+    async def timed(self, op, coro):
+        started = time.perf_counter()
+        try:
+            status, body = await coro
+            ok = 200 <= status < 400
+        except Exception:
+            ok = False
+            body = b''
+        if ok:
+            self.latencies.setdefault(op, []).append(time.perf_counter() - started)
+            self.bytes[op] = self.bytes.get(op, 0) + len(body)
+        else:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def summary(self, duration):
+        out = {}
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            lat = sorted(self.latencies.get(op, []))
+            out[op] = {
+                'count': len(lat),
+                'errors': self.errors.get(op, 0),
+                'throughput': round(len(lat) / duration, 1),
+                'p50_ms': round(percentile(lat, 50) * 1000, 2),
+                'p99_ms': round(percentile(lat, 99) * 1000, 2),
+                'max_ms': round((lat[-1] if lat else 0.0) * 1000, 2),
+                'avg_bytes': round(self.bytes.get(op, 0) / len(lat)) if lat else 0,
+            }
+        return out
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def point(n, services, ts=None):
+    p = '{"service":"bench-%d","uptime":%d,"requests":%d' % (n % services, n, n)
+    return p + (',"ts":%d}' % ts if ts is not None else '}')
+
+
+async def prefill(port, points, services):
+    # history spread over the last day so series queries have something to scan
+    now = int(time.time())
+    batch = 5000
+    for start in range(0, points, batch):
+        n = min(batch, points - start)
+        body = '\n'.join(point(i, services, now - 86400 + i * 86400 // max(points, 1))
+                         for i in range(start, start + n)).encode()
+        status, _ = await http(port, 'POST', '/ingest/batch', body,
+                               {'Content-Type': 'application/x-ndjson'}, timeout=60)
+        if status != 201:
+            raise RuntimeError(f'prefill failed with HTTP {status}')
+
+
+async def ingest_load(port, rate, batch, stop, rec, services):
+    # open loop: fire on schedule regardless of how long responses take
+    calls_per_s = rate / max(batch, 1)
+    interval = 1.0 / calls_per_s
+    tasks = set()
+    n = 0
+    next_at = time.perf_counter()
+    while time.perf_counter() < stop:
+        if batch:
+            body = '\n'.join(point(n + i, services) for i in range(batch)).encode()
+            req = http(port, 'POST', '/ingest/batch', body, {'Content-Type': 'application/x-ndjson'})
+            n += batch
+        else:
+            req = http(port, 'POST', '/ingest', point(n, services).encode(), {'Content-Type': 'application/json'})
+            n += 1
+        # separate op names so batched and single-point runs never get compared
+        t = asyncio.ensure_future(rec.timed('ingest_batch' if batch else 'ingest', req))
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+    if tasks:
+        await asyncio.wait(tasks, timeout=10)
+
+
+async def latest_reader(port, stop, rec):
+    while time.perf_counter() < stop:
+        await rec.timed('latest', http(port, 'GET', '/api/latest'))
+
+
+async def series_reader(port, stop, rec, services, query):
+    n = 0
+    while time.perf_counter() < stop:
+        await rec.timed('series', http(port, 'GET', f'/api/series?service=bench-{n % services}&{query}'))
+        n += 1
+
+
+async def scraper(port, stop, rec, interval):
+    while time.perf_counter() < stop:
+        started = time.perf_counter()
+        await rec.timed('metrics', http(port, 'GET', '/metrics'))
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+
+async def sse_client(port, stop, counts):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 10)
+    except Exception:
+        counts['failed'] += 1
+        return
+    try:
+        writer.write(b'GET /events HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n')
+        await writer.drain()
+        status = await asyncio.wait_for(reader.readline(), 10)
+        if b' 200 ' not in status:
+            counts['rejected'] += 1
+            return
+        counts['connected'] += 1
+        while time.perf_counter() < stop:
+            try:
+                line = await asyncio.wait_for(reader.readline(), max(0.1, stop - time.perf_counter()))
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                break
+            if line.startswith(b'data:') or b'\ndata:' in line:
+                counts['events'] += 1
+    except Exception:
+        counts['failed'] += 1
+    finally:
+        writer.close()
+
+
+async def rss_sampler(pid, stop, samples):
+    while time.perf_counter() < stop:
+        kb = tree_rss_kb(pid)
+        if kb is not None:
+            samples.append(kb)
+        await asyncio.sleep(0.5)
+
+
+async def run_load(port, pid, args):
+    rec = Recorder()
+    counts = {'connected': 0, 'rejected': 0, 'failed': 0, 'events': 0}
+    if args.prefill:
+        await prefill(port, args.prefill, args.services)
+    rss_idle = tree_rss_kb(pid)
+    stop = time.perf_counter() + args.warmup + args.duration
+    sse = [asyncio.ensure_future(sse_client(port, stop, counts)) for _ in range(args.sse_clients)]
+    await asyncio.sleep(args.warmup)
+    load_stop = time.perf_counter() + args.duration
+    samples = []
+    jobs = [rss_sampler(pid, load_stop, samples)]
+    if args.ingest_rate > 0:
+        jobs.append(ingest_load(port, args.ingest_rate, args.ingest_batch, load_stop, rec, args.services))
+    jobs += [latest_reader(port, load_stop, rec) for _ in range(args.latest_readers)]
+    jobs += [series_reader(port, load_stop, rec, args.services, args.series_query) for _ in range(args.series_readers)]
+    jobs += [scraper(port, load_stop, rec, args.scrape_interval) for _ in range(args.scrapers)]
+    await asyncio.gather(*jobs)
+    await asyncio.gather(*sse)
+    rss = None
+    if samples:
+        rss = {'idle_mb': round((rss_idle or 0) / 1024, 1), 'peak_mb': round(max(samples) / 1024, 1),
+               'end_mb': round(samples[-1] / 1024, 1)}
+    return {'ops': rec.summary(args.duration), 'sse': counts, 'rss': rss}
+
+
+def bench_run(mode, storage, args):
+    tmp = tempfile.mkdtemp(prefix='dash-bench-')
+    port = free_port()
+    env = {'DASH_STORAGE': storage}
+    proc = start_server(mode, port, os.path.join(tmp, 'metrics.db'), args.threads, env, args.workers)
+    try:
+        return asyncio.run(run_load(port, proc.pid, args))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def git_info():
+    def git(*cmd):
+        try:
+            return subprocess.run(['git', *cmd], cwd=REPO, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ''
+    return {'commit': git('rev-parse', 'HEAD'), 'subject': git('log', '-1', '--format=%s'),
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def print_result(name, result):
+    print(f'== {name}')
+    print(f"{'op':<14}{'ok':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, r in result['ops'].items():
+        print(f"{op:<14}{r['count']:>8}{r['errors']:>6}{r['throughput']:>10}{r['p50_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['max_ms']:>10}")
+    s = result['sse']
+    print(f"sse: {s['connected']} connected, {s['rejected']} rejected, {s['failed']} failed, "
+          f"{s['events']} events delivered")
+    if result.get('rss'):
+        r = result['rss']
+        print(f"rss: {r['idle_mb']} MiB idle, {r['peak_mb']} MiB peak, {r['end_mb']} MiB at end")
+
+
+def _change(old, new):
+    if not old:
+        return '   n/a'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def print_comparison(base, results):
+    """Print throughput and latency changes against an earlier --json run."""
+    commit = base.get('meta', {}).get('git', {}).get('commit', '')[:12] or 'baseline'
+    print(f'== change vs {commit}')
+    print(f"{'run':<14}{'op':<14}{'req/s':>10}{'p50':>10}{'p99':>10}")
+    for name, result in results.items():
+        old = base.get('runs', {}).get(name)
+        if not old:
+            print(f'{name:<14}(not in baseline)')
+            continue
+        for op, r in result['ops'].items():
+            o = old['ops'].get(op)
+            if not o:
+                continue
+            print(f"{name:<14}{op:<14}{_change(o['throughput'], r['throughput']):>10}"
+                  f"{_change(o['p50_ms'], r['p50_ms']):>10}{_change(o['p99_ms'], r['p99_ms']):>10}")
+        if result.get('rss') and old.get('rss'):
+            print(f"{name:<14}{'rss peak':<14}{_change(old['rss']['peak_mb'], result['rss']['peak_mb']):>10}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+    p.add_argument('--storage', choices=['sqlite', 'memory', 'both'], default='sqlite',
+                   help='DASH_STORAGE engine(s) to run')
+    p.add_argument('--duration', type=float, default=10, help='seconds of measured load')
+    p.add_argument('--warmup', type=float, default=1, help='seconds for SSE clients to connect')
+    p.add_argument('--services', type=int, default=20, help='distinct service names to ingest and query')
+    p.add_argument('--prefill', type=int, default=0, help='history points loaded before measuring')
+    p.add_argument('--ingest-rate', type=float, default=200, help='points ingested per second (0 disables)')
+    p.add_argument('--ingest-batch', type=int, default=0,
+                   help='points per /ingest/batch call (0 posts single points to /ingest)')
+    p.add_argument('--latest-readers', type=int, default=5, help='concurrent /api/latest pollers')
+    p.add_argument('--series-readers', type=int, default=5, help='concurrent /api/series clients')
+    p.add_argument('--series-query', default='resolution=auto', help='extra /api/series query string')
+    p.add_argument('--scrapers', type=int, default=1, help='concurrent /metrics scrapers')
+    p.add_argument('--scrape-interval', type=float, default=1.0, help='seconds between scrapes per scraper')
+    p.add_argument('--sse-clients', type=int, default=100, help='concurrent /events streams')
+    p.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads in wsgi mode')
+    p.add_argument('--workers', type=int, default=1, help='gunicorn workers in wsgi mode')
+    p.add_argument('--json', metavar='PATH', help='write results to PATH as JSON')
+    p.add_argument('--compare', metavar='PATH', help='print changes against an earlier --json file')
+    args = p.parse_args(argv)
+    modes = ['wsgi', 'asgi'] if args.mode == 'both' else [args.mode]
+    storages = ['sqlite', 'memory'] if args.storage == 'both' else [args.storage]
+    results = {}
+    for mode in modes:
+        for storage in storages:
+            name = f'{mode}/{storage}'
+            results[name] = bench_run(mode, storage, args)
+            print_result(name, results[name])
+    if args.json:
+        meta = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git': git_info(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        }
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'runs': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Ingest throughput of tools/log_collector as the number of sidecars grows.
+
+For each value of --sidecars the collector is started fresh (gunicorn
+gthread, on-disk segments in a temp directory) and driven for --duration
+seconds by that many simulated sidecars. Each posts --batch lines per
+/ingest call for its own app (or one of --apps shared apps), either back to
+back or, with --interval, all at the same moment every interval the way
+sidecars with the same REPORT_INTERVAL do. --readers clients search /logs
+at the same time. Prints lines/s plus p50/p99 latency per step:
+
+    python benchmarks/log_collector_bench.py --sidecars 1,4,16,64 --readers 4
+
+--json writes the results together with the git commit, like
+dashboard_bench.py, so runs before and after a change can be compared.
+"""
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from dashboard_bench import REPO, Recorder, free_port, git_info, http, tree_rss_kb
+
+COLLECTOR_DIR = os.path.join(REPO, 'tools', 'log_collector')
+LEVELS = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARNING', 'ERROR']
+
+
+def start_collector(port, data_dir, threads):
+    env = dict(os.environ, LOG_DATA_DIR=data_dir)
+    cmd = [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-k', 'gthread',
+           '--threads', str(threads), 'app:app']
+    proc = subprocess.Popen(cmd, cwd=COLLECTOR_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            status, _ = asyncio.run(http(port, 'GET', '/logs?limit=1', timeout=1))
+            if status == 200:
+                return proc
+        except OSError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError(f'collector exited with {proc.returncode}')
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('collector did not start')
+
+
+def batch_body(app, n, batch, encoding='json'):
+    """(body, headers) of one /ingest call in the original JSON format or as
+    newline-delimited lines, optionally gzipped (what log_sidecar sends)."""
+    lines = [f'2024-01-01 12:00:00 {LEVELS[(n + i) % len(LEVELS)]} worker-{i % 8} handled request '
+             f'id={n + i} path=/api/items/{(n + i) % 100} status=200 took={(n * 7 + i) % 900}ms'
+             for i in range(batch)]
+    if encoding == 'json':
+        return json.dumps({'app': app, 'logs': lines}).encode(), {'Content-Type': 'application/json'}
+    body = ''.join(line + '\n' for line in lines).encode()
+    headers = {'Content-Type': 'application/x-log-lines', 'X-Log-App': app,
+               'X-Log-Sender': f'bench-{app}', 'X-Log-Seq': str(n)}
+    if encoding == 'gzip':
+        body = gzip.compress(body, 6)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+async def sidecar(port, app, args, stop, rec, lines):
+    n = 0
+    next_at = time.perf_counter()
+    while time.perf_counter() < stop:
+        if args.interval:
+            # every sidecar fires on the same tick
+            next_at += args.interval
+        body, headers = batch_body(app, n, args.batch, args.encoding)
+        await rec.timed('ingest', http(port, 'POST', '/ingest', body, headers, timeout=30))
+        lines[0] += args.batch
+        n += args.batch
+        if args.interval:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+async def reader(port, stop, rec):
+    n = 0
+    while time.perf_counter() < stop:
+        await rec.timed('logs', http(port, 'GET', f'/logs?q=error+items&level=warning&limit=50&app=app-{n % 4}'))
+        n += 1
+
+
+async def run_step(port, pid, sidecars, args):
+    rec = Recorder()
+    lines = [0]
+    stop = time.perf_counter() + args.duration
+    apps = args.apps or sidecars
+    jobs = [sidecar(port, f'app-{i % apps}', args, stop, rec, lines) for i in range(sidecars)]
+    jobs += [reader(port, stop, rec) for _ in range(args.readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - started
+    ops = rec.summary(elapsed)
+    ok_lines = ops.get('ingest', {}).get('count', 0) * args.batch
+    rss = tree_rss_kb(pid)
+    return {'sidecars': sidecars, 'lines_per_s': round(ok_lines / elapsed, 1), 'ops': ops,
+            'rss_mb': round(rss / 1024, 1) if rss is not None else None}
+
+
+def bench_step(sidecars, args):
+    tmp = tempfile.mkdtemp(prefix='collector-bench-')
+    port = free_port()
+    proc = start_collector(port, tmp, args.threads)
+    try:
+        return asyncio.run(run_step(port, proc.pid, sidecars, args))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def print_results(results):
+    print(f"{'sidecars':>9}{'lines/s':>11}{'ingest p50':>12}{'p99':>9}{'logs p50':>10}{'p99':>9}{'errors':>8}{'rss MiB':>9}")
+    for r in results:
+        ing = r['ops'].get('ingest', {})
+        logs = r['ops'].get('logs', {})
+        errors = sum(o['errors'] for o in r['ops'].values())
+        print(f"{r['sidecars']:>9}{r['lines_per_s']:>11}{ing.get('p50_ms', 0):>12}{ing.get('p99_ms', 0):>9}"
+              f"{logs.get('p50_ms', 0):>10}{logs.get('p99_ms', 0):>9}{errors:>8}{r['rss_mb'] or '':>9}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--sidecars', default='1,4,16,64', help='comma-separated sidecar counts to run')
+    p.add_argument('--apps', type=int, default=0, help='distinct apps (default one per sidecar)')
+    p.add_argument('--batch', type=int, default=500, help='lines per /ingest call')
+    p.add_argument('--encoding', choices=['json', 'identity', 'gzip'], default='json',
+                   help='/ingest body: original JSON, or newline-delimited lines, optionally gzipped')
+    p.add_argument('--interval', type=float, default=0,
+                   help='seconds between synchronized posts (0 posts back to back)')
+    p.add_argument('--readers', type=int, default=2, help='concurrent /logs searches')
+    p.add_argument('--duration', type=float, default=10, help='seconds per step')
+    p.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    p.add_argument('--json', metavar='PATH', help='write results to PATH as JSON')
+    args = p.parse_args(argv)
+    results = []
+    for n in [int(x) for x in args.sidecars.split(',') if x]:
+        results.append(bench_step(n, args))
+    print_results(results)
+    if args.json:
+        meta = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git': git_info(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        }
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'steps': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
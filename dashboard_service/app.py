@@ -1,252 +1,985 @@
-import sqlite3
 import time
 import json
+import hashlib
 from queue import Queue, Empty
+from collections import deque
+import itertools
 import threading
-from flask import Flask, request, jsonify, render_template, g, Response
+from flask import Flask, request, jsonify, render_template, Response
 import os
 
+import storage
+
 # Try to use prometheus_client when available; otherwise fall back to plain-text
 try:
-    from prometheus_client import CollectorRegistry, Gauge, generate_latest
+    from prometheus_client import CollectorRegistry, generate_latest
+    from prometheus_client.metrics_core import Metric
     HAS_PROM = True
 except Exception:
     HAS_PROM = False
 
-DB_PATH = os.environ.get('DASH_DB', './data/metrics.db')
+# msgpack is optional; /api/series only offers the msgpack format when present
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except Exception:
+    HAS_MSGPACK = False
+
+# group commit: how long the writer waits for more points before committing,
+# and the max number of points folded into a single transaction
+GROUP_COMMIT_MS = float(os.environ.get('DASH_GROUP_COMMIT_MS', '5'))
+GROUP_COMMIT_MAX = int(os.environ.get('DASH_GROUP_COMMIT_MAX', '1000'))
+# how long an ingest waits for its commit before answering (503 or 202)
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('DASH_GROUP_COMMIT_TIMEOUT', '10'))
+# upper bound on points accepted by a single /ingest/batch request
+BATCH_MAX_POINTS = int(os.environ.get('DASH_BATCH_MAX_POINTS', '10000'))
+# how often the writer applies retention (per-tier days live in storage.py)
+RETENTION_INTERVAL = int(os.environ.get('DASH_RETENTION_INTERVAL', '300'))
+# how long /api/latest may serve its in-memory snapshot before re-reading the
+# summary table (picks up ingests handled by other gunicorn workers)
+LATEST_TTL = float(os.environ.get('DASH_LATEST_TTL', '1.0'))
+# SSE: events kept for Last-Event-ID resume, pending events per client before
+# they are coalesced to the newest per service, concurrent stream cap and how
+# long a stream stays open before the browser is asked to reconnect
+SSE_REPLAY = int(os.environ.get('DASH_SSE_REPLAY', '1000'))
+SSE_CLIENT_BUFFER = int(os.environ.get('DASH_SSE_CLIENT_BUFFER', '100'))
+SSE_MAX_CLIENTS = int(os.environ.get('DASH_SSE_MAX_CLIENTS', '16'))
+SSE_MAX_AGE = int(os.environ.get('DASH_SSE_MAX_AGE', '300'))
 
 app = Flask(__name__)
 
-# SSE subscribers
-_sub_lock = threading.Lock()
-_subscribers = []  # list of Queue()
-
-def notify_subscribers(msg: dict):
-    payload = json.dumps(msg)
-    with _sub_lock:
-        for q in list(_subscribers):
+# all reads and writes go through this; DASH_STORAGE picks the engine
+_store = storage.open_storage()
+
+
+class Broadcaster:
+    """Fan-out of ingest events to SSE clients without blocking the writer.
+
+    Events go into one bounded replay ring shared by all clients; each client
+    only keeps a cursor into it. Publishing is an append plus a notify, so a
+    slow or stuck browser can never hold up an ingest. A client that falls
+    more than ``client_buffer`` events behind receives just the newest event
+    per service, and one that falls off the end of the ring skips ahead
+    (counted in ``dropped``). Event ids are "<epoch>-<seq>" so a
+    Last-Event-ID from before a restart is not mistaken for a current one.
+    """
+
+    def __init__(self, replay=SSE_REPLAY, client_buffer=SSE_CLIENT_BUFFER):
+        self.client_buffer = max(client_buffer, 1)
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=max(replay, 1))  # (seq, service, payload)
+        self._epoch = str(int(time.time()))
+        self._seq = 0
+        self._cursors = {}  # Subscription -> last seq delivered
+        self._listeners = []  # callables run after each publish (async servers)
+        self.dropped = 0
+        self.coalesced = 0
+
+    def add_listener(self, fn):
+        """Call ``fn()`` after every publish; it must not block."""
+        with self._cond:
+            self._listeners.append(fn)
+
+    def publish(self, msgs):
+        encoded = [(m.get('service'), json.dumps(m)) for m in msgs]
+        with self._cond:
+            for service, payload in encoded:
+                self._seq += 1
+                self._events.append((self._seq, service, payload))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for fn in listeners:
             try:
-                q.put(payload)
+                fn()
             except Exception:
-                # ignore bad subscriber
-                try:
-                    _subscribers.remove(q)
-                except Exception:
-                    pass
-
-def event_stream(q: Queue):
-    try:
-        while True:
+                pass
+
+    def subscribe(self, last_event_id=None):
+        sub = Subscription(self)
+        with self._cond:
+            cursor = self._seq
+            epoch, _, seq = (last_event_id or '').partition('-')
+            if epoch == self._epoch and seq.isdigit():
+                cursor = min(int(seq), self._seq)
+            self._cursors[sub] = cursor
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            self._cursors.pop(sub, None)
+
+    def subscriber_count(self):
+        with self._cond:
+            return len(self._cursors)
+
+    def max_lag(self):
+        with self._cond:
+            return max((self._seq - c for c in self._cursors.values()), default=0)
+
+    def _read(self, sub, timeout):
+        with self._cond:
+            if timeout > 0 and self._cursors.get(sub, self._seq) >= self._seq:
+                self._cond.wait(timeout)
+            cursor = self._cursors.get(sub, self._seq)
+            if cursor >= self._seq:
+                return []
+            oldest = self._events[0][0]
+            skipped = max(oldest - cursor - 1, 0)
+            pending = list(itertools.islice(self._events, max(cursor + 1 - oldest, 0), None))
+            self._cursors[sub] = self._seq
+            self.dropped += skipped
+        if len(pending) > self.client_buffer:
+            newest = {}
+            for ev in pending:
+                newest[ev[1]] = ev
+            with self._cond:
+                self.coalesced += len(pending) - len(newest)
+            pending = sorted(newest.values())
+        return [(f'{self._epoch}-{seq}', payload) for seq, _, payload in pending]
+
+
+class Subscription:
+    """One SSE client's view of a Broadcaster."""
+
+    def __init__(self, broadcaster):
+        self._b = broadcaster
+
+    def read(self, timeout=5):
+        """Wait up to ``timeout`` seconds and return [(event id, payload)]."""
+        return self._b._read(self, timeout)
+
+    def close(self):
+        self._b.unsubscribe(self)
+
+
+_broadcaster = Broadcaster()
+
+
+def event_stream(sub, max_age=SSE_MAX_AGE):
+    # tell EventSource how soon to reconnect once we end the stream
+    yield "retry: 3000\n\n"
+    deadline = time.monotonic() + max_age if max_age > 0 else None
+    while deadline is None or time.monotonic() < deadline:
+        # wake up frequently so the worker doesn't appear idle to gunicorn
+        events = sub.read(timeout=5)
+        if not events:
+            # send a comment to keep connection alive
+            yield ": keepalive\n\n"
+            continue
+        yield ''.join(f"id: {eid}\ndata: {data}\n\n" for eid, data in events)
+
+
+class CommitTimeout(TimeoutError):
+    """The commit did not finish in time. ``maybe_stored`` is False when the
+    rows were taken back out of the queue (nothing was written, safe to
+    retry) and True when the writer already had them (they may still land)."""
+
+    def __init__(self, maybe_stored):
+        super().__init__('group commit timed out')
+        self.maybe_stored = maybe_stored
+
+
+def _commit_timeout_reply(e):
+    # (body, status, headers) for a CommitTimeout, shared with asgi.py
+    if e.maybe_stored:
+        return ({'ok': True, 'stored': 'unknown',
+                 'error': 'commit still in progress; the points may have been stored, do not resend'}, 202, {})
+    return ({'error': 'ingest timed out before commit; nothing was stored, retry later'}, 503,
+            {'Retry-After': '5'})
+
+
+class GroupCommitWriter:
+    """Single writer thread that folds concurrent ingests into one transaction.
+
+    Callers hand over a list of (service, uptime, requests, ts) rows and block
+    until the storage engine has written them, so with SQLite an HTTP 201
+    still means the point is on disk. The first request in a group waits up to
+    GROUP_COMMIT_MS for others to join, which turns N fsyncs into one.
+    """
+
+    def __init__(self, window_ms=GROUP_COMMIT_MS, max_batch=GROUP_COMMIT_MAX):
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self._q = Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._last_prune = 0.0
+
+    def _ensure_started(self):
+        # gunicorn forks workers after import, so the thread is started lazily
+        # (and restarted in a forked child, where it does not survive)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._q = Queue()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, rows, timeout=None):
+        """Queue rows for the next commit and wait until they are durable.
+
+        Raises CommitTimeout if that takes longer than ``timeout`` (default
+        GROUP_COMMIT_TIMEOUT)."""
+        if not rows:
+            return
+        if timeout is None:
+            timeout = GROUP_COMMIT_TIMEOUT
+        done = threading.Event()
+        result = {}
+
+        def on_done(error):
+            result['error'] = error
+            done.set()
+
+        req = self.submit_nowait(rows, on_done)
+        if not done.wait(timeout):
+            raise CommitTimeout(maybe_stored=not self.cancel(req))
+        if result['error'] is not None:
+            raise result['error']
+
+    def submit_nowait(self, rows, callback):
+        """Queue rows and return at once; ``callback(error)`` runs on the
+        writer thread after the commit (error is None on success). Returns
+        a handle for ``cancel``."""
+        self._ensure_started()
+        req = {'rows': rows, 'callback': callback, 'state': 'queued'}
+        self._q.put(req)
+        return req
+
+    def cancel(self, req):
+        """Withdraw a request the writer has not picked up yet; False if it
+        is already being (or has been) committed."""
+        with self._lock:
+            if req['state'] == 'queued':
+                req['state'] = 'cancelled'
+            return req['state'] == 'cancelled'
+
+    def _take(self, req):
+        # claim a queued request for this commit unless its caller gave up
+        with self._lock:
+            if req['state'] != 'queued':
+                return False
+            req['state'] = 'taken'
+            return True
+
+    def _collect(self):
+        group = []
+        while not group:
+            first = self._q.get()
+            if self._take(first):
+                group.append(first)
+        count = len(group[0]['rows'])
+        deadline = time.monotonic() + self.window
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
             try:
-                # check frequently so the worker doesn't appear idle to gunicorn
-                data = q.get(timeout=5)
-                yield f"data: {data}\n\n"
+                req = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
             except Empty:
-                # send a comment to keep connection alive
-                yield ": keepalive\n\n"
-    finally:
-        # cleanup handled by caller
-        pass
+                break
+            if self._take(req):
+                group.append(req)
+                count += len(req['rows'])
+        return group
+
+    def _run(self):
+        # before the first commit, so no commit lands between the count and the seed
+        _stats.seed()
+        while True:
+            group = self._collect()
+            rows = [r for req in group for r in req['rows']]
+            error = None
+            evicted = 0
+            try:
+                evicted = _store.write(rows)
+            except Exception as e:
+                # mirror the request path: re-create the schema and retry once
+                try:
+                    _store.init()
+                    evicted = _store.write(rows)
+                except Exception as e2:
+                    print('ingest error', e, e2)
+                    error = e2
+            for req in group:
+                try:
+                    req['callback'](error)
+                except Exception as e:
+                    print('ingest callback error', e)
+            if error is None:
+                _after_commit(rows)
+                _stats.remove_rows(evicted)
+                # retention runs on the writer so it never races an ingest
+                if RETENTION_INTERVAL > 0 and time.monotonic() - self._last_prune >= RETENTION_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    try:
+                        _stats.remove_rows(_store.prune().get('metrics', 0))
+                    except Exception as e:
+                        print('retention error', e)
+
+
+_writer = GroupCommitWriter()
+
+
+class LatestSnapshot:
+    """In-process copy of the latest point per service backing /api/latest.
+
+    Local ingests are applied as they commit; the whole snapshot is reloaded
+    from the store once it is older than LATEST_TTL. The JSON body and
+    its ETag are built once per change, not once per poll.
+    """
+
+    def __init__(self, ttl=LATEST_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+        self._body = None
+        self._etag = None
+
+    def apply(self, rows):
+        with self._lock:
+            if self._data is None:
+                return
+            for service, uptime, requests_count, ts in rows:
+                cur = self._data.get(service)
+                if cur is None or ts >= cur['ts']:
+                    self._data[service] = {'uptime': uptime, 'requests': requests_count, 'ts': ts}
+                    self._body = None
+
+    def _load(self):
+        data = _store.latest()
+        with self._lock:
+            # the read raced any commits applied since, so merge by ts rather
+            # than replace: a newer in-process point must not be rolled back
+            if self._data is None:
+                self._data = {}
+                self._body = None
+            for service, point in data.items():
+                cur = self._data.get(service)
+                if cur is None or (point['ts'] >= cur['ts'] and point != cur):
+                    self._data[service] = point
+                    self._body = None
+            self._loaded_at = time.monotonic()
+
+    def data(self):
+        """Return a copy of the snapshot, reloading from the store when stale."""
+        if self._data is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+        with self._lock:
+            return dict(self._data)
+
+    def get(self):
+        """Return (json body, etag), reloading from the store when stale."""
+        if self._data is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+        with self._lock:
+            if self._body is None:
+                self._body = json.dumps(self._data, sort_keys=True).encode('utf-8')
+                self._etag = hashlib.sha1(self._body).hexdigest()
+            return self._body, self._etag
+
+
+_latest = LatestSnapshot()
+
+
+class LatencyHistogram:
+    """Minimal thread-safe histogram rendered by the /metrics collector."""
+
+    BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+
+    def samples(self, name, labels=None):
+        labels = labels or {}
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        out = []
+        acc = 0
+        for le, c in zip(self.buckets + (float('inf'),), counts):
+            acc += c
+            out.append((name + '_bucket', dict(labels, le=_fmt_le(le)), acc))
+        out.append((name + '_count', labels, acc))
+        out.append((name + '_sum', labels, total))
+        return out
+
+
+def _fmt_le(le):
+    return '+Inf' if le == float('inf') else repr(float(le))
+
+
+class IngestStats:
+    """Process-wide ingest counters, updated by the writer as groups commit.
+
+    The row count is seeded from the store by the writer thread before
+    its first commit and then tracked by delta (inserts minus pruned rows),
+    so every commit is counted and a scrape never scans the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._row_count = None
+        self.ingested = 0
+        self.ingest_latency = {'single': LatencyHistogram(), 'batch': LatencyHistogram()}
+        self.scrape_duration = LatencyHistogram()
+
+    def add_rows(self, n):
+        with self._lock:
+            self.ingested += max(n, 0)
+            if self._row_count is not None:
+                self._row_count += n
+
+    def remove_rows(self, n):
+        with self._lock:
+            if self._row_count is not None:
+                self._row_count -= n
+
+    def seed(self):
+        """Load the row count from the store; only the writer thread calls
+        this, before it commits anything."""
+        try:
+            count = _store.row_count()
+        except Exception:
+            try:
+                _store.init()
+                count = _store.row_count()
+            except Exception as e:
+                print('row count error', e)
+                return
+        with self._lock:
+            self._row_count = count
+
+    def row_count(self):
+        with self._lock:
+            if self._row_count is not None:
+                return self._row_count
+        # not seeded yet: start the writer (which seeds) and count directly this time
+        _writer._ensure_started()
+        return _store.row_count()
+
+
+_stats = IngestStats()
+
+
+def _metric_families():
+    """Everything /metrics exposes as (name, type, help, samples).
+
+    Samples are (sample name, labels, value). Built from in-memory state
+    only, so the cost is O(services) regardless of how many rows are stored.
+    """
+    latest = _latest.data()
+    count = _stats.row_count()
+    now = int(time.time())
+    thresh = int(os.environ.get('UP_THRESHOLD', '90'))
+    last_ts = max((v['ts'] for v in latest.values()), default=0)
+    up_count = sum(1 for v in latest.values() if now - int(v['ts'] or 0) <= thresh)
+    fams = [
+        ('dashboard_services_up', 'gauge', 'Number of services up within threshold',
+         [('dashboard_services_up', {}, up_count)]),
+        ('dashboard_metric_points_total', 'gauge', 'Total metric rows in DB',
+         [('dashboard_metric_points_total', {}, count)]),
+        ('dashboard_last_ingest_timestamp', 'gauge', 'Last ingest timestamp',
+         [('dashboard_last_ingest_timestamp', {}, last_ts)]),
+        ('dashboard_service_uptime_seconds', 'gauge', 'Last recorded uptime (seconds)',
+         [('dashboard_service_uptime_seconds', {'service': svc}, int(v['uptime'] or 0)) for svc, v in sorted(latest.items())]),
+        ('dashboard_service_requests', 'gauge', 'Last recorded requests',
+         [('dashboard_service_requests', {'service': svc}, int(v['requests'] or 0)) for svc, v in sorted(latest.items())]),
+        ('dashboard_db_row_count', 'gauge', 'DB row count',
+         [('dashboard_db_row_count', {}, count)]),
+        ('dashboard_ingested_points', 'counter', 'Points ingested by this process',
+         [('dashboard_ingested_points_total', {}, _stats.ingested)]),
+        ('dashboard_ingest_latency_seconds', 'histogram', 'Ingest request latency including the group commit',
+         [smp for ep, h in sorted(_stats.ingest_latency.items())
+          for smp in h.samples('dashboard_ingest_latency_seconds', {'endpoint': ep})]),
+        ('dashboard_scrape_duration_seconds', 'histogram', 'Time spent rendering /metrics',
+         _stats.scrape_duration.samples('dashboard_scrape_duration_seconds')),
+        ('dashboard_sse_subscribers', 'gauge', 'Connected /events clients',
+         [('dashboard_sse_subscribers', {}, _broadcaster.subscriber_count())]),
+        ('dashboard_sse_max_lag_events', 'gauge', 'Events the slowest /events client has not read yet',
+         [('dashboard_sse_max_lag_events', {}, _broadcaster.max_lag())]),
+        ('dashboard_sse_dropped_events', 'counter', 'Events skipped because a client fell off the replay buffer',
+         [('dashboard_sse_dropped_events_total', {}, _broadcaster.dropped)]),
+        ('dashboard_sse_coalesced_events', 'counter', 'Events folded into a newer event for the same service',
+         [('dashboard_sse_coalesced_events_total', {}, _broadcaster.coalesced)]),
+    ]
+    return fams
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for k, v in labels.items())
+    return '{' + inner + '}'
 
 
 def collect_prometheus_metrics_text():
-    """Return Prometheus exposition text built from DB metrics."""
+    """Return Prometheus exposition text for the fallback (no prometheus_client) path."""
     try:
-        db = get_db()
+        fams = _metric_families()
     except Exception:
         try:
-            init_db()
-            db = get_db()
+            _store.init()
+            fams = _metric_families()
         except Exception:
             return ''
+    return _metrics_text(fams)
 
-    out_lines = []
-    # helpers
-    def help_line(name, text):
-        out_lines.append(f"# HELP {name} {text}")
-    def type_gauge(name):
-        out_lines.append(f"# TYPE {name} gauge")
-
-    # total counts
-    row = db.execute('SELECT COUNT(*) as c FROM metrics').fetchone()
-    count = int(row['c']) if row else 0
-    help_line('dashboard_metric_points_total', 'Total metric rows in DB')
-    type_gauge('dashboard_metric_points_total')
-    out_lines.append(f"dashboard_metric_points_total {count}")
-
-    help_line('dashboard_db_row_count', 'DB row count')
-    type_gauge('dashboard_db_row_count')
-    out_lines.append(f"dashboard_db_row_count {count}")
-
-    last = db.execute('SELECT ts FROM metrics ORDER BY ts DESC LIMIT 1').fetchone()
-    last_ts = int(last['ts']) if last and last['ts'] else 0
-    help_line('dashboard_last_ingest_timestamp', 'Last ingest timestamp')
-    type_gauge('dashboard_last_ingest_timestamp')
-    out_lines.append(f"dashboard_last_ingest_timestamp {last_ts}")
-
-    # per-service metrics
-    help_line('dashboard_service_uptime_seconds', 'Last recorded uptime (seconds)')
-    type_gauge('dashboard_service_uptime_seconds')
-    help_line('dashboard_service_requests', 'Last recorded requests')
-    type_gauge('dashboard_service_requests')
-
-    rows = db.execute('SELECT service, uptime, requests, MAX(ts) as ts FROM metrics GROUP BY service').fetchall()
-    now = int(time.time())
-    thresh = int(os.environ.get('UP_THRESHOLD', '90'))
-    up_count = 0
-    for r in rows:
-        svc = r['service']
-        uptime = int(r['uptime'] or 0)
-        requests = int(r['requests'] or 0)
-        ts = int(r['ts'] or 0)
-        out_lines.append(f'dashboard_service_uptime_seconds{{service="{svc}"}} {uptime}')
-        out_lines.append(f'dashboard_service_requests{{service="{svc}"}} {requests}')
-        if now - ts <= thresh:
-            up_count += 1
-
-    help_line('dashboard_services_up', 'Number of services up within threshold')
-    type_gauge('dashboard_services_up')
-    out_lines.append(f'dashboard_services_up {up_count}')
 
+def _metrics_text(fams):
+    out_lines = []
+    for name, typ, doc, samples in fams:
+        declared = name + '_total' if typ == 'counter' else name
+        out_lines.append(f"# HELP {declared} {doc}")
+        out_lines.append(f"# TYPE {declared} {typ}")
+        for sname, labels, value in samples:
+            out_lines.append(f"{sname}{_fmt_labels(labels)} {value}")
     return "\n".join(out_lines) + "\n"
 
-def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        db = g._database = sqlite3.connect(DB_PATH, check_same_thread=False)
-        db.row_factory = sqlite3.Row
-    return db
-
-@app.teardown_appcontext
-def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
-
-def init_db():
-    db = get_db()
-    db.execute('''
-        CREATE TABLE IF NOT EXISTS metrics (
-            id INTEGER PRIMARY KEY,
-            service TEXT NOT NULL,
-            uptime INTEGER NOT NULL,
-            requests INTEGER NOT NULL,
-            ts INTEGER NOT NULL
-        )
-    ''')
-    db.commit()
-
-# Initialize DB at import time so the app works under gunicorn
+
+class DashboardCollector:
+    """prometheus_client collector over the same in-memory state."""
+
+    def collect(self):
+        for name, typ, doc, samples in _metric_families():
+            m = Metric(name, doc, typ)
+            for sname, labels, value in samples:
+                m.add_sample(sname, labels, value)
+            yield m
+
+
+if HAS_PROM:
+    _registry = CollectorRegistry()
+    _registry.register(DashboardCollector())
+
+
+def _after_commit(rows):
+    _stats.add_rows(len(rows))
+    _latest.apply(rows)
+    # notify any connected SSE clients about the new ingests
+    try:
+        _broadcaster.publish([{'service': service, 'uptime': uptime, 'requests': requests_count, 'ts': ts}
+                              for service, uptime, requests_count, ts in rows])
+    except Exception:
+        pass
+
+
+class IngestError(ValueError):
+    """Rejected ingest payload; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+def _parse_batch(body, mimetype, now):
+    """Parse an /ingest/batch body (JSON array, {"points": [...]} or NDJSON)
+    into metrics rows, raising IngestError on bad input."""
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = None
+    else:
+        try:
+            items = json.loads(body) if body.strip() else []
+        except ValueError:
+            items = None
+        if isinstance(items, dict):
+            items = items.get('points', [items])
+    if items is None:
+        items = []
+        for n, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise IngestError(f'invalid JSON on line {n + 1}')
+    if not isinstance(items, list):
+        raise IngestError('expected a list of points')
+    if len(items) > BATCH_MAX_POINTS:
+        raise IngestError(f'too many points (max {BATCH_MAX_POINTS})', 413)
+    rows = []
+    for i, item in enumerate(items):
+        try:
+            rows.append(_parse_point(item, now, allow_ts=True))
+        except (ValueError, TypeError) as e:
+            raise IngestError(f'point {i}: {e}')
+    return rows
+
+
+def _series_params(args):
+    """Validate /api/series query args into (service, since, until, step, resolution)."""
+    svc = args.get('service')
+    if not svc:
+        raise ValueError('service query param required')
+    try:
+        since = int(args.get('since', 0))
+        until = int(args.get('until', 0)) or int(time.time())
+        step = max(int(args.get('step', 0)), 0)
+    except ValueError:
+        raise ValueError('since, until and step must be integers')
+    return svc, since, until, step, args.get('resolution')
+
+
+def _parse_point(data, now, allow_ts=False):
+    """Validate one ingest payload and return it as a metrics row."""
+    if not isinstance(data, dict):
+        raise ValueError('point must be an object')
+    service = data.get('service')
+    if not service:
+        raise ValueError('service required')
+    uptime = int(data.get('uptime', 0))
+    requests_count = int(data.get('requests', 0))
+    ts = int(data.get('ts') or now) if allow_ts else now
+    return (str(service), uptime, requests_count, ts)
+
+# Initialize storage at import time so the app works under gunicorn
 try:
-    init_db()
+    _store.init()
 except Exception:
     # ignore errors during import-time initialization; worker will attempt on demand
     pass
 
 @app.route('/ingest', methods=['POST'])
 def ingest():
-    data = request.get_json() or {}
-    service = data.get('service')
-    uptime = int(data.get('uptime', 0))
-    requests_count = int(data.get('requests', 0))
-    if not service:
-        return jsonify({'error':'service required'}), 400
-    ts = int(time.time())
-    db = get_db()
+    started = time.perf_counter()
+    data = request.get_json(silent=True) or {}
     try:
-        db.execute('INSERT INTO metrics (service, uptime, requests, ts) VALUES (?, ?, ?, ?)',
-                   (service, uptime, requests_count, ts))
-        db.commit()
-        # notify any connected SSE clients about the new ingest
-        try:
-            notify_subscribers({'service': service, 'uptime': uptime, 'requests': requests_count, 'ts': ts})
-        except Exception:
-            pass
-        return jsonify({'ok':True}), 201
-    except Exception:
-        try:
-            init_db()
-            db.execute('INSERT INTO metrics (service, uptime, requests, ts) VALUES (?, ?, ?, ?)',
-                       (service, uptime, requests_count, ts))
-            db.commit()
-            return jsonify({'ok':True}), 201
-        except Exception as e:
-            print('ingest error', e)
-            return jsonify({'error':'failed to ingest'}), 500
+        row = _parse_point(data, int(time.time()))
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        _writer.submit([row])
+    except CommitTimeout as e:
+        body, status, headers = _commit_timeout_reply(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        print('ingest error', e)
+        return jsonify({'error':'failed to ingest'}), 500
+    _stats.ingest_latency['single'].observe(time.perf_counter() - started)
+    return jsonify({'ok':True}), 201
+
+@app.route('/ingest/batch', methods=['POST'])
+def ingest_batch():
+    """Ingest many points in one request and one transaction.
+
+    Accepts a JSON array of points (or {"points": [...]}) or NDJSON with one
+    point per line. Points may carry their own ``ts`` so buffering clients can
+    backfill; otherwise the server time is used.
+    """
+    started = time.perf_counter()
+    try:
+        rows = _parse_batch(request.get_data(as_text=True) or '', request.mimetype, int(time.time()))
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    try:
+        _writer.submit(rows)
+    except CommitTimeout as e:
+        body, status, headers = _commit_timeout_reply(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        print('ingest error', e)
+        return jsonify({'error':'failed to ingest'}), 500
+    _stats.ingest_latency['batch'].observe(time.perf_counter() - started)
+    return jsonify({'ok': True, 'ingested': len(rows)}), 201
 
 @app.route('/api/services')
 def services():
-    db = get_db()
     try:
-        rows = db.execute('SELECT DISTINCT service FROM metrics').fetchall()
+        names = _store.services()
     except Exception:
-        # attempt to initialize DB and retry once
+        # attempt to initialize storage and retry once
         try:
-            init_db()
-            rows = db.execute('SELECT DISTINCT service FROM metrics').fetchall()
+            _store.init()
+            names = _store.services()
         except Exception:
             return jsonify([])
-    return jsonify([r['service'] for r in rows])
+    return jsonify(names)
+
+# /api/query: which columns each requested aggregation contributes
+QUERY_AGGS = {
+    'last': ('uptime', 'requests'),
+    'min': ('uptime_min', 'requests_min'),
+    'max': ('uptime_max', 'requests_max'),
+    'count': ('count',),
+}
+QUERY_MAX_SERVICES = int(os.environ.get('DASH_QUERY_MAX_SERVICES', '100'))
+
+
+def _query_spec(payload):
+    """Validate an /api/query request body (or query args) into a dict."""
+    def listish(v):
+        if v is None:
+            return []
+        if isinstance(v, str):
+            return [x for x in v.split(',') if x]
+        if isinstance(v, (list, tuple)):
+            return [str(x) for x in v]
+        raise ValueError('expected a list or comma-separated string')
+    try:
+        since = int(payload.get('since') or 0)
+        until = int(payload.get('until') or 0) or int(time.time())
+        step = max(int(payload.get('step') or 0), 0)
+    except (TypeError, ValueError):
+        raise ValueError('since, until and step must be integers')
+    aggs = listish(payload.get('aggs')) or ['last']
+    bad = [a for a in aggs if a not in QUERY_AGGS]
+    if bad:
+        raise ValueError(f'unknown aggregation {bad[0]!r}')
+    services = payload.get('services')
+    # omitted or "*" means every known service; an empty list means none
+    services = ['*'] if services is None or services == '*' else listish(services)
+    if len(services) > QUERY_MAX_SERVICES:
+        raise ValueError(f'too many services (max {QUERY_MAX_SERVICES})')
+    return {
+        'services': services,
+        'since': since,
+        'until': until,
+        'step': step,
+        'resolution': payload.get('resolution') or 'auto',
+        'aggs': aggs,
+        'include': listish(payload.get('include')),
+    }
+
+
+def _run_query(spec):
+    """Answer an /api/query spec: every series in one scan, plus optional
+    services list and latest snapshot so one request refreshes a wallboard."""
+    latest = _latest.data()
+    services = spec['services']
+    if services == ['*']:
+        services = sorted(latest)
+    out = {'series': {}}
+    if services:
+        tier, step, groups = _store.query(services, spec['since'], spec['until'], spec['step'], spec['resolution'])
+        keep = {'ts'} | {col for a in spec['aggs'] for col in QUERY_AGGS[a]}
+        with groups:
+            for svc, rows in groups:
+                cols = _columns(rows, False)
+                out['series'][svc] = {k: v for k, v in cols.items() if k in keep}
+        for svc in services:
+            out['series'].setdefault(svc, {'ts': []})
+        out['resolution'] = tier
+        out['step'] = step
+    if 'services' in spec['include']:
+        out['services'] = sorted(latest)
+    if 'latest' in spec['include']:
+        out['latest'] = {svc: latest[svc] for svc in sorted(latest)}
+    return out
+
+
+# /api/series response formats: name -> mimetype. "format=" wins, otherwise
+# the first of these mimetypes found in Accept, otherwise a JSON array.
+SERIES_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/vnd.dashboard.columnar+json',
+    'msgpack': 'application/msgpack',
+}
+_SERIES_CHUNK = 500
+
+
+def _series_format(fmt, accept):
+    if fmt:
+        if fmt not in SERIES_FORMATS:
+            raise ValueError(f'unknown format {fmt!r}')
+        return fmt
+    accept = accept or ''
+    for name in ('ndjson', 'columnar', 'msgpack'):
+        if SERIES_FORMATS[name] in accept or (name == 'msgpack' and 'application/x-msgpack' in accept):
+            return name
+    return 'json'
+
+
+def _columns(rows, delta):
+    """Pivot point dicts into {"ts": [...], "uptime": [...], ...}.
+
+    With ``delta`` the ts column holds the first timestamp followed by
+    differences, which pack into far fewer bytes for regular series.
+    """
+    cols = {}
+    prev = 0
+    for r in rows:
+        if not cols:
+            cols = {k: [] for k in r}
+        for k, v in r.items():
+            if k == 'ts' and delta:
+                v, prev = v - prev, v
+            cols[k].append(v)
+    if not cols:
+        cols = {'ts': [], 'uptime': [], 'requests': []}
+    if delta:
+        cols['encoding'] = {'ts': 'delta'}
+    return cols
+
+
+def _encode_series(rows, fmt, delta=False):
+    """Encode series rows as an iterator of chunks for a streamed response."""
+    if fmt == 'ndjson':
+        for chunk in _chunks(rows, _SERIES_CHUNK):
+            yield ''.join(json.dumps(r) + '\n' for r in chunk)
+    elif fmt == 'columnar':
+        yield json.dumps(_columns(rows, delta), separators=(',', ':'))
+    elif fmt == 'msgpack':
+        yield msgpack.packb(_columns(rows, True))
+    else:
+        yield '['
+        first = True
+        for chunk in _chunks(rows, _SERIES_CHUNK):
+            yield ('' if first else ',') + ','.join(json.dumps(r) for r in chunk)
+            first = False
+        yield ']'
+
+
+def _series_error(fmt, message):
+    """An error body in the requested series format: (body, mimetype)."""
+    body = {'error': message}
+    if fmt == 'msgpack':
+        return msgpack.packb(body), SERIES_FORMATS[fmt]
+    text = json.dumps(body)
+    return (text + '\n' if fmt == 'ndjson' else text), SERIES_FORMATS[fmt]
+
+
+def _query_series(svc, since, until, step, resolution):
+    """Run a series query for one service; returns (tier, step, rows).
+
+    The query is started before returning (so errors surface here) but
+    ``rows`` is a lazy storage.ClosingIterator holding the store's cursor;
+    the caller must close it, whether or not it reads the rows.
+    """
+    tier, step, groups = _store.query([svc], since, until, step, resolution)
+    try:
+        rows = next((rows for _, rows in groups), ())
+    except BaseException:
+        groups.close()
+        raise
+    return tier, step, storage.ClosingIterator(rows, groups.close)
+
+
+def _chunks(it, n):
+    it = iter(it)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
 
 @app.route('/api/series')
 def series():
-    svc = request.args.get('service')
-    since = int(request.args.get('since', 0))
-    if not svc:
-        return jsonify({'error':'service query param required'}), 400
-    db = get_db()
+    """Time series for one service.
+
+    Without ``step``/``resolution`` this returns every raw point since
+    ``since``. ``resolution`` (raw, 1m, 1h, 1d or auto) and/or ``step``
+    (seconds) return bucketed points carrying the last value plus min, max
+    and count per bucket, read from the matching rollup tier.
+
+    The body is streamed as the store yields rows. ``format=`` or ``Accept`` selects
+    a JSON array (default), NDJSON, columnar JSON (``delta=1`` delta-encodes
+    ts) or delta-encoded msgpack.
+    """
     try:
-        rows = db.execute('SELECT ts, uptime, requests FROM metrics WHERE service=? AND ts>=? ORDER BY ts ASC',
-                          (svc, since)).fetchall()
+        svc, since, until, step, resolution = _series_params(request.args)
+        fmt = _series_format(request.args.get('format'), request.headers.get('Accept'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fmt == 'msgpack' and not HAS_MSGPACK:
+        return jsonify({'error': 'msgpack is not installed on the server'}), 406
+    delta = request.args.get('delta', '') in ('1', 'true', 'ts')
+    try:
+        tier, step, rows = _query_series(svc, since, until, step, resolution)
+    except ValueError as e:
+        body, mimetype = _series_error(fmt, str(e))
+        return Response(body, 400, mimetype=mimetype)
     except Exception:
         try:
-            init_db()
-            rows = db.execute('SELECT ts, uptime, requests FROM metrics WHERE service=? AND ts>=? ORDER BY ts ASC',
-                              (svc, since)).fetchall()
+            _store.init()
+            tier, step, rows = _query_series(svc, since, until, step, resolution)
+        except Exception as e:
+            print('series error', e)
+            body, mimetype = _series_error(fmt, 'storage unavailable, retry later')
+            return Response(body, 503, mimetype=mimetype, headers={'Retry-After': '5'})
+    resp = Response(_encode_series(rows, fmt, delta), mimetype=SERIES_FORMATS[fmt])
+    # closing the body generator does not reach rows it never started reading
+    resp.call_on_close(rows.close)
+    resp.headers['X-Series-Resolution'] = tier
+    resp.headers['X-Series-Step'] = str(step)
+    return resp
+
+@app.route('/api/query', methods=['GET', 'POST'])
+def query():
+    """Several services' series (plus, with ``include``, the services list and
+    latest values) in one request.
+
+    POST a JSON object or pass the same keys as query args: ``services``
+    (list or comma-separated; omitted or "*" means all), ``since``, ``until``,
+    ``step``, ``resolution`` (default auto), ``aggs`` (last, min, max,
+    count) and ``include`` (services, latest). Series come back columnar.
+    """
+    payload = request.get_json(silent=True) if request.method == 'POST' else None
+    try:
+        spec = _query_spec(payload if isinstance(payload, dict) else request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        out = _run_query(spec)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        try:
+            _store.init()
+            out = _run_query(spec)
         except Exception:
-            return jsonify([])
-    out = [{'ts':r['ts'],'uptime':r['uptime'],'requests':r['requests']} for r in rows]
+            return jsonify({'series': {}})
     return jsonify(out)
 
 @app.route('/api/latest')
 def latest():
-    db = get_db()
     try:
-        rows = db.execute('SELECT service, MAX(ts) as ts FROM metrics GROUP BY service').fetchall()
+        body, etag = _latest.get()
     except Exception:
         try:
-            init_db()
-            rows = db.execute('SELECT service, MAX(ts) as ts FROM metrics GROUP BY service').fetchall()
+            _store.init()
+            body, etag = _latest.get()
         except Exception:
             return jsonify({})
-    result = {}
-    for r in rows:
-        svc = r['service']
-        row = db.execute('SELECT uptime, requests, ts FROM metrics WHERE service=? ORDER BY ts DESC LIMIT 1', (svc,)).fetchone()
-        result[svc] = {'uptime': row['uptime'], 'requests': row['requests'], 'ts': row['ts']}
-    return jsonify(result)
+    resp = Response(body, mimetype='application/json')
+    # no-cache: browsers revalidate with If-None-Match and get a 304 when unchanged
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
 
 
 @app.route('/events')
 def events():
-    q = Queue()
-    with _sub_lock:
-        _subscribers.append(q)
+    if _broadcaster.subscriber_count() >= SSE_MAX_CLIENTS:
+        # EventSource retries on its own; the page also falls back to polling
+        return Response('too many event streams\n', status=503, headers={'Retry-After': '10'})
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    sub = _broadcaster.subscribe(last_id)
 
     def gen():
         try:
-            for chunk in event_stream(q):
+            for chunk in event_stream(sub):
                 yield chunk
         finally:
             # remove subscriber on disconnect
-            with _sub_lock:
-                try:
-                    _subscribers.remove(q)
-                except ValueError:
-                    pass
+            sub.close()
 
-    return Response(gen(), mimetype='text/event-stream')
+    return Response(gen(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/')
 def dashboard():
@@ -255,64 +988,27 @@ def dashboard():
 
 @app.route('/metrics')
 def metrics_endpoint():
+    started = time.perf_counter()
     try:
         if HAS_PROM:
-            registry = CollectorRegistry()
-            g_services_up = Gauge('dashboard_services_up', 'Number of services up within threshold', registry=registry)
-            g_total_points = Gauge('dashboard_metric_points_total', 'Total metric rows in DB', registry=registry)
-            g_last_ingest = Gauge('dashboard_last_ingest_timestamp', 'Last ingest timestamp', registry=registry)
-            g_service_uptime = Gauge('dashboard_service_uptime_seconds', 'Last recorded uptime (seconds)', ['service'], registry=registry)
-            g_service_requests = Gauge('dashboard_service_requests', 'Last recorded requests', ['service'], registry=registry)
-            g_db_row_count = Gauge('dashboard_db_row_count', 'DB row count', registry=registry)
-
             try:
-                db = get_db()
+                data = generate_latest(_registry)
             except Exception:
-                try:
-                    init_db()
-                    db = get_db()
-                except Exception:
-                    return Response('', mimetype='text/plain; version=0.0.4; charset=utf-8')
-
-            row = db.execute('SELECT COUNT(*) as c FROM metrics').fetchone()
-            count = int(row['c']) if row else 0
-            g_total_points.set(count)
-            g_db_row_count.set(count)
-
-            last = db.execute('SELECT ts FROM metrics ORDER BY ts DESC LIMIT 1').fetchone()
-            if last and last['ts']:
-                g_last_ingest.set(int(last['ts']))
-
-            rows = db.execute('SELECT service, uptime, requests, MAX(ts) as ts FROM metrics GROUP BY service').fetchall()
-            now = int(time.time())
-            thresh = int(os.environ.get('UP_THRESHOLD', '90'))
-            up_count = 0
-            for r in rows:
-                svc = r['service']
-                uptime = int(r['uptime'] or 0)
-                requests = int(r['requests'] or 0)
-                ts = int(r['ts'] or 0)
-                g_service_uptime.labels(svc).set(uptime)
-                g_service_requests.labels(svc).set(requests)
-                if now - ts <= thresh:
-                    up_count += 1
-
-            g_services_up.set(up_count)
-
-            data = generate_latest(registry)
-            return Response(data, mimetype='text/plain; version=0.0.4; charset=utf-8')
+                # fresh database: create the schema and retry once
+                _store.init()
+                data = generate_latest(_registry)
         else:
             data = collect_prometheus_metrics_text()
-            return Response(data, mimetype='text/plain; version=0.0.4; charset=utf-8')
+        return Response(data, mimetype='text/plain; version=0.0.4; charset=utf-8')
     except Exception as e:
         print('metrics error', e)
         return Response('', mimetype='text/plain; version=0.0.4; charset=utf-8')
+    finally:
+        _stats.scrape_duration.observe(time.perf_counter() - started)
 
 if __name__ == '__main__':
-    # Ensure DB initialization runs inside the Flask application context
     try:
-        with app.app_context():
-            init_db()
+        _store.init()
     except Exception:
         pass
     port = int(os.environ.get('DASH_PORT', '8085'))
@@ -0,0 +1,335 @@
+"""Async (ASGI) entry point for the dashboard service.
+
+Serves the same routes as the Flask ``app`` in app.py on an event loop, so
+thousands of /events streams and many concurrent ingests share one process
+instead of each holding a worker thread:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8085
+    gunicorn -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8085 asgi:app
+
+Storage, group commit, the /api/latest snapshot, the SSE broadcaster and
+the /metrics collector are shared with app.py; only the HTTP layer differs.
+Storage calls run on a small thread pool so they never block the loop, and
+ingests wait on the group-commit writer via a future instead of a thread.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as dash
+
+# threads serving storage reads for the event loop
+DB_THREADS = int(os.environ.get('DASH_ASGI_DB_THREADS', '8'))
+# open /events streams cost no thread here, so the cap is much higher
+SSE_MAX_CLIENTS = int(os.environ.get('DASH_ASGI_SSE_MAX_CLIENTS', '10000'))
+
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'dashboard.html')
+
+
+class AsyncDB:
+    """Runs blocking storage calls on a thread pool."""
+
+    def __init__(self, threads=DB_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='dash-db')
+
+    async def run(self, fn, *args):
+        """Await ``fn(*args)`` on the pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, lambda: fn(*args))
+
+    def run_soon(self, fn, *args):
+        """Run ``fn(*args)`` on the pool without waiting for it."""
+        self._pool.submit(fn, *args)
+
+
+db = AsyncDB()
+
+
+async def submit(rows, timeout=None):
+    """Hand rows to the group-commit writer and await the commit; raises
+    dash.CommitTimeout like the threaded path."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def on_done(error):
+        loop.call_soon_threadsafe(_resolve, fut, error)
+
+    req = dash._writer.submit_nowait(rows, on_done)
+    try:
+        await asyncio.wait_for(fut, dash.GROUP_COMMIT_TIMEOUT if timeout is None else timeout)
+    except asyncio.TimeoutError:
+        raise dash.CommitTimeout(maybe_stored=not dash._writer.cancel(req)) from None
+
+
+def _resolve(fut, error):
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(None)
+
+
+class Wakeup:
+    """Lets SSE coroutines sleep until the broadcaster publishes."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self):
+        # runs on the event loop; swap in a fresh event so late waiters block
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_wakeup = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    global _wakeup
+    loop = asyncio.get_running_loop()
+    _wakeup = Wakeup()
+    dash._broadcaster.add_listener(lambda: loop.call_soon_threadsafe(_wakeup.notify))
+    await db.run(dash._store.init)
+    yield
+    # uvicorn re-raises SIGTERM after shutdown, so atexit hooks may not run
+    await db.run(dash._store.close)
+
+
+async def ingest(request):
+    started = time.perf_counter()
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    try:
+        row = dash._parse_point(data or {}, int(time.time()))
+    except (ValueError, TypeError) as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        await submit([row])
+    except dash.CommitTimeout as e:
+        body, status, headers = dash._commit_timeout_reply(e)
+        return JSONResponse(body, status, headers)
+    except Exception as e:
+        print('ingest error', e)
+        return JSONResponse({'error': 'failed to ingest'}, 500)
+    dash._stats.ingest_latency['single'].observe(time.perf_counter() - started)
+    return JSONResponse({'ok': True}, 201)
+
+
+async def ingest_batch(request):
+    started = time.perf_counter()
+    body = (await request.body()).decode('utf-8', 'replace')
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip()
+    try:
+        rows = dash._parse_batch(body, mimetype, int(time.time()))
+    except dash.IngestError as e:
+        return JSONResponse({'error': str(e)}, e.status)
+    try:
+        await submit(rows)
+    except dash.CommitTimeout as e:
+        body, status, headers = dash._commit_timeout_reply(e)
+        return JSONResponse(body, status, headers)
+    except Exception as e:
+        print('ingest error', e)
+        return JSONResponse({'error': 'failed to ingest'}, 500)
+    dash._stats.ingest_latency['batch'].observe(time.perf_counter() - started)
+    return JSONResponse({'ok': True, 'ingested': len(rows)}, 201)
+
+
+async def services(request):
+    try:
+        names = await db.run(dash._store.services)
+    except Exception:
+        names = []
+    return JSONResponse(names)
+
+
+class SeriesBody:
+    """Async iterator over an encoded series, pulling each chunk on the db
+    pool so reading rows never blocks the loop."""
+
+    def __init__(self, rows, fmt, delta):
+        self.rows = rows
+        self.chunks = dash._encode_series(rows, fmt, delta)
+        self.pending = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.pending = asyncio.ensure_future(db.run(next, self.chunks, None))
+        chunk = await asyncio.shield(self.pending)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        """Release the rows on the pool once the last pull has finished."""
+        # this may run while cancelled, so queue the close instead of awaiting it
+        if self.pending is None or self.pending.done():
+            db.run_soon(self._close)
+        else:
+            self.pending.add_done_callback(lambda _: db.run_soon(self._close))
+
+    def _close(self):
+        self.chunks.close()
+        self.rows.close()
+
+
+class SeriesResponse(StreamingResponse):
+    """Closes its SeriesBody however the response ends, including a client
+    that went away before the first chunk was pulled."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.body_iterator.close()
+
+
+def _series_error(fmt, message, status, headers=None):
+    body, mimetype = dash._series_error(fmt, message)
+    return Response(body, status, headers, media_type=mimetype)
+
+
+async def series(request):
+    try:
+        svc, since, until, step, resolution = dash._series_params(request.query_params)
+        fmt = dash._series_format(request.query_params.get('format'), request.headers.get('accept'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    if fmt == 'msgpack' and not dash.HAS_MSGPACK:
+        return JSONResponse({'error': 'msgpack is not installed on the server'}, 406)
+    delta = request.query_params.get('delta', '') in ('1', 'true', 'ts')
+    try:
+        tier, step, rows = await db.run(dash._query_series, svc, since, until, step, resolution)
+    except ValueError as e:
+        return _series_error(fmt, str(e), 400)
+    except Exception as e:
+        print('series error', e)
+        return _series_error(fmt, 'storage unavailable, retry later', 503, {'Retry-After': '5'})
+    return SeriesResponse(SeriesBody(rows, fmt, delta), media_type=dash.SERIES_FORMATS[fmt],
+                          headers={'X-Series-Resolution': tier, 'X-Series-Step': str(step)})
+
+
+async def query(request):
+    payload = None
+    if request.method == 'POST':
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+    try:
+        spec = dash._query_spec(payload if isinstance(payload, dict) else request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        out = await db.run(dash._run_query, spec)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except Exception:
+        return JSONResponse({'series': {}})
+    return JSONResponse(out)
+
+
+def _etag_matches(header, etag):
+    tags = [t.strip() for t in (header or '').split(',')]
+    return '*' in tags or f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+async def latest(request):
+    try:
+        body, etag = await db.run(dash._latest.get)
+    except Exception:
+        return JSONResponse({})
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+async def events(request):
+    b = dash._broadcaster
+    if b.subscriber_count() >= SSE_MAX_CLIENTS:
+        return Response('too many event streams\n', status_code=503, headers={'Retry-After': '10'})
+    sub = b.subscribe(request.headers.get('last-event-id') or request.query_params.get('lastEventId'))
+
+    async def gen():
+        try:
+            yield "retry: 3000\n\n"
+            max_age = dash.SSE_MAX_AGE
+            deadline = time.monotonic() + max_age if max_age > 0 else None
+            while deadline is None or time.monotonic() < deadline:
+                evs = sub.read(timeout=0)
+                if not evs:
+                    await _wakeup.wait(5)
+                    evs = sub.read(timeout=0)
+                if not evs:
+                    yield ": keepalive\n\n"
+                    continue
+                yield ''.join(f"id: {eid}\ndata: {data}\n\n" for eid, data in evs)
+        finally:
+            sub.close()
+
+    return StreamingResponse(gen(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+async def dashboard(request):
+    return FileResponse(TEMPLATE, media_type='text/html')
+
+
+if dash.HAS_PROM:
+    _registry = dash.CollectorRegistry()
+    _registry.register(dash.DashboardCollector())
+
+
+async def metrics(request):
+    started = time.perf_counter()
+    try:
+        if dash.HAS_PROM:
+            data = await db.run(dash.generate_latest, _registry)
+        else:
+            data = await db.run(lambda: dash._metrics_text(dash._metric_families()))
+        return Response(data, media_type=METRICS_MIMETYPE)
+    except Exception as e:
+        print('metrics error', e)
+        return Response('', media_type=METRICS_MIMETYPE)
+    finally:
+        dash._stats.scrape_duration.observe(time.perf_counter() - started)
+
+
+app = Starlette(
+    routes=[
+        Route('/ingest', ingest, methods=['POST']),
+        Route('/ingest/batch', ingest_batch, methods=['POST']),
+        Route('/api/services', services),
+        Route('/api/series', series),
+        Route('/api/query', query, methods=['GET', 'POST']),
+        Route('/api/latest', latest),
+        Route('/events', events),
+        Route('/metrics', metrics),
+        Route('/', dashboard),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('DASH_PORT', '8085')))
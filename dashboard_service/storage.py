@@ -0,0 +1,762 @@
+"""Storage engines for the dashboard service.
+
+app.py talks to a ``Storage`` object instead of SQLite directly. Two
+engines are available, picked with DASH_STORAGE:
+
+  * ``sqlite`` (default): the metrics table plus latest/rollup summary
+    tables, with a small pool of reusable connections.
+  * ``memory``: per-service time-ordered columns in ``array('q')`` buffers
+    bounded to DASH_MEM_POINTS points each, snapshotted to disk every
+    DASH_MEM_SNAPSHOT_INTERVAL seconds and reloaded at start. Queries never
+    touch disk. The data lives in one process, so run a single worker (use
+    threads or asgi.py for concurrency).
+"""
+import atexit
+import contextlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+STORAGE_ENGINE = os.environ.get('DASH_STORAGE', 'sqlite')
+DB_PATH = os.environ.get('DASH_DB', './data/metrics.db')
+# SQLite tuning: page cache per connection (KiB) and durability level; WAL +
+# NORMAL only fsyncs at checkpoints, which is safe against app crashes
+SQLITE_CACHE_KB = int(os.environ.get('DASH_SQLITE_CACHE_KB', '16384'))
+SQLITE_SYNCHRONOUS = os.environ.get('DASH_SQLITE_SYNCHRONOUS', 'NORMAL')
+# idle connections kept for reuse; extra ones are closed when released
+SQLITE_POOL_SIZE = int(os.environ.get('DASH_SQLITE_POOL_SIZE', '8'))
+# retention per storage tier in days (0 keeps forever)
+RAW_RETENTION_DAYS = float(os.environ.get('DASH_RAW_RETENTION_DAYS', '30'))
+RETENTION_DAYS = {
+    '1m': float(os.environ.get('DASH_1M_RETENTION_DAYS', '90')),
+    '1h': float(os.environ.get('DASH_1H_RETENTION_DAYS', '730')),
+    '1d': float(os.environ.get('DASH_1D_RETENTION_DAYS', '0')),
+}
+# /api/series with resolution=auto picks a step that keeps at most this many points
+SERIES_MAX_POINTS = int(os.environ.get('DASH_SERIES_MAX_POINTS', '1500'))
+# memory engine: points kept per service (oldest dropped first), snapshot
+# file and how often it is rewritten (0 only snapshots at shutdown)
+MEM_POINTS = int(os.environ.get('DASH_MEM_POINTS', '100000'))
+MEM_SNAPSHOT = os.environ.get('DASH_MEM_SNAPSHOT', os.path.join(os.path.dirname(DB_PATH), 'metrics.mem'))
+MEM_SNAPSHOT_INTERVAL = float(os.environ.get('DASH_MEM_SNAPSHOT_INTERVAL', '60'))
+
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    db = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
+    db.row_factory = sqlite3.Row
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        db.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+        db.execute('PRAGMA temp_store=MEMORY')
+    except Exception as e:
+        # e.g. WAL is not supported on some network filesystems
+        print('sqlite pragma error', e)
+    return db
+
+# Schema migrations, applied in order. The applied version is tracked in
+# PRAGMA user_version so each step runs exactly once per database file.
+MIGRATIONS = [
+    # 1: base table
+    ['''
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY,
+            service TEXT NOT NULL,
+            uptime INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            ts INTEGER NOT NULL
+        )
+    '''],
+    # 2: indexes for per-service range scans and global time ordering
+    [
+        'CREATE INDEX IF NOT EXISTS idx_metrics_service_ts ON metrics (service, ts)',
+        'CREATE INDEX IF NOT EXISTS idx_metrics_ts ON metrics (ts)',
+    ],
+    # 3: latest point per service, maintained on ingest
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS latest_by_service (
+            service TEXT PRIMARY KEY,
+            uptime INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            ts INTEGER NOT NULL
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO latest_by_service (service, uptime, requests, ts)
+        SELECT m.service, m.uptime, m.requests, m.ts FROM metrics m
+        WHERE m.id = (SELECT id FROM metrics WHERE service = m.service ORDER BY ts DESC, id DESC LIMIT 1)
+        ''',
+    ],
+]
+
+# Rollup tiers: (name, bucket width in seconds, table), finest first
+ROLLUP_TIERS = [
+    ('1m', 60, 'metrics_1m'),
+    ('1h', 3600, 'metrics_1h'),
+    ('1d', 86400, 'metrics_1d'),
+]
+
+
+def _rollup_migration(table, width):
+    # create the tier table and backfill it from raw rows in one pass;
+    # rn = 1 marks the newest raw row of each bucket (the "last" value)
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            service TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            uptime_min INTEGER NOT NULL,
+            uptime_max INTEGER NOT NULL,
+            uptime_last INTEGER NOT NULL,
+            requests_min INTEGER NOT NULL,
+            requests_max INTEGER NOT NULL,
+            requests_last INTEGER NOT NULL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (service, bucket)
+        )
+        ''',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)',
+        f'''
+        INSERT OR REPLACE INTO {table}
+        SELECT service, bucket, COUNT(*), MIN(uptime), MAX(uptime), MAX(CASE WHEN rn = 1 THEN uptime END),
+               MIN(requests), MAX(requests), MAX(CASE WHEN rn = 1 THEN requests END), MAX(ts)
+        FROM (
+            SELECT service, uptime, requests, ts, ts - ts % {width} AS bucket,
+                   ROW_NUMBER() OVER (PARTITION BY service, ts - ts % {width} ORDER BY ts DESC, id DESC) AS rn
+            FROM metrics
+        )
+        GROUP BY service, bucket
+        ''',
+    ]
+
+
+# 4: 1-minute / 1-hour / 1-day rollups, maintained on ingest
+MIGRATIONS.append([stmt for _, width, table in ROLLUP_TIERS for stmt in _rollup_migration(table, width)])
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# fold one raw point into its bucket; "last" only moves forward in time so
+# late backfilled points do not overwrite newer values
+_ROLLUP_UPSERT = {
+    table: f'''
+        INSERT INTO {table} (service, bucket, count, uptime_min, uptime_max, uptime_last,
+                             requests_min, requests_max, requests_last, last_ts)
+        VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (service, bucket) DO UPDATE SET
+            count = count + 1,
+            uptime_min = MIN(uptime_min, excluded.uptime_min),
+            uptime_max = MAX(uptime_max, excluded.uptime_max),
+            uptime_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.uptime_last ELSE uptime_last END,
+            requests_min = MIN(requests_min, excluded.requests_min),
+            requests_max = MAX(requests_max, excluded.requests_max),
+            requests_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.requests_last ELSE requests_last END,
+            last_ts = MAX(last_ts, excluded.last_ts)
+    '''
+    for _, _, table in ROLLUP_TIERS
+}
+
+
+def prune_expired(db, now=None, chunk=5000):
+    """Delete raw rows and rollup buckets older than their tier's retention.
+
+    Deletes in chunks so a large backlog does not hold the write lock for
+    long. Returns {table: rows removed}.
+    """
+    now = int(now if now is not None else time.time())
+    targets = [('metrics', 'id', 'ts', RAW_RETENTION_DAYS)]
+    targets += [(table, 'rowid', 'bucket', RETENTION_DAYS.get(name, 0)) for name, _, table in ROLLUP_TIERS]
+    removed = {}
+    for table, key, col, days in targets:
+        if days <= 0:
+            continue
+        cutoff = now - int(days * 86400)
+        removed[table] = 0
+        while True:
+            with db:
+                cur = db.execute(f'DELETE FROM {table} WHERE {key} IN '
+                                 f'(SELECT {key} FROM {table} WHERE {col} < ? LIMIT ?)', (cutoff, chunk))
+            removed[table] += cur.rowcount
+            if cur.rowcount < chunk:
+                break
+    return removed
+
+
+def _schema_version(db):
+    return int(db.execute('PRAGMA user_version').fetchone()[0])
+
+
+def _ensure_schema(db):
+    if _schema_version(db) >= SCHEMA_VERSION:
+        return
+    # take the write lock first so concurrent workers migrate one at a time
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        version = _schema_version(db)
+        for n, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+            for stmt in steps:
+                db.execute(stmt)
+            db.execute(f'PRAGMA user_version = {n}')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+_TIER_WIDTHS = {name: width for name, width, _ in ROLLUP_TIERS}
+_TIER_TABLES = {name: table for name, _, table in ROLLUP_TIERS}
+
+_RAW_AS_ROLLUP = ('''
+    SELECT service, ts AS bucket, 1 AS count, uptime AS uptime_min, uptime AS uptime_max, uptime AS uptime_last,
+           requests AS requests_min, requests AS requests_max, requests AS requests_last, ts AS last_ts
+    FROM metrics WHERE service IN ({marks}) AND ts>=? AND ts<=? ORDER BY service, ts ASC
+''')
+
+
+def _explicit_resolution(step, resolution):
+    # shared by both engines: (tier, step) for a fixed resolution, or None for auto
+    if resolution and resolution != 'auto':
+        if resolution == 'raw':
+            return 'raw', step
+        if resolution not in _TIER_WIDTHS:
+            raise ValueError(f'unknown resolution {resolution!r}')
+        return resolution, max(step, _TIER_WIDTHS[resolution])
+    if not step and resolution != 'auto':
+        return 'raw', 0
+    return None
+
+
+def _auto_step(since, until, step, first):
+    # clamp open-ended ranges (since=0) to the services' oldest data
+    start = max(since, first or since)
+    if not step:
+        step = max(1, -(-(until - start) // SERIES_MAX_POINTS))
+    return start, step
+
+
+def _first_ts(db, services):
+    """Oldest point of ``services``, as exact as the stored tiers allow.
+
+    Walks from the coarsest tier to the finest and stops at the first one
+    that has already been pruned past the start, so the raw ``MIN(ts)`` is
+    used whenever raw rows still reach back to the first point.
+    """
+    tiers = [('metrics', 'ts', 1)] + [(table, 'bucket', width) for _, width, table in ROLLUP_TIERS]
+    marks = ','.join('?' * len(services))
+    first = coarser = None
+    for table, col, width in reversed(tiers):
+        found = db.execute(f'SELECT MIN({col}) FROM {table} WHERE service IN ({marks})', services).fetchone()[0]
+        if found is None:
+            continue
+        if first is not None and found - found % coarser > first:
+            break
+        first, coarser = found, width
+    return first
+
+
+def _pick_resolution(db, services, since, until, step, resolution):
+    """Choose the storage tier and bucket step for a series query.
+
+    An explicit ``resolution`` wins. Otherwise ``step`` (or, for
+    ``resolution=auto``, a step that keeps the response under
+    SERIES_MAX_POINTS) selects the coarsest tier no wider than the step,
+    moving to a coarser tier when the finer one has already been pruned
+    past ``since``. Returns (tier, step); tier 'raw' with step 0 means the
+    unaggregated rows.
+    """
+    picked = _explicit_resolution(step, resolution)
+    if picked:
+        return picked
+    start, step = _auto_step(since, until, step, _first_ts(db, services))
+    candidates = [('raw', 1, RAW_RETENTION_DAYS)]
+    candidates += [(name, width, RETENTION_DAYS.get(name, 0)) for name, width, _ in ROLLUP_TIERS]
+    base = max(width for _, width, _ in candidates if width <= step)
+    oldest_ok = None
+    for name, width, days in candidates:
+        if width < base:
+            continue
+        oldest_ok = (name, width)
+        if days <= 0 or start >= int(time.time()) - int(days * 86400):
+            break
+    name, width = oldest_ok
+    if name == 'raw' and step <= 1:
+        return 'raw', 0
+    return name, max(step, width)
+
+
+def _bucketize(rows, step):
+    """Fold rollup-shaped rows (sorted by bucket) into step-wide buckets.
+
+    A generator, so callers can stream buckets as the cursor advances.
+    """
+    cur = None
+    for r in rows:
+        b = r['bucket'] - r['bucket'] % step if step else r['bucket']
+        if cur is None or cur['ts'] != b:
+            if cur is not None:
+                yield cur
+            cur = {'ts': b, 'uptime': r['uptime_last'], 'requests': r['requests_last'],
+                   'uptime_min': r['uptime_min'], 'uptime_max': r['uptime_max'],
+                   'requests_min': r['requests_min'], 'requests_max': r['requests_max'],
+                   'count': r['count']}
+            continue
+        cur['uptime'] = r['uptime_last']
+        cur['requests'] = r['requests_last']
+        cur['uptime_min'] = min(cur['uptime_min'], r['uptime_min'])
+        cur['uptime_max'] = max(cur['uptime_max'], r['uptime_max'])
+        cur['requests_min'] = min(cur['requests_min'], r['requests_min'])
+        cur['requests_max'] = max(cur['requests_max'], r['requests_max'])
+        cur['count'] += r['count']
+    if cur is not None:
+        yield cur
+
+
+class Storage:
+    """What app.py needs from a storage engine.
+
+    Rows are (service, uptime, requests, ts) tuples. ``write`` and ``prune``
+    are only called from the group-commit writer thread; everything else may
+    be called from any request thread.
+    """
+
+    name = None
+
+    def init(self):
+        """Prepare the store (schema, snapshot load); safe to call repeatedly."""
+
+    def write(self, rows):
+        """Durably store rows; returns how many older points were evicted."""
+        raise NotImplementedError
+
+    def prune(self, now=None):
+        """Apply retention; returns {table: rows removed}."""
+        return {}
+
+    def latest(self):
+        """{service: {'uptime', 'requests', 'ts'}} for every known service."""
+        raise NotImplementedError
+
+    def services(self):
+        return sorted(self.latest())
+
+    def row_count(self):
+        """Number of raw points held."""
+        raise NotImplementedError
+
+    def query(self, services, since, until, step, resolution):
+        """Series for several services sharing one tier and step.
+
+        Returns (tier, step, groups) where groups is a ClosingIterator that
+        lazily yields (service, rows) in service order, skipping services
+        without data; close it when done, read or not. Raw rows are
+        {'ts', 'uptime', 'requests'}; bucketed rows (step > 0) also carry
+        the min/max columns and count. Errors in the arguments raise
+        ValueError before returning.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Flush and release resources at shutdown."""
+
+
+class ClosingIterator:
+    """Iterator holding a resource (a pooled connection and cursor) until
+    ``close()``, which is safe to call more than once.
+
+    A generator's ``finally`` never runs if the generator was not started,
+    so callers close this explicitly (or use it as a context manager); it
+    also closes itself once exhausted.
+    """
+
+    def __init__(self, it, release=None):
+        self._it = iter(it)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """Reuses SQLite connections instead of opening one per request."""
+
+    def __init__(self, connect=_connect, max_idle=SQLITE_POOL_SIZE):
+        self._connect = connect
+        self.max_idle = max(max_idle, 0)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+
+    def get(self):
+        with self._lock:
+            # connections must not be shared across a gunicorn fork
+            if self._pid != os.getpid():
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def put(self, db):
+        try:
+            if db.in_transaction:
+                db.rollback()
+        except Exception:
+            self.discard(db)
+            return
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(db)
+                return
+        self.discard(db)
+
+    def discard(self, db):
+        try:
+            db.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for db in idle:
+            self.discard(db)
+
+
+class SQLiteStorage(Storage):
+    """The metrics table, latest_by_service and the rollup tiers."""
+
+    name = 'sqlite'
+
+    def __init__(self, pool=None):
+        self.pool = pool or ConnectionPool()
+        self._ready = False
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a pooled connection with the schema in place."""
+        db = self.pool.get()
+        try:
+            if not self._ready:
+                _ensure_schema(db)
+                self._ready = True
+            yield db
+        except sqlite3.DatabaseError:
+            # e.g. the file was replaced underneath us: re-check the schema next time
+            self._ready = False
+            self.pool.discard(db)
+            raise
+        except BaseException:
+            self.pool.put(db)
+            raise
+        else:
+            self.pool.put(db)
+
+    def init(self):
+        self._ready = False
+        with self.connection():
+            pass
+
+    def write(self, rows):
+        with self.connection() as db, db:
+            db.executemany('INSERT INTO metrics (service, uptime, requests, ts) VALUES (?, ?, ?, ?)', rows)
+            db.executemany('''
+                INSERT INTO latest_by_service (service, uptime, requests, ts) VALUES (?, ?, ?, ?)
+                ON CONFLICT (service) DO UPDATE SET
+                    uptime = excluded.uptime, requests = excluded.requests, ts = excluded.ts
+                WHERE excluded.ts >= latest_by_service.ts
+            ''', rows)
+            for _, width, table in ROLLUP_TIERS:
+                db.executemany(_ROLLUP_UPSERT[table],
+                               [(svc, ts - ts % width, up, up, up, rq, rq, rq, ts) for svc, up, rq, ts in rows])
+        return 0
+
+    def prune(self, now=None):
+        with self.connection() as db:
+            return prune_expired(db, now)
+
+    def latest(self):
+        with self.connection() as db:
+            rows = db.execute('SELECT service, uptime, requests, ts FROM latest_by_service').fetchall()
+        return {r['service']: {'uptime': r['uptime'], 'requests': r['requests'], 'ts': r['ts']} for r in rows}
+
+    def services(self):
+        with self.connection() as db:
+            return [r['service'] for r in db.execute('SELECT service FROM latest_by_service ORDER BY service')]
+
+    def row_count(self):
+        with self.connection() as db:
+            return int(db.execute('SELECT COUNT(*) FROM metrics').fetchone()[0])
+
+    def query(self, services, since, until, step, resolution):
+        services = list(services)
+        marks = ','.join('?' * len(services))
+        # the connection stays checked out until the caller finishes reading
+        db = self.pool.get()
+        try:
+            if not self._ready:
+                _ensure_schema(db)
+                self._ready = True
+            tier, step = _pick_resolution(db, services, since, until, step, resolution)
+            if tier == 'raw' and not step:
+                cur = db.execute(f'SELECT service, ts, uptime, requests FROM metrics WHERE service IN ({marks}) '
+                                 'AND ts>=? AND ts<=? ORDER BY service, ts ASC', (*services, since, until))
+                groups = ((svc, ({'ts': r['ts'], 'uptime': r['uptime'], 'requests': r['requests']} for r in grp))
+                          for svc, grp in itertools.groupby(cur, key=lambda r: r['service']))
+            else:
+                if tier == 'raw':
+                    cur = db.execute(_RAW_AS_ROLLUP.format(marks=marks), (*services, since, until))
+                else:
+                    width = _TIER_WIDTHS[tier]
+                    cur = db.execute(f'SELECT * FROM {_TIER_TABLES[tier]} WHERE service IN ({marks}) '
+                                     'AND bucket>=? AND bucket<=? ORDER BY service, bucket ASC',
+                                     (*services, since - since % width, until))
+                groups = ((svc, _bucketize(grp, step))
+                          for svc, grp in itertools.groupby(cur, key=lambda r: r['service']))
+        except BaseException:
+            self.pool.put(db)
+            raise
+        return tier, step, ClosingIterator(groups, lambda: self._release(cur, db))
+
+    def _release(self, cur, db):
+        try:
+            cur.close()
+        finally:
+            self.pool.put(db)
+
+    def close(self):
+        self.pool.close()
+
+
+class _Series:
+    """Time-ordered ts/uptime/requests columns for one service."""
+
+    __slots__ = ('ts', 'uptime', 'requests')
+
+    def __init__(self):
+        self.ts = array('q')
+        self.uptime = array('q')
+        self.requests = array('q')
+
+    def add(self, ts, uptime, requests_count):
+        if not self.ts or ts >= self.ts[-1]:
+            self.ts.append(ts)
+            self.uptime.append(uptime)
+            self.requests.append(requests_count)
+        else:
+            # late point: keep the columns sorted
+            i = bisect_right(self.ts, ts)
+            self.ts.insert(i, ts)
+            self.uptime.insert(i, uptime)
+            self.requests.insert(i, requests_count)
+
+    def drop_first(self, n):
+        if n > 0:
+            del self.ts[:n]
+            del self.uptime[:n]
+            del self.requests[:n]
+        return max(n, 0)
+
+    def slice(self, since, until):
+        lo = bisect_left(self.ts, since)
+        hi = bisect_right(self.ts, until)
+        return self.ts[lo:hi], self.uptime[lo:hi], self.requests[lo:hi]
+
+
+_SNAPSHOT_MAGIC = b'DASHMEM1'
+
+
+class MemoryStorage(Storage):
+    """Bounded per-service buffers with periodic snapshots to disk.
+
+    Each service keeps at most ``capacity`` points; once a buffer grows an
+    eighth past that, the oldest points are dropped in one slice so the
+    trim cost is amortised. Bucketed queries fold raw points on the fly, so
+    every resolution is served from the same buffers.
+    """
+
+    name = 'memory'
+
+    def __init__(self, capacity=MEM_POINTS, snapshot_path=MEM_SNAPSHOT, snapshot_interval=MEM_SNAPSHOT_INTERVAL):
+        self.capacity = max(capacity, 1)
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._snap_lock = threading.Lock()
+        self._series = {}
+        self._latest = {}
+        self._count = 0
+        self._loaded = False
+        self._last_snapshot = time.monotonic()
+
+    def init(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+        try:
+            self.load()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('snapshot load error', e)
+        if self.snapshot_path:
+            atexit.register(self.close)
+
+    def write(self, rows):
+        evicted = 0
+        slack = max(self.capacity // 8, 1)
+        with self._lock:
+            for service, uptime, requests_count, ts in rows:
+                s = self._series.get(service)
+                if s is None:
+                    s = self._series[service] = _Series()
+                s.add(ts, uptime, requests_count)
+                self._count += 1
+                if len(s.ts) > self.capacity + slack:
+                    evicted += s.drop_first(len(s.ts) - self.capacity)
+                cur = self._latest.get(service)
+                if cur is None or ts >= cur['ts']:
+                    self._latest[service] = {'uptime': uptime, 'requests': requests_count, 'ts': ts}
+            self._count -= evicted
+        # the writer thread is the only caller, so snapshots never race an ingest
+        if self.snapshot_interval > 0 and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            try:
+                self.snapshot()
+            except Exception as e:
+                print('snapshot error', e)
+        return evicted
+
+    def prune(self, now=None):
+        if RAW_RETENTION_DAYS <= 0:
+            return {}
+        cutoff = int(now if now is not None else time.time()) - int(RAW_RETENTION_DAYS * 86400)
+        removed = 0
+        with self._lock:
+            for s in self._series.values():
+                removed += s.drop_first(bisect_left(s.ts, cutoff))
+            self._count -= removed
+        return {'metrics': removed}
+
+    def latest(self):
+        with self._lock:
+            return {svc: dict(v) for svc, v in self._latest.items()}
+
+    def row_count(self):
+        with self._lock:
+            return self._count
+
+    def query(self, services, since, until, step, resolution):
+        services = sorted(set(services))
+        with self._lock:
+            cols = [(svc, self._series[svc].slice(since, until)) for svc in services if svc in self._series]
+            first = min((self._series[svc].ts[0] for svc in services if self._series.get(svc)), default=None)
+        picked = _explicit_resolution(step, resolution)
+        if picked:
+            tier, step = picked
+        else:
+            # one buffer backs every resolution, so only the step matters
+            _, step = _auto_step(since, until, step, first)
+            tier, step = ('raw', 0) if step <= 1 else ('raw', step)
+        groups = ((svc, self._rows(c, step)) for svc, c in cols if len(c[0]))
+        return tier, step, ClosingIterator(groups)
+
+    @staticmethod
+    def _rows(cols, step):
+        ts, up, rq = cols
+        if not step:
+            return ({'ts': t, 'uptime': u, 'requests': r} for t, u, r in zip(ts, up, rq))
+        return _bucketize(({'bucket': t, 'count': 1, 'uptime_min': u, 'uptime_max': u, 'uptime_last': u,
+                            'requests_min': r, 'requests_max': r, 'requests_last': r}
+                           for t, u, r in zip(ts, up, rq)), step)
+
+    def close(self):
+        try:
+            self.snapshot()
+        except Exception as e:
+            print('snapshot error', e)
+
+    def snapshot(self):
+        """Write every buffer to ``snapshot_path`` atomically."""
+        if not self.snapshot_path:
+            return
+        with self._snap_lock:
+            self._last_snapshot = time.monotonic()
+            with self._lock:
+                parts = [(svc, self._latest.get(svc), s.ts.tobytes(), s.uptime.tobytes(), s.requests.tobytes())
+                         for svc, s in self._series.items()]
+                parts += [(svc, v, b'', b'', b'') for svc, v in self._latest.items() if svc not in self._series]
+            d = os.path.dirname(self.snapshot_path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            tmp = self.snapshot_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(_SNAPSHOT_MAGIC + b' ' + sys.byteorder.encode() + b'\n')
+                for svc, latest, ts, up, rq in parts:
+                    head = {'service': svc, 'n': len(ts) // 8, 'latest': latest}
+                    f.write(json.dumps(head).encode('utf-8') + b'\n')
+                    f.write(ts)
+                    f.write(up)
+                    f.write(rq)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+
+    def load(self):
+        """Replace the buffers with the contents of ``snapshot_path``."""
+        series, latest, count = {}, {}, 0
+        with open(self.snapshot_path, 'rb') as f:
+            magic, _, order = f.readline().strip().partition(b' ')
+            if magic != _SNAPSHOT_MAGIC:
+                raise ValueError(f'{self.snapshot_path} is not a dashboard snapshot')
+            swap = order.decode() != sys.byteorder
+            for line in f:
+                head = json.loads(line)
+                s = _Series()
+                for col in (s.ts, s.uptime, s.requests):
+                    col.frombytes(f.read(head['n'] * 8))
+                    if swap:
+                        col.byteswap()
+                if head['n']:
+                    series[head['service']] = s
+                    count += head['n']
+                if head.get('latest'):
+                    latest[head['service']] = head['latest']
+        with self._lock:
+            self._series, self._latest, self._count = series, latest, count
+
+
+ENGINES = {'sqlite': SQLiteStorage, 'memory': MemoryStorage}
+
+
+def open_storage(engine=None):
+    """Build the engine named by ``engine`` (default DASH_STORAGE)."""
+    engine = engine or STORAGE_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f'unknown DASH_STORAGE {engine!r} (expected one of {", ".join(sorted(ENGINES))})')
+    return ENGINES[engine]()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# the service imports its modules by plain name (as gunicorn runs it from
+# this directory) and reads its settings at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASH_DB', os.path.join(tempfile.mkdtemp(prefix='dash-test-'), 'metrics.db'))
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import pytest
+
+import app as dash
+
+
+class BlockingStore:
+    """Stands in for the storage engine; write() blocks until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.writing = threading.Event()
+        self.written = []
+
+    def write(self, rows):
+        self.writing.set()
+        self.release.wait(10)
+        self.written.extend(rows)
+        return 0
+
+    def row_count(self):
+        self.counted = len(self.written)
+        return self.counted
+
+
+@pytest.fixture
+def blocked(monkeypatch):
+    store = BlockingStore()
+    monkeypatch.setattr(dash, '_store', store)
+    monkeypatch.setattr(dash, '_after_commit', lambda rows: None)
+    writer = dash.GroupCommitWriter(window_ms=0)
+    monkeypatch.setattr(dash, '_writer', writer)
+    yield store, writer
+    store.release.set()
+
+
+def test_timeout_withdraws_rows_the_writer_has_not_taken(blocked):
+    store, writer = blocked
+    first = []
+    t = threading.Thread(target=lambda: first.append(_submit(writer, [('a', 1, 1, 1)], 0.3)))
+    t.start()
+    assert store.writing.wait(5)
+
+    # the writer is stuck on the first group, so this one is still queued
+    with pytest.raises(dash.CommitTimeout) as exc:
+        writer.submit([('b', 2, 2, 2)], timeout=0.1)
+    assert exc.value.maybe_stored is False
+
+    t.join(5)
+    # the first group was already being written: it may still land
+    assert isinstance(first[0], dash.CommitTimeout) and first[0].maybe_stored is True
+
+    store.release.set()
+    writer.submit([('c', 3, 3, 3)], timeout=5)
+    assert [r[0] for r in store.written] == ['a', 'c']
+
+
+def _submit(writer, rows, timeout):
+    try:
+        writer.submit(rows, timeout=timeout)
+    except Exception as e:
+        return e
+
+
+def test_ingest_answers_503_when_nothing_was_stored(blocked, monkeypatch):
+    store, writer = blocked
+    monkeypatch.setattr(dash, 'GROUP_COMMIT_TIMEOUT', 0.1)
+    writer.submit_nowait([('a', 1, 1, 1)], lambda error: None)
+    assert store.writing.wait(5)
+
+    resp = dash.app.test_client().post('/ingest', json={'service': 'b', 'uptime': 1, 'requests': 1})
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After']
+
+
+def test_asgi_submit_times_out(blocked):
+    asgi = pytest.importorskip('asgi')
+    store, writer = blocked
+    writer.submit_nowait([('a', 1, 1, 1)], lambda error: None)
+    assert store.writing.wait(5)
+
+    with pytest.raises(dash.CommitTimeout) as exc:
+        asyncio.run(asgi.submit([('b', 2, 2, 2)], timeout=0.1))
+    assert exc.value.maybe_stored is False
+
+
+def test_row_count_is_seeded_before_the_first_commit(blocked, monkeypatch):
+    store, writer = blocked
+    stats = dash.IngestStats()
+    monkeypatch.setattr(dash, '_stats', stats)
+    # rows already stored by an earlier run
+    store.written.extend([('old', 1, 1, 1)] * 3)
+    monkeypatch.setattr(dash, '_after_commit', lambda rows: stats.add_rows(len(rows)))
+    store.release.set()
+
+    writer.submit([('a', 1, 1, 1), ('b', 1, 1, 1)], 5)
+
+    # seeded from the store before the commit, then counted by delta
+    assert store.counted == 3
+    assert stats.row_count() == 5
@@ -0,0 +1,31 @@
+import app as dash
+
+
+class StaleStore:
+    """latest() returns what the store held before the last commit landed."""
+
+    def __init__(self, data, on_read=None):
+        self.data = data
+        self.on_read = on_read
+
+    def latest(self):
+        data = {svc: dict(v) for svc, v in self.data.items()}
+        if self.on_read:
+            self.on_read()
+        return data
+
+
+def test_reload_keeps_newer_points_applied_during_the_read(monkeypatch):
+    snap = dash.LatestSnapshot(ttl=0)
+    store = StaleStore({'api': {'uptime': 1, 'requests': 1, 'ts': 100},
+                        'web': {'uptime': 1, 'requests': 1, 'ts': 100}})
+    monkeypatch.setattr(dash, '_store', store)
+    snap.data()
+
+    # a commit is applied while the reload is reading the older rows
+    store.on_read = lambda: snap.apply([('api', 2, 2, 200)])
+    store.data['web'] = {'uptime': 3, 'requests': 3, 'ts': 150}
+    data = snap.data()
+
+    assert data['api']['ts'] == 200
+    assert data['web']['ts'] == 150
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import app as dash
+import storage
+
+
+class BrokenStore:
+    def init(self):
+        raise RuntimeError('disk gone')
+
+    def query(self, *args):
+        raise RuntimeError('disk gone')
+
+
+class CountingPool(storage.ConnectionPool):
+    """Counts connections checked out and not yet returned."""
+
+    def __init__(self):
+        super().__init__()
+        self.out = 0
+
+    def get(self):
+        self.out += 1
+        return super().get()
+
+    def put(self, db):
+        self.out -= 1
+        super().put(db)
+
+    def wait_idle(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.out and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.out == 0
+
+
+@pytest.fixture
+def sql(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    store = storage.SQLiteStorage(CountingPool())
+    store.write([('api', 1, i, 1000 + i) for i in range(1200)])
+    monkeypatch.setattr(dash, '_store', store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def mem(monkeypatch):
+    store = storage.MemoryStorage(snapshot_path=None)
+    store.write([('api', 1, i, 1000 + i) for i in range(1200)])
+    monkeypatch.setattr(dash, '_store', store)
+    return store
+
+
+def _asgi_get(path, query, send_error=None):
+    asgi = pytest.importorskip('asgi')
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(10)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if send_error:
+            raise send_error
+        sent.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0', 'spec_version': '2.4'}, 'http_version': '1.1',
+             'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+             'query_string': query.encode(), 'headers': [], 'server': ('test', 80), 'client': ('test', 1)}
+    try:
+        asyncio.run(asgi.app(scope, receive, send))
+    except Exception:
+        if not send_error:
+            raise
+        return None
+    start = sent[0]
+    bodies = [m['body'] for m in sent[1:] if m.get('body')]
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), bodies
+
+
+def test_storage_error_answers_in_the_requested_format(monkeypatch):
+    monkeypatch.setattr(dash, '_store', BrokenStore())
+    client = dash.app.test_client()
+
+    resp = client.get('/api/series?service=api&format=ndjson')
+    assert resp.status_code == 503
+    assert resp.mimetype == 'application/x-ndjson'
+    assert json.loads(resp.get_data(as_text=True).splitlines()[0]) == {'error': 'storage unavailable, retry later'}
+
+    status, headers, bodies = _asgi_get('/api/series', 'service=api&format=columnar')
+    assert status == 503
+    assert headers['content-type'].startswith(dash.SERIES_FORMATS['columnar'])
+    assert 'error' in json.loads(b''.join(bodies))
+
+
+def test_asgi_series_streams_chunks(mem):
+    status, headers, bodies = _asgi_get('/api/series', 'service=api&format=ndjson&until=5000')
+    assert status == 200
+    assert headers['x-series-resolution'] == 'raw'
+    # one body message per encoded chunk rather than a single joined body
+    assert len(bodies) == -(-1200 // dash._SERIES_CHUNK)
+    lines = b''.join(bodies).decode().splitlines()
+    assert [json.loads(line)['ts'] for line in lines] == list(range(1000, 2200))
+
+
+def test_unread_rows_release_the_connection(sql):
+    tier, step, rows = dash._query_series('api', 0, 5000, 0, None)
+    assert sql.pool.out == 1
+    rows.close()
+    assert sql.pool.out == 0
+
+    # a response that is closed without sending its body
+    resp = dash.app.test_client().get('/api/series?service=api&until=5000', buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+    assert sql.pool.out == 0
+
+    # groups from /api/query are closed even when encoding fails
+    with pytest.raises(ZeroDivisionError):
+        tier, step, groups = sql.query(['api'], 0, 5000, 0, None)
+        with groups:
+            1 / 0
+    assert sql.pool.out == 0
+
+
+def test_asgi_releases_the_connection_when_the_client_is_gone(sql):
+    _asgi_get('/api/series', 'service=api&until=5000', send_error=OSError('reset'))
+    assert sql.pool.wait_idle()
+
+    _asgi_get('/api/series', 'service=api&until=5000')
+    assert sql.pool.wait_idle()
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import storage
+
+DAY = 86400
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    sql = storage.SQLiteStorage()
+    sql.init()
+    mem = storage.MemoryStorage(snapshot_path=None)
+    yield sql, mem
+    sql.close()
+
+
+def _fill(engines, first, until, every=60):
+    rows = [('api', 1, i, ts) for i, ts in enumerate(range(first, until, every))]
+    for engine in engines:
+        engine.write(rows)
+
+
+def _step(engine, since, until):
+    tier, step, groups = engine.query(['api'], since, until, 0, 'auto')
+    for _, points in groups:
+        list(points)
+    return tier, step
+
+
+def test_auto_step_matches_memory_engine(engines):
+    now = int(time.time())
+    # the first point sits well inside its day, so a day-floored start would widen the range
+    first = now - 2 * DAY + 12345
+    _fill(engines, first, now)
+    sql, mem = engines
+
+    tier, step = _step(sql, now - 7 * DAY, now)
+    assert step == _step(mem, now - 7 * DAY, now)[1]
+    assert step == -(-(now - first) // storage.SERIES_MAX_POINTS)
+    assert tier == '1m'
+
+
+def test_first_ts_falls_back_to_the_finest_tier_left(engines):
+    now = int(time.time())
+    first = now - 2 * DAY + 12345
+    _fill(engines, first, now)
+    sql, _ = engines
+    with sql.connection() as db, db:
+        db.execute('DELETE FROM metrics WHERE ts < ?', (now - DAY,))
+        assert storage._first_ts(db, ['api']) == first - first % 60
+        db.execute('DELETE FROM metrics_1m')
+        assert storage._first_ts(db, ['api']) == first - first % 3600
+
+
+def test_first_ts_covers_every_requested_service(engines):
+    now = int(time.time())
+    sql, _ = engines
+    sql.write([('api', 1, 1, now - 100), ('web', 1, 1, now - 5000), ('db', 1, 1, now - 9000)])
+    with sql.connection() as db:
+        assert storage._first_ts(db, ['api', 'web']) == now - 5000
+        assert storage._first_ts(db, ['none']) is None
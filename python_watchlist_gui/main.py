@@ -1,14 +1,19 @@
 import json
-import threading
+import itertools
+import math
 import queue
+import random
+import threading
 import time
 import websocket
+from array import array
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from tkinter import font as tkfont
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 
 def _python_heartbeat_loop():
@@ -18,7 +23,7 @@ def _python_heartbeat_loop():
     while True:
         ts = int(time.time() * 1000)
         try:
-            requests.post(hb_url, json={'app': 'python_watchlist_gui', 'ts': ts}, timeout=5)
+            http.post(hb_url, json={'app': 'python_watchlist_gui', 'ts': ts}, timeout=5)
         except Exception:
             pass
         # optional: report to dashboard ingestion endpoint
@@ -27,7 +32,7 @@ def _python_heartbeat_loop():
             if dash:
                 metric = {'service': 'python_watchlist_gui', 'uptime': int(ts/1000), 'requests': 0}
                 try:
-                    requests.post(dash.rstrip('/') + '/ingest', json=metric, timeout=3)
+                    http.post(dash.rstrip('/') + '/ingest', json=metric, timeout=3)
                 except Exception:
                     pass
         except Exception:
@@ -51,19 +56,267 @@ except Exception:
     _host_part = API_BASE
 WS_URL = os.environ.get('BACKEND_WS', f"{_ws_proto}://{_host_part}/ws-plain")
 
-q = queue.Queue()
+# backend calls run on this many worker threads, sharing one keep-alive session
+HTTP_WORKERS = int(os.environ.get('HTTP_WORKERS', '4'))
+
+
+class Backend:
+    """Pooled HTTP session plus a bounded worker pool for backend calls.
+
+    ``submit`` runs a request off the Tk thread. Its result (or the
+    exception it raised) is handed to the ``done`` callback by ``deliver``,
+    which the GUI calls on the Tk thread every frame, so callbacks may touch
+    widgets and workers never call into Tk themselves.
+    """
+
+    def __init__(self, workers):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=workers + 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backend')
+        self.completed = queue.SimpleQueue()
+
+    def submit(self, request, done=None):
+        def run():
+            try:
+                result = request()
+            except Exception as e:
+                result = e
+            if done is not None:
+                self.completed.put((done, result))
+            return result
+        return self.executor.submit(run)
+
+    def deliver(self):
+        while True:
+            try:
+                done, result = self.completed.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                done(result)
+            except Exception as e:
+                print("callback error:", e)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+backend = Backend(HTTP_WORKERS)
+http = backend.session
+
+# price updates are applied to the tree once per frame, for at most
+# UI_FRAME_BUDGET_MS; whatever is left waits for the next frame
+UI_FRAME_MS = int(os.environ.get('UI_FRAME_MS', '50'))
+UI_FRAME_BUDGET_MS = float(os.environ.get('UI_FRAME_BUDGET_MS', '8'))
+# virtual table mode: rows live in a compact model and only the visible
+# ones exist as tree items (for watchlists of thousands of tickers)
+GUI_VIRTUAL = os.environ.get('GUI_VIRTUAL', '0').lower() in ('1', 'true', 'yes')
+ROW_HEIGHT = 26
+# websocket reconnect backoff (seconds, jittered) and keepalive
+WS_RETRY_MIN = float(os.environ.get('WS_RETRY_MIN', '1'))
+WS_RETRY_MAX = float(os.environ.get('WS_RETRY_MAX', '30'))
+WS_PING_INTERVAL = int(os.environ.get('WS_PING_INTERVAL', '20'))
+# connected but no prices for this long is shown in the status bar
+WS_STALE_SECS = float(os.environ.get('WS_STALE_SECS', '30'))
+
+
+def _tick_row(u, keep_raw=True):
+    # display values for one price update (computed off the Tk thread)
+    ticker = u.get("ticker")
+    ts = u.get("timestamp") or u.get("fetchedAt")
+    tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000)) if ts else ''
+    entry_id = u.get("id") or ''
+    # the virtual view fetches raw JSON on demand instead of keeping it per row
+    raw = json.dumps(u) if keep_raw else ''
+    return ticker, (entry_id, ticker, u.get("price"), tstr, raw, "Remove"), ts
+
+
+class TickBuffer:
+    """Latest pending update per ticker.
+
+    The websocket thread puts updates in; a newer tick for a ticker that has
+    not been shown yet replaces the older one (and counts as dropped) while
+    keeping its place in line, so a burst costs the Tk thread one row update
+    per ticker instead of one per tick. An update older than one already
+    seen for its ticker (e.g. a backfill racing live ticks) is dropped too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # ticker -> (row values, timestamp), in arrival order
+        self._latest = {}  # ticker -> newest timestamp accepted
+        self.received = 0
+        self.dropped = 0
+        self.last_ts = None  # newest update timestamp seen, for the heartbeat label
+        self.keep_raw = not GUI_VIRTUAL  # set by the window for the view it shows
+
+    def put(self, data):
+        updates = data if isinstance(data, list) else [data]
+        keep_raw = self.keep_raw
+        rows = [_tick_row(u, keep_raw) for u in updates if isinstance(u, dict)]
+        with self._lock:
+            for ticker, values, ts in rows:
+                self.received += 1
+                if ts:
+                    if ts < self._latest.get(ticker, 0):
+                        self.dropped += 1
+                        continue
+                    self._latest[ticker] = ts
+                if ticker in self._pending:
+                    self.dropped += 1
+                self._pending[ticker] = (values, ts)
+                if ts and (self.last_ts is None or ts > self.last_ts):
+                    self.last_ts = ts
+
+    def take(self, n):
+        # up to n of the oldest pending (ticker, (values, timestamp))
+        with self._lock:
+            keys = list(itertools.islice(self._pending, n))
+            return [(k, self._pending.pop(k)) for k in keys]
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def empty(self):
+        return not self._pending
+
+    def __len__(self):
+        return len(self._pending)
+
+
+q = TickBuffer()
+
+
+def _number(value, cast, default):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class WatchlistModel:
+    """Watchlist rows for the virtual view, kept column-wise in flat arrays
+    (ticker, price, timestamp, id); row order is display order."""
+
+    def __init__(self):
+        self.tickers = []
+        self.prices = array('d')  # nan when unknown
+        self.stamps = array('q')  # epoch ms, 0 when unknown
+        self.ids = array('q')  # 0 when unknown
+        self.index = {}  # ticker -> row
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _reindex(self, start):
+        for i in range(start, len(self.tickers)):
+            self.index[self.tickers[i]] = i
+
+    def set(self, ticker, price=None, ts=None, entry_id=None, at=None):
+        """Update the row of ticker (inserted at row ``at`` or the end if new); returns the row."""
+        i = self.index.get(ticker)
+        if i is None:
+            i = len(self.tickers) if at is None else at
+            self.tickers.insert(i, ticker)
+            self.prices.insert(i, math.nan)
+            self.stamps.insert(i, 0)
+            self.ids.insert(i, 0)
+            self._reindex(i)
+        if price is not None:
+            self.prices[i] = _number(price, float, math.nan)
+        if ts:
+            self.stamps[i] = _number(ts, int, 0)
+        if entry_id:
+            self.ids[i] = _number(entry_id, int, 0)
+        return i
+
+    def remove(self, ticker):
+        i = self.index.pop(ticker, None)
+        if i is None:
+            return
+        del self.tickers[i]
+        del self.prices[i]
+        del self.stamps[i]
+        del self.ids[i]
+        self._reindex(i)
+
+    def replace(self, rows):
+        """Reset to ``rows`` of (ticker, price, ts, id); known prices and
+        timestamps are kept where a row has none."""
+        tickers, prices, stamps, ids, index = [], array('d'), array('q'), array('q'), {}
+        for ticker, price, ts, entry_id in rows:
+            if ticker in index:
+                continue
+            old = self.index.get(ticker)
+            index[ticker] = len(tickers)
+            tickers.append(ticker)
+            if price is None and old is not None:
+                prices.append(self.prices[old])
+            else:
+                prices.append(_number(price, float, math.nan))
+            if not ts and old is not None:
+                stamps.append(self.stamps[old])
+            else:
+                stamps.append(_number(ts, int, 0))
+            ids.append(_number(entry_id, int, 0) if entry_id else 0)
+        self.tickers, self.prices, self.stamps, self.ids = tickers, prices, stamps, ids
+        # keep the same dict object, the GUI holds on to it
+        self.index.clear()
+        self.index.update(index)
+
+    def values(self, i):
+        # tree values for row i
+        price = self.prices[i]
+        ts = self.stamps[i]
+        tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000)) if ts else ''
+        return (self.ids[i] or '', self.tickers[i], '' if math.isnan(price) else price, tstr, '', "Remove")
+
+
+class WSHealth:
+    """State of the price websocket, updated by its thread and shown by the GUI."""
+
+    def __init__(self):
+        self.state = 'connecting'  # connecting, connected or waiting
+        self.attempt = 0  # failed connects in a row
+        self.connects = 0  # successful connects so far
+        self.opened_at = None
+        self.retry_at = None
+        self.error = None
+        self.last_message = None
+
+    def describe(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.state == 'connected':
+            if self.last_message is not None and now - self.last_message >= WS_STALE_SECS:
+                return f'Connected, no prices for {int(now - self.last_message)}s'
+            return 'Connected'
+        if self.state == 'waiting':
+            msg = f'Disconnected, retrying in {max(0, math.ceil(self.retry_at - now))}s'
+            return f'{msg} ({self.error})' if self.error else msg
+        return f'Reconnecting (attempt {self.attempt + 1})' if self.attempt else 'Connecting'
+
+
+ws_health = WSHealth()
 
 
 def on_message(ws, message):
+    ws_health.last_message = time.monotonic()
     try:
         data = json.loads(message)
     except Exception:
         return
-    q.put(data)
+    try:
+        q.put(data)
+    except Exception:
+        pass
 
 
 def on_error(ws, error):
     print("WebSocket error:", error)
+    ws_health.error = str(error) or type(error).__name__
 
 
 def on_close(ws, close_status_code, close_msg):
@@ -71,12 +324,25 @@ def on_close(ws, close_status_code, close_msg):
 
 
 def on_open(ws):
-    pass
+    now = time.monotonic()
+    ws_health.opened_at = now
+    ws_health.last_message = now
+    ws_health.error = None
+    ws_health.connects += 1
+    ws_health.state = 'connected'
+
+
+def _retry_delay(attempt):
+    # exponential backoff, jittered between half and all of the step
+    delay = min(WS_RETRY_MAX, WS_RETRY_MIN * 2 ** min(attempt, 30))
+    return random.uniform(delay / 2, delay)
 
 
 class WatchlistGUI:
-    def __init__(self, root):
+    def __init__(self, root, virtual=None):
         self.root = root
+        self.virtual = GUI_VIRTUAL if virtual is None else virtual
+        q.keep_raw = not self.virtual
         root.title("Watchlist")
         # Modern ttk theme and fonts
         try:
@@ -88,7 +354,7 @@ class WatchlistGUI:
             heading_font = tkfont.Font(family=default_font.actual('family'), size=10, weight='bold')
             style.configure('Treeview.Heading', font=heading_font)
             # visual tweaks for modern look
-            style.configure('Treeview', rowheight=26)
+            style.configure('Treeview', rowheight=ROW_HEIGHT)
             style.configure('Action.TButton', padding=6)
             style.map('Action.TButton', foreground=[('active', '!disabled', 'white')])
         except Exception:
@@ -144,7 +410,7 @@ class WatchlistGUI:
         ttk.Entry(op_frame, textvariable=self.ticker_var, width=8).grid(row=0, column=3, padx=6)
         ttk.Button(op_frame, text="Add", command=self.add_ticker, style='Action.TButton').grid(row=0, column=4)
         ttk.Button(op_frame, text="Remove", command=self.remove_selected, style='Action.TButton').grid(row=0, column=5, padx=(6,0))
-        ttk.Button(op_frame, text="Refresh", command=lambda: threading.Thread(target=self.fetch_watchlist_background, daemon=True).start(), style='Action.TButton').grid(row=0, column=6, padx=(8,0))
+        ttk.Button(op_frame, text="Refresh", command=self.fetch_watchlist, style='Action.TButton').grid(row=0, column=6, padx=(8,0))
 
         # Tree with columns: id, ticker, price, updated, raw, action
         cols = ("id", "ticker", "price", "updated", "raw", "action")
@@ -189,6 +455,13 @@ class WatchlistGUI:
 
         self.items = {}  # map ticker -> item id
         self.items_meta = {}  # map ticker -> (item id, entry_id)
+        self._entries = {}  # map ticker -> watchlist entry last applied to its row
+        self._tags = {}  # map item id -> stripe tag
+        self._fetching = None  # watchlist request in flight
+        self._backfilled = 0  # websocket connects already backfilled
+        self._health = None  # connection status last shown
+        if self.virtual:
+            self._init_virtual(vsb)
 
         # bind click to handle inline action column
         self.tree.bind("<Button-1>", self.on_tree_click)
@@ -206,7 +479,7 @@ class WatchlistGUI:
                     try:
                         # allow population immediately when a token is present
                         self.allow_populate = True
-                        threading.Thread(target=self.fetch_watchlist_background, daemon=True).start()
+                        self.fetch_watchlist()
                     except Exception:
                         pass
         except Exception:
@@ -218,27 +491,29 @@ class WatchlistGUI:
         # status bar
         self.status_var = tk.StringVar(value='Disconnected')
         self.heartbeat_var = tk.StringVar(value='last hb: -')
+        self.backlog_var = tk.StringVar(value='')
         status_frame = ttk.Frame(root)
         status_frame.grid(row=2, column=0, sticky='ew')
         ttk.Label(status_frame, textvariable=self.status_var).pack(side='left', padx=6, pady=4)
         ttk.Label(status_frame, textvariable=self.heartbeat_var).pack(side='right', padx=6, pady=4)
+        ttk.Label(status_frame, textvariable=self.backlog_var).pack(side='right', padx=6, pady=4)
         # kick off an initial watchlist fetch in background so the UI can populate
         try:
-            threading.Thread(target=self.fetch_watchlist_background, daemon=True).start()
+            self.fetch_watchlist()
         except Exception:
             pass
-        # population flag (fetch_watchlist_background will set allow_populate=True when successful)
+        # population flag (fetch_watchlist will set allow_populate=True when successful)
         self.allow_populate = False
 
     def on_app_close(self):
         # silent logout on application exit (no confirm)
-        token = self.token_var.get().strip()
-        if token:
+        headers = self._auth_headers()
+        if headers:
             try:
-                headers = { 'Authorization': f'Bearer {token}' }
-                requests.post(f"{API_BASE}/auth/logout", headers=headers, timeout=3)
+                backend.submit(lambda: http.post(f"{API_BASE}/auth/logout", headers=headers, timeout=3)).result(timeout=3)
             except Exception:
                 pass
+        backend.close()
         try:
             if os.path.exists('token.txt'):
                 os.remove('token.txt')
@@ -249,6 +524,10 @@ class WatchlistGUI:
         except Exception:
             pass
 
+    def _auth_headers(self):
+        token = self.token_var.get().strip()
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
     def update_auth_ui(self):
         # if token present, show logout and hide login/register
         if self.user_initiated_login:
@@ -289,23 +568,28 @@ class WatchlistGUI:
                     return
         except Exception:
             pass
-        headers = {}
-        token = self.token_var.get().strip()
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
-        try:
-            r = requests.post(f"{API_BASE}/watchlist", params={"ticker": ticker}, headers=headers, timeout=5)
-            if r.status_code == 200:
-                print("Added", ticker)
-                # refresh watchlist entries from server to ensure UI reflects server state
-                try:
-                    threading.Thread(target=self.fetch_watchlist_background, daemon=True).start()
-                except Exception:
-                    pass
+        headers = self._auth_headers()
+        return backend.submit(lambda: http.post(f"{API_BASE}/watchlist", params={"ticker": ticker}, headers=headers, timeout=5),
+                              lambda r: self._ticker_added(ticker, r))
+
+    def _ticker_added(self, ticker, r):
+        if isinstance(r, Exception):
+            print("Add request error:", r)
+        elif r.status_code == 200:
+            print("Added", ticker)
+            # the backend returns the saved entry; newest entries are listed first
+            try:
+                entry = r.json()
+            except Exception:
+                entry = None
+            if isinstance(entry, dict) and entry.get('ticker'):
+                self._upsert_row(entry['ticker'].upper(), entry, 0)
+                self._restripe()
             else:
-                print("Add failed:", r.status_code, r.text)
-        except Exception as e:
-            print("Add request error:", e)
+                # refresh watchlist entries from server to ensure UI reflects server state
+                self.fetch_watchlist()
+        else:
+            print("Add failed:", r.status_code, r.text)
 
     def remove_selected(self):
         sel = self.tree.selection()
@@ -316,70 +600,50 @@ class WatchlistGUI:
         values = self.tree.item(iid, "values")
         entry_id = values[0]
         ticker = values[1]
-        headers = {}
-        token = self.token_var.get().strip()
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
-        try:
-            # Prefer removal by id using POST /watchlist/remove to avoid DELETE issues
-            if entry_id:
-                r = requests.post(f"{API_BASE}/watchlist/remove", params={"id": entry_id}, headers=headers, timeout=5)
-            else:
-                r = requests.post(f"{API_BASE}/watchlist/remove", params={"ticker": ticker}, headers=headers, timeout=5)
-            if r.status_code == 200:
-                try:
-                    self.tree.delete(iid)
-                except Exception:
-                    pass
-                # remove from mapping
-                if ticker in self.items:
-                    del self.items[ticker]
-            else:
-                print("Remove failed:", r.status_code, r.text)
-        except Exception as e:
-            print("Remove request error:", e)
+        headers = self._auth_headers()
+        # Prefer removal by id using POST /watchlist/remove to avoid DELETE issues
+        params = {"id": entry_id} if entry_id else {"ticker": ticker}
+        return backend.submit(lambda: http.post(f"{API_BASE}/watchlist/remove", params=params, headers=headers, timeout=5),
+                              lambda r: self._ticker_removed(ticker, iid, r))
+
+    def _ticker_removed(self, ticker, iid, r):
+        if isinstance(r, Exception):
+            print("Remove request error:", r)
+        elif r.status_code == 200:
+            # remove from tree and mapping
+            self._forget_row(ticker, iid)
+            self._restripe()
+        else:
+            print("Remove failed:", r.status_code, r.text)
 
     def register(self):
-        user = self.user_var.get().strip()
-        pwd = self.pass_var.get().strip()
-        if not user or not pwd:
-            print("username and password required")
-            return
-        try:
-            r = requests.post(f"{API_BASE}/auth/register", json={"username": user, "password": pwd}, timeout=5)
-            if r.ok:
-                token = r.json().get("token")
-                if token:
-                    self.set_token(token, via_ui=True)
-                    self.update_auth_ui()
-                    print("Registered and logged in")
-                else:
-                    print("Register succeeded but no token returned")
-            else:
-                print("Register failed:", r.status_code, r.text)
-        except Exception as e:
-            print("Register error:", e)
+        return self._authenticate('register', "Register", "Registered and logged in")
 
     def login(self):
+        return self._authenticate('login', "Login", "Logged in")
+
+    def _authenticate(self, action, what, done_msg):
         user = self.user_var.get().strip()
         pwd = self.pass_var.get().strip()
         if not user or not pwd:
             print("username and password required")
             return
-        try:
-            r = requests.post(f"{API_BASE}/auth/login", json={"username": user, "password": pwd}, timeout=5)
-            if r.ok:
-                token = r.json().get("token")
-                if token:
-                    self.set_token(token, via_ui=True)
-                    self.update_auth_ui()
-                    print("Logged in")
-                else:
-                    print("Login succeeded but no token returned")
+        return backend.submit(lambda: http.post(f"{API_BASE}/auth/{action}", json={"username": user, "password": pwd}, timeout=5),
+                              lambda r: self._authenticated(r, what, done_msg))
+
+    def _authenticated(self, r, what, done_msg):
+        if isinstance(r, Exception):
+            print(f"{what} error:", r)
+        elif r.ok:
+            token = r.json().get("token")
+            if token:
+                self.set_token(token, via_ui=True)
+                self.update_auth_ui()
+                print(done_msg)
             else:
-                print("Login failed:", r.status_code, r.text)
-        except Exception as e:
-            print("Login error:", e)
+                print(f"{what} succeeded but no token returned")
+        else:
+            print(f"{what} failed:", r.status_code, r.text)
 
     def set_token(self, token):
         # legacy single-arg kept for compatibility
@@ -398,7 +662,7 @@ class WatchlistGUI:
             # allow population when user logs in via UI
             try:
                 self.allow_populate = True
-                threading.Thread(target=self.fetch_watchlist_background, daemon=True).start()
+                self.fetch_watchlist()
             except Exception:
                 pass
         try:
@@ -421,35 +685,47 @@ class WatchlistGUI:
             win.title('Details')
             win.geometry('600x400')
             txt = tk.Text(win, wrap='word')
-            txt.insert('1.0', raw)
+            txt.insert('1.0', raw or 'Loading...')
             txt.config(state='disabled')
             txt.pack(fill='both', expand=True)
-            return
         except Exception:
             return
+        if not raw:
+            # the virtual view keeps no raw JSON; ask the backend for the ticker
+            headers = self._auth_headers()
+            backend.submit(lambda: self._get_details(values[1], headers), lambda text: self._show_details(txt, text))
+
+    @staticmethod
+    def _get_details(ticker, headers):
         try:
-            with open('token.txt', 'w') as f:
-                f.write(token)
+            r = http.get(f"{API_BASE}/stock", params={'ticker': ticker}, headers=headers, timeout=5)
+            if r.ok:
+                return json.dumps(r.json(), indent=2)
+            return f'details fetch failed: {r.status_code}'
+        except Exception as e:
+            return f'details fetch error: {e}'
+
+    def _show_details(self, txt, text):
+        try:
+            txt.config(state='normal')
+            txt.delete('1.0', tk.END)
+            txt.insert('1.0', text)
+            txt.config(state='disabled')
         except Exception:
-            pass
+            pass  # dialog already closed
 
     def logout(self):
         # confirm logout
         if not messagebox.askyesno("Logout", "Are you sure you want to logout?"):
             return
-        token = self.token_var.get().strip()
-        if token:
-            try:
-                headers = {"Authorization": f"Bearer {token}"}
-                requests.post(f"{API_BASE}/auth/logout", headers=headers, timeout=5)
-            except Exception:
-                pass
+        headers = self._auth_headers()
+        if headers:
+            backend.submit(lambda: http.post(f"{API_BASE}/auth/logout", headers=headers, timeout=5))
         # clear token and delete token file locally
         self.token_var.set('')
         # mark as not logged in via UI
         self.user_initiated_login = False
         try:
-            import os
             if os.path.exists('token.txt'):
                 os.remove('token.txt')
         except Exception:
@@ -457,78 +733,66 @@ class WatchlistGUI:
         self.update_auth_ui()
 
     def poll_queue(self):
+        # finish backend calls that completed since the last frame
+        backend.deliver()
+        health = ws_health.describe()
+        if health != self._health:
+            self._health = health
+            self.status_var.set(health)
         # ignore websocket messages until population is allowed
         if not getattr(self, 'allow_populate', False):
-            while not q.empty():
-                try:
-                    q.get()
-                except Exception:
-                    break
-            self.root.after(200, self.poll_queue)
+            q.clear()
+            self.root.after(UI_FRAME_MS, self.poll_queue)
             return
 
-        while not q.empty():
-            data = q.get()
-            updates = data if isinstance(data, list) else [data]
-            for u in updates:
-                ticker = u.get("ticker")
-                price = u.get("price")
-                ts = u.get("timestamp") or u.get("fetchedAt")
-                tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000)) if ts else ''
-                entry_id = u.get("id") or ''
-                raw = json.dumps(u)
-                if ticker in self.items:
-                    iid = self.items[ticker]
-                    self.tree.item(iid, values=(entry_id, ticker, price, tstr, raw, "Remove"))
-                    self.items_meta[ticker] = (iid, entry_id)
+        deadline = time.perf_counter() + UI_FRAME_BUDGET_MS / 1000.0
+        applied = 0
+        while True:
+            batch = q.take(32)
+            if not batch:
+                break
+            for ticker, (values, ts) in batch:
+                if self.virtual:
+                    self.model.set(ticker, values[2], ts, values[0])
+                    continue
+                meta = self.items_meta.get(ticker)
+                if meta is not None:
+                    iid = meta[0]
+                    self.tree.item(iid, values=values)
                 else:
-                    # alternate row tag
-                    idx = len(self.tree.get_children())
-                    tag = 'even' if (idx % 2 == 0) else 'odd'
-                    iid = self.tree.insert('', tk.END, values=(entry_id, ticker, price, tstr, raw, "Remove"), tags=(tag,))
+                    # alternate row tag; new rows go at the end
+                    tag = 'odd' if len(self._tags) & 1 else 'even'
+                    iid = self.tree.insert('', tk.END, values=values, tags=(tag,))
+                    self._tags[iid] = tag
                     self.items[ticker] = iid
-                    self.items_meta[ticker] = (iid, entry_id)
-                # update heartbeat status if present
-                try:
-                    if 'fetchedAt' in u or 'timestamp' in u:
-                        ts = u.get('timestamp') or u.get('fetchedAt')
-                        if ts:
-                            tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000))
-                            self.heartbeat_var.set(f'last hb: {tstr}')
-                            self.status_var.set('Connected')
-                except Exception:
-                    pass
-        self.root.after(200, self.poll_queue)
-    def remove_ticker_inline(self, ticker, entry_id):
-        headers = {}
-        token = self.token_var.get().strip()
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
+                self.items_meta[ticker] = (iid, values[0])
+            applied += len(batch)
+            if time.perf_counter() >= deadline:
+                break
+        if applied and self.virtual:
+            self._render()
+        # update heartbeat and backlog once per frame
         try:
-            # Prefer removal by id; fallback to POST /watchlist/remove
-            if entry_id:
-                r = requests.post(f"{API_BASE}/watchlist/remove", params={"id": entry_id}, headers=headers, timeout=5)
-            else:
-                r = requests.post(f"{API_BASE}/watchlist/remove", params={"ticker": ticker.upper() if ticker else ''}, headers=headers, timeout=5)
-            if r.status_code == 200:
-                # remove from tree and meta
-                if ticker in self.items_meta:
-                    iid, _ = self.items_meta.pop(ticker)
-                    if ticker in self.items:
-                        del self.items[ticker]
-                    try:
-                        self.tree.delete(iid)
-                    except Exception:
-                        pass
-                # refresh from server in background in case server canonicalized items
-                try:
-                    threading.Thread(target=self.fetch_watchlist_background, daemon=True).start()
-                except Exception:
-                    pass
-            else:
-                print("Remove failed:", r.status_code, r.text)
-        except Exception as e:
-            print("Remove request error:", e)
+            if applied and q.last_ts:
+                tstr = time.strftime('%H:%M:%S', time.localtime(q.last_ts/1000))
+                self.heartbeat_var.set(f'last hb: {tstr}')
+            if ws_health.connects != self._backfilled:
+                # (re)connected: catch up on prices missed while disconnected
+                self._backfilled = ws_health.connects
+                self.backfill_prices()
+            backlog = f'backlog {len(q)}, dropped {q.dropped}' if q.dropped or len(q) else ''
+            if self.backlog_var.get() != backlog:
+                self.backlog_var.set(backlog)
+        except Exception:
+            pass
+        self.root.after(UI_FRAME_MS, self.poll_queue)
+
+    def remove_ticker_inline(self, ticker, entry_id):
+        headers = self._auth_headers()
+        # Prefer removal by id; fallback to POST /watchlist/remove
+        params = {"id": entry_id} if entry_id else {"ticker": ticker.upper() if ticker else ''}
+        return backend.submit(lambda: http.post(f"{API_BASE}/watchlist/remove", params=params, headers=headers, timeout=5),
+                              lambda r: self._ticker_removed(ticker, None, r))
 
     def on_tree_click(self, event):
         # identify column and row; if action column clicked, perform remove
@@ -541,8 +805,11 @@ class WatchlistGUI:
             idx = int(col.replace('#','')) - 1
         except Exception:
             return
-        # action column is last column
-        action_index = len(self.tree['columns']) - 1
+        # action column is last displayed column
+        display = self.tree['displaycolumns']
+        if not display or display[0] == '#all':
+            display = self.tree['columns']
+        action_index = len(display) - 1
         if idx == action_index:
             values = self.tree.item(row, 'values')
             if not values:
@@ -552,105 +819,290 @@ class WatchlistGUI:
             # call remove handler
             self.remove_ticker_inline(ticker, entry_id)
 
-    def fetch_watchlist_background(self):
+    def fetch_watchlist(self):
+        # a refresh already in flight will bring the same list
+        if self._fetching is not None and not self._fetching.done():
+            return self._fetching
+        headers = self._auth_headers()
+        self._fetching = backend.submit(lambda: self._get_watchlist(headers), self._watchlist_fetched)
+        return self._fetching
+
+    @staticmethod
+    def _get_watchlist(headers):
+        # runs on a worker; the body is parsed there too
+        r = http.get(f"{API_BASE}/watchlist", headers=headers or None, timeout=5)
+        return r, (r.json() if r.ok else None)
+
+    def _watchlist_fetched(self, result):
+        if isinstance(result, Exception):
+            self.status_var.set('watchlist fetch error')
+            return
+        r, data = result
+        if r.ok:
+            # allow population when we successfully fetch from backend
+            self.allow_populate = True
+            self._apply_watchlist(data)
+        else:
+            # show status message for user
+            self.status_var.set(f'watchlist fetch failed: {r.status_code}')
+
+    def backfill_prices(self):
+        # latest prices for the whole watchlist in one request; they go
+        # through the tick buffer, so newer live ticks still win
+        headers = self._auth_headers()
+        return backend.submit(lambda: self._get_prices(headers), self._prices_fetched)
+
+    @staticmethod
+    def _get_prices(headers):
+        r = http.get(f"{API_BASE}/watchlist/prices", headers=headers or None, timeout=10)
+        if not r.ok:
+            return f'price backfill failed: {r.status_code}'
+        q.put(r.json())
+
+    def _prices_fetched(self, result):
+        if isinstance(result, Exception):
+            print("price backfill error:", result)
+        elif result:
+            print(result)
+
+    def _apply_watchlist(self, data):
+        # reconcile the tree with the server list by ticker: only rows whose
+        # entry changed are touched, so selection and scroll position survive
         try:
-            headers = {}
-            token = self.token_var.get().strip()
-            if token:
-                headers['Authorization'] = f'Bearer {token}'
-            r = requests.get(f"{API_BASE}/watchlist", headers=headers or None, timeout=5)
-            if r.ok:
-                # allow population when we successfully fetch from backend
-                try:
-                    self.allow_populate = True
-                except Exception:
-                    pass
-                data = r.json()
-                # schedule GUI update on main thread
-                try:
-                    self.root.after(0, self._apply_watchlist, data)
-                except Exception:
-                    pass
-            else:
-                # show status message for user (do on main thread)
-                try:
-                    msg = f'watchlist fetch failed: {r.status_code}'
-                    self.root.after(0, lambda: self.status_var.set(msg))
-                except Exception:
-                    pass
+            wanted = {}
+            for u in _watchlist_entries(data):
+                if not isinstance(u, dict):
+                    continue
+                ticker = (u.get('ticker') or u.get('Ticker') or u.get('symbol') or '').upper()
+                wanted.setdefault(ticker, u)
+            if self.virtual:
+                self.model.replace((t, u.get('price') or u.get('lastPrice'),
+                                    u.get('timestamp') or u.get('fetchedAt') or u.get('addedAt'),
+                                    u.get('id') or u.get('entryId')) for t, u in wanted.items())
+                self._render()
+                return
+
+            children = self.tree.get_children()
+            top = None
+            if children:
+                # remember the row at the top of the view to scroll back to it
+                first = int(self.tree.yview()[0] * len(children) + 0.5)
+                top = children[min(first, len(children) - 1)]
+
+            gone = [t for t in self.items_meta if t not in wanted]
+            for ticker in gone:
+                self._forget_row(ticker)
+            changed = bool(gone)
+            # rows 0..i-1 already follow the server order, so index i is right for inserts
+            order = list(self.tree.get_children()) if gone else list(children)
+            for i, (ticker, u) in enumerate(wanted.items()):
+                if ticker not in self.items_meta:
+                    order.insert(i, self._upsert_row(ticker, u, i))
+                    changed = True
+                    continue
+                if self._entries.get(ticker) != u:
+                    self._upsert_row(ticker, u)
+                iid = self.items_meta[ticker][0]
+                if order[i] != iid:
+                    # the server order changed (or a tick appended this row): move it into place
+                    self.tree.move(iid, '', i)
+                    order.remove(iid)
+                    order.insert(i, iid)
+                    changed = True
+            if changed:
+                children = self._restripe()
+                if top is not None and self.tree.exists(top):
+                    self.tree.yview_moveto(children.index(top) / len(children))
         except Exception:
+            pass
+
+    def _upsert_row(self, ticker, u, index=None):
+        # insert (at index) or update the row for one watchlist entry
+        price = u.get('price') or u.get('lastPrice')
+        ts = u.get('timestamp') or u.get('fetchedAt') or u.get('addedAt')
+        if self.virtual:
+            return self.model.set(ticker, price, ts, u.get('id') or u.get('entryId'), index)
+        tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000)) if ts else ''
+        entry_id = u.get('id') or u.get('entryId') or ''
+        values = (entry_id, ticker, price, tstr, json.dumps(u), "Remove")
+        meta = self.items_meta.get(ticker)
+        if meta is not None:
+            iid = meta[0]
+            self.tree.item(iid, values=values)
+        else:
+            iid = self.tree.insert('', tk.END if index is None else index, values=values)
+            if ticker:
+                self.items[ticker] = iid
+        self.items_meta[ticker] = (iid, entry_id)
+        self._entries[ticker] = u
+        return iid
+
+    def _forget_row(self, ticker, iid=None):
+        # drop a row from the tree and every ticker map
+        if self.virtual:
+            self.model.remove(ticker)
+            return
+        meta = self.items_meta.pop(ticker, None)
+        if iid is None and meta is not None:
+            iid = meta[0]
+        self.items.pop(ticker, None)
+        self._entries.pop(ticker, None)
+        if iid is not None:
+            self._tags.pop(iid, None)
             try:
-                self.root.after(0, lambda: self.status_var.set('watchlist fetch error'))
+                self.tree.delete(iid)
             except Exception:
                 pass
 
-    def _apply_watchlist(self, data):
+    def _restripe(self):
+        # alternate row colors by position; only rows whose parity changed are retagged
+        if self.virtual:
+            self._render()
+            return self._slots
+        children = self.tree.get_children()
+        tags = self._tags
+        for idx, iid in enumerate(children):
+            tag = 'odd' if idx & 1 else 'even'
+            if tags.get(iid) != tag:
+                self.tree.item(iid, tags=(tag,))
+                tags[iid] = tag
+        return children
+
+
+    # virtual view: a fixed set of tree items ("slots") is reused for the
+    # rows currently in view and the scrollbar drives self._top
+
+    def _init_virtual(self, vsb):
+        self.model = WatchlistModel()
+        # ticker -> model row; used like items is in the regular view
+        self.items = self.model.index
+        self._top = 0  # model row shown in the first slot
+        self._slots = []
+        self._attached = 0  # slots[:_attached] are in the tree
+        self._shown = {}  # slot -> (values, tag) it displays
+        self._selected = None  # ticker selected in the view
+        self._vsb = vsb
+        self.tree['displaycolumns'] = ("id", "ticker", "price", "updated", "action")
+        self.tree.configure(yscrollcommand='')
+        vsb.configure(command=self._vscroll)
+        self.tree.bind('<Configure>', lambda e: self._render())
+        self.tree.bind('<<TreeviewSelect>>', self._on_virtual_select)
+        for seq in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(seq, self._on_wheel)
+
+    def _visible_rows(self):
+        height = self.tree.winfo_height()
+        if height <= ROW_HEIGHT:
+            return 30  # not mapped yet
+        return max(1, height // ROW_HEIGHT - 1)  # minus the heading
+
+    def _render(self):
+        n = len(self.model)
+        visible = self._visible_rows()
+        self._top = max(0, min(self._top, n - visible))
+        count = min(visible, n - self._top)
+        while len(self._slots) < count:
+            self._slots.append(self.tree.insert('', tk.END))
+            self._attached += 1
+        for k in range(count, self._attached):
+            self.tree.detach(self._slots[k])
+        for k in range(self._attached, count):
+            self.tree.move(self._slots[k], '', k)
+        self._attached = count
+        selected = ()
+        for k in range(count):
+            iid = self._slots[k]
+            i = self._top + k
+            shown = (self.model.values(i), 'odd' if i & 1 else 'even')
+            if self._shown.get(iid) != shown:
+                self.tree.item(iid, values=shown[0], tags=(shown[1],))
+                self._shown[iid] = shown
+            if shown[0][1] == self._selected:
+                selected = (iid,)
+        # the selection follows the ticker, not the slot
+        if self.tree.selection() != selected:
+            if selected:
+                self.tree.selection_set(selected)
+            else:
+                self.tree.selection_remove(self.tree.selection())
+        if n:
+            self._vsb.set(self._top / n, (self._top + count) / n)
+        else:
+            self._vsb.set(0, 1)
+
+    def _vscroll(self, *args):
+        # scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')
         try:
-            # normalize various backend shapes to a list of entries
-            entries = []
-            if isinstance(data, list):
-                entries = data
-            elif isinstance(data, dict):
-                # common HAL-style embedding used by the backend
-                if '_embedded' in data and isinstance(data['_embedded'], dict):
-                    # pick the first list found in _embedded
-                    for v in data['_embedded'].values():
-                        if isinstance(v, list):
-                            entries = v
-                            break
-                elif 'items' in data and isinstance(data['items'], list):
-                    entries = data['items']
-                elif 'watchlist' in data and isinstance(data['watchlist'], list):
-                    entries = data['watchlist']
-                else:
-                    # fall back to attempting to find any list value
-                    for v in data.values():
-                        if isinstance(v, list):
-                            entries = v
-                            break
+            if args[0] == 'moveto':
+                self._top = int(float(args[1]) * len(self.model))
+            elif args[0] == 'scroll':
+                step = int(args[1])
+                if args[2] == 'pages':
+                    step *= max(1, self._attached - 1)
+                self._top += step
+        except (IndexError, ValueError):
+            return
+        self._render()
 
-            if entries is None:
-                entries = []
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0:
+            self._vscroll('scroll', -3, 'units')
+        else:
+            self._vscroll('scroll', 3, 'units')
+        return 'break'
 
-            # clear current tree
-            for iid in list(self.tree.get_children()):
-                try:
-                    self.tree.delete(iid)
-                except Exception:
-                    pass
-            self.items.clear()
-            self.items_meta.clear()
+    def _on_virtual_select(self, event):
+        sel = self.tree.selection()
+        if sel and sel[0] in self._shown:
+            self._selected = self._shown[sel[0]][0][1]
 
-            for u in entries:
-                # normalize fields from backend
-                ticker = (u.get('ticker') or u.get('Ticker') or u.get('symbol') or '').upper()
-                price = u.get('price') or u.get('lastPrice')
-                ts = u.get('timestamp') or u.get('fetchedAt') or u.get('addedAt')
-                tstr = time.strftime('%H:%M:%S', time.localtime(ts/1000)) if ts else ''
-                entry_id = u.get('id') or u.get('entryId') or ''
-                raw = json.dumps(u)
-                iid = self.tree.insert('', tk.END, values=(entry_id, ticker, price, tstr, raw, "Remove"))
-                # apply alternating row tag
-                try:
-                    idx = len(self.tree.get_children()) - 1
-                    tag = 'even' if (idx % 2 == 0) else 'odd'
-                    self.tree.item(iid, tags=(tag,))
-                except Exception:
-                    pass
-                if ticker:
-                    self.items[ticker] = iid
-                self.items_meta[ticker] = (iid, entry_id)
-        except Exception:
-            pass
 
+def _watchlist_entries(data):
+    # normalize various backend shapes to a list of entries
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        # common HAL-style embedding used by the backend
+        if '_embedded' in data and isinstance(data['_embedded'], dict):
+            # pick the first list found in _embedded
+            for v in data['_embedded'].values():
+                if isinstance(v, list):
+                    return v
+        elif 'items' in data and isinstance(data['items'], list):
+            return data['items']
+        elif 'watchlist' in data and isinstance(data['watchlist'], list):
+            return data['watchlist']
+        else:
+            # fall back to attempting to find any list value
+            for v in data.values():
+                if isinstance(v, list):
+                    return v
+    return []
 
 def start_ws():
-    ws = websocket.WebSocketApp(WS_URL,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    ws.run_forever()
+    # keep reconnecting; pings detect connections that died silently
+    while True:
+        ws_health.state = 'connecting'
+        ws = websocket.WebSocketApp(WS_URL,
+                                    on_open=on_open,
+                                    on_message=on_message,
+                                    on_error=on_error,
+                                    on_close=on_close)
+        try:
+            ws.run_forever(ping_interval=WS_PING_INTERVAL, ping_timeout=WS_PING_INTERVAL / 2)
+        except Exception as e:
+            print("WebSocket error:", e)
+            ws_health.error = str(e)
+        # a connection that stayed up for a while starts the backoff over
+        opened = ws_health.opened_at
+        if opened is not None and time.monotonic() - opened >= WS_RETRY_MAX:
+            ws_health.attempt = 0
+        delay = _retry_delay(ws_health.attempt)
+        ws_health.attempt += 1
+        ws_health.opened_at = None
+        ws_health.retry_at = time.monotonic() + delay
+        ws_health.state = 'waiting'
+        time.sleep(delay)
 
 
 if __name__ == '__main__':
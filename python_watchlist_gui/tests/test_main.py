@@ -24,19 +24,23 @@ def test_add_ticker_calls_post(tk_root, tmp_path):
     g.ticker_var.set('can')
     g.token_var.set('secrettoken')
 
-    with mock.patch('python_watchlist_gui.main.requests.post') as mock_post:
+    with mock.patch('python_watchlist_gui.main.http.post') as mock_post:
         mock_resp = mock.Mock()
         mock_resp.status_code = 200
         mock_resp.text = 'ok'
+        mock_resp.json.return_value = {'id': 5, 'ticker': 'CAN', 'addedAt': 1000}
         mock_post.return_value = mock_resp
 
-        g.add_ticker()
+        # the request runs on a backend worker; its result is applied on the Tk thread
+        g.add_ticker().result(timeout=5)
+        gui_module.backend.deliver()
 
         mock_post.assert_called_once()
         args, kwargs = mock_post.call_args
         assert args[0].endswith('/watchlist')
         assert kwargs['params'] == {'ticker': 'can'}
         assert kwargs['headers']['Authorization'] == 'Bearer secrettoken'
+        assert 'CAN' in g.items
 
 
 def test_remove_selected_by_id_calls_post_and_removes_row(tk_root):
@@ -48,13 +52,14 @@ def test_remove_selected_by_id_calls_post_and_removes_row(tk_root):
     g.tree.selection_set(iid)
     g.token_var.set('t')
 
-    with mock.patch('python_watchlist_gui.main.requests.post') as mock_post:
+    with mock.patch('python_watchlist_gui.main.http.post') as mock_post:
         mock_resp = mock.Mock()
         mock_resp.status_code = 200
         mock_resp.text = 'ok'
         mock_post.return_value = mock_resp
 
-        g.remove_selected()
+        g.remove_selected().result(timeout=5)
+        gui_module.backend.deliver()
 
         mock_post.assert_called_once()
         args, kwargs = mock_post.call_args
@@ -68,14 +73,14 @@ def test_remove_ticker_inline_falls_back_to_ticker(tk_root):
     g = gui_module.WatchlistGUI(tk_root)
     g.token_var.set('tok')
 
-    with mock.patch('python_watchlist_gui.main.requests.post') as mock_post:
+    with mock.patch('python_watchlist_gui.main.http.post') as mock_post:
         mock_resp = mock.Mock()
         mock_resp.status_code = 200
         mock_resp.text = 'ok'
         mock_post.return_value = mock_resp
 
         # no id provided, should call with ticker param uppercased
-        g.remove_ticker_inline('can', '')
+        g.remove_ticker_inline('can', '').result(timeout=5)
 
         mock_post.assert_called_once()
         args, kwargs = mock_post.call_args
@@ -95,3 +100,120 @@ def test_poll_queue_updates_tree(tk_root):
     iid = g.items['XYZ']
     vals = g.tree.item(iid, 'values')
     assert vals[1] == 'XYZ'
+
+
+def test_apply_watchlist_reconciles_rows_in_place(tk_root):
+    g = gui_module.WatchlistGUI(tk_root)
+    entries = [{'id': 1, 'ticker': 'aaa', 'addedAt': 1000},
+               {'id': 2, 'ticker': 'bbb', 'addedAt': 2000},
+               {'id': 3, 'ticker': 'ccc', 'addedAt': 3000}]
+    g._apply_watchlist({'_embedded': {'entries': entries}})
+    kept = g.items['BBB']
+    g.tree.selection_set(kept)
+
+    # drop AAA, change CCC, add DDD at the front
+    g._apply_watchlist([{'id': 4, 'ticker': 'ddd', 'addedAt': 4000},
+                        entries[1],
+                        {'id': 3, 'ticker': 'ccc', 'price': 7.5, 'addedAt': 3000}])
+
+    assert 'AAA' not in g.items and 'AAA' not in g.items_meta
+    # untouched row keeps its item and the selection
+    assert g.items['BBB'] == kept
+    assert g.tree.selection() == (kept,)
+    children = g.tree.get_children()
+    assert [g.tree.item(i, 'values')[1] for i in children] == ['DDD', 'BBB', 'CCC']
+    assert str(g.tree.item(g.items['CCC'], 'values')[2]) == '7.5'
+    assert [g.tree.item(i, 'tags')[0] for i in children] == ['even', 'odd', 'even']
+
+
+def test_apply_watchlist_follows_server_order(tk_root):
+    g = gui_module.WatchlistGUI(tk_root)
+    entries = [{'id': 1, 'ticker': 'aaa', 'addedAt': 1000},
+               {'id': 2, 'ticker': 'bbb', 'addedAt': 2000}]
+    g._apply_watchlist(entries)
+    # a tick appended ZZZ before the server listed it
+    g._upsert_row('ZZZ', {'ticker': 'ZZZ', 'price': 1.0})
+    kept = g.items['AAA']
+
+    g._apply_watchlist([{'id': 9, 'ticker': 'zzz', 'addedAt': 9000},
+                        entries[1],
+                        {'id': 3, 'ticker': 'ccc', 'addedAt': 3000},
+                        entries[0]])
+
+    children = g.tree.get_children()
+    assert [g.tree.item(i, 'values')[1] for i in children] == ['ZZZ', 'BBB', 'CCC', 'AAA']
+    # moved, not recreated
+    assert g.items['AAA'] == kept
+    assert [g.tree.item(i, 'tags')[0] for i in children] == ['even', 'odd', 'even', 'odd']
+
+
+def test_poll_queue_coalesces_ticks_per_ticker(tk_root):
+    g = gui_module.WatchlistGUI(tk_root)
+    g.allow_populate = True
+    gui_module.q.clear()
+    dropped = gui_module.q.dropped
+    for i in range(5):
+        gui_module.on_message(None, json.dumps({'id': '7', 'ticker': 'ABC', 'price': i, 'timestamp': 1000 + i}))
+    gui_module.on_message(None, json.dumps([{'id': '8', 'ticker': 'DEF', 'price': 1.5, 'timestamp': 2000}]))
+
+    # one pending row per ticker, the superseded ticks are counted as dropped
+    assert len(gui_module.q) == 2
+    assert gui_module.q.dropped - dropped == 4
+
+    g.poll_queue()
+
+    assert gui_module.q.empty()
+    assert str(g.tree.item(g.items['ABC'], 'values')[2]) == '4'
+    assert 'DEF' in g.items
+    assert 'dropped' in g.backlog_var.get()
+
+
+def test_virtual_view_materializes_only_visible_rows(tk_root):
+    g = gui_module.WatchlistGUI(tk_root, virtual=True)
+    g.allow_populate = True
+    g._apply_watchlist([{'id': i + 1, 'ticker': f't{i}', 'addedAt': 1000} for i in range(1000)])
+
+    assert len(g.model) == 1000
+    children = g.tree.get_children()
+    assert 0 < len(children) < 100
+    assert g.tree.item(children[0], 'values')[1] == 'T0'
+
+    g._vscroll('moveto', 0.5)
+    children = g.tree.get_children()
+    assert g.tree.item(children[0], 'values')[1] == 'T500'
+
+    # ticks update the model and the rows in view
+    gui_module.q.clear()
+    gui_module.q.put({'id': 502, 'ticker': 'T501', 'price': 3.25, 'timestamp': 5000})
+    g.poll_queue()
+    assert g.model.prices[501] == 3.25
+    assert str(g.tree.item(children[1], 'values')[2]) == '3.25'
+    # the instance's mode decides, not GUI_VIRTUAL: no raw JSON is kept per tick
+    assert not gui_module.q.keep_raw
+
+
+def test_reconnect_updates_status_and_backfills_prices(tk_root):
+    g = gui_module.WatchlistGUI(tk_root)
+    g.allow_populate = True
+    gui_module.q.clear()
+    mock_resp = mock.Mock()
+    mock_resp.ok = True
+    mock_resp.json.return_value = [{'id': 3, 'ticker': 'BKF', 'price': 4.5, 'timestamp': 10 ** 12}]
+
+    with mock.patch('python_watchlist_gui.main.http.get') as mock_get:
+        mock_get.return_value = mock_resp
+        gui_module.on_open(None)
+        g.poll_queue()
+        assert g.status_var.get() == 'Connected'
+
+        g.backfill_prices().result(timeout=5)
+        args, kwargs = mock_get.call_args
+        assert args[0].endswith('/watchlist/prices')
+
+    g.poll_queue()
+    assert str(g.tree.item(g.items['BKF'], 'values')[2]) == '4.5'
+
+    # backoff grows with each failed attempt but stays within the bounds
+    for attempt in range(10):
+        step = min(gui_module.WS_RETRY_MAX, gui_module.WS_RETRY_MIN * 2 ** attempt)
+        assert step / 2 <= gui_module._retry_delay(attempt) <= step
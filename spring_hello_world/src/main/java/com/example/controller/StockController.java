@@ -2,8 +2,10 @@ package com.example.controller;
 
 import com.example.entity.StockEntity;
 import com.example.entity.WatchlistEntry;
+import com.example.repository.StockRepository;
 import com.example.repository.WatchlistRepository;
 import com.example.service.StockService;
+import com.example.websocket.PriceUpdate;
 import org.springframework.hateoas.CollectionModel;
 import org.springframework.hateoas.EntityModel;
 import org.springframework.hateoas.server.mvc.WebMvcLinkBuilder;
@@ -12,7 +14,10 @@ import org.springframework.transaction.annotation.Transactional;
 import org.springframework.web.bind.annotation.*;
 
 import java.time.Instant;
+import java.util.ArrayList;
 import java.util.List;
+import java.util.Map;
+import java.util.function.Function;
 import java.util.stream.Collectors;
 
 @RestController
@@ -20,11 +25,14 @@ public class StockController {
     private final StockService service;
     private final WatchlistRepository watchRepo;
     private final com.example.repository.UserRepository userRepo;
+    private final StockRepository stockRepo;
 
-    public StockController(StockService service, WatchlistRepository watchRepo, com.example.repository.UserRepository userRepo) {
+    public StockController(StockService service, WatchlistRepository watchRepo, com.example.repository.UserRepository userRepo,
+                           StockRepository stockRepo) {
         this.service = service;
         this.watchRepo = watchRepo;
         this.userRepo = userRepo;
+        this.stockRepo = stockRepo;
     }
 
     private boolean authorized(String authHeader) {
@@ -71,6 +79,28 @@ public class StockController {
         return ResponseEntity.ok(coll);
     }
 
+    // latest known price of every watchlist entry in one call, same shape as the websocket broadcast;
+    // clients use it to catch up after reconnecting instead of waiting for the next broadcast.
+    // Only cached prices are read (one query, never an external fetch), and they are stamped like the
+    // broadcaster stamps live ticks so clients that drop out-of-order updates do not discard them.
+    @GetMapping("/watchlist/prices")
+    public ResponseEntity<?> getWatchlistPrices(@RequestHeader(value = "Authorization", required = false) String auth) {
+        if (!authorized(auth)) return ResponseEntity.status(401).body("unauthorized");
+        List<WatchlistEntry> entries = watchRepo.findAllByOrderByAddedAtDesc();
+        List<String> tickers = entries.stream().map(WatchlistEntry::getTicker).distinct().collect(Collectors.toList());
+        Map<String, StockEntity> cached = stockRepo.findAllById(tickers).stream()
+            .collect(Collectors.toMap(StockEntity::getTicker, Function.identity()));
+        long now = Instant.now().toEpochMilli();
+        List<PriceUpdate> updates = new ArrayList<>();
+        for (WatchlistEntry we : entries) {
+            StockEntity s = cached.get(we.getTicker());
+            if (s != null) {
+                updates.add(new PriceUpdate(we.getId(), s.getTicker(), s.getPrice(), now));
+            }
+        }
+        return ResponseEntity.ok(updates);
+    }
+
     @DeleteMapping("/watchlist/{id}")
     public ResponseEntity<?> deleteFromWatchlistById(@PathVariable("id") Long id, @RequestHeader(value = "Authorization", required = false) String auth) {
         if (!authorized(auth)) return ResponseEntity.status(401).body("unauthorized");
@@ -3,6 +3,8 @@ package com.example;
 import com.example.controller.StockController;
 import com.example.entity.StockEntity;
 import com.example.entity.User;
+import com.example.entity.WatchlistEntry;
+import com.example.repository.StockRepository;
 import com.example.repository.UserRepository;
 import com.example.service.StockService;
 import com.example.repository.WatchlistRepository;
@@ -13,9 +15,13 @@ import org.springframework.boot.test.mock.mockito.MockBean;
 import org.springframework.http.MediaType;
 import org.springframework.test.web.servlet.MockMvc;
 
+import java.util.List;
 import java.util.Optional;
 
+import static org.hamcrest.Matchers.greaterThan;
 import static org.mockito.ArgumentMatchers.anyString;
+import static org.mockito.Mockito.never;
+import static org.mockito.Mockito.verify;
 import static org.mockito.Mockito.when;
 import static org.springframework.test.web.servlet.request.MockMvcRequestBuilders.get;
 import static org.springframework.test.web.servlet.result.MockMvcResultMatchers.jsonPath;
@@ -27,6 +33,7 @@ public class StockControllerTest {
     @MockBean StockService stockService;
     @MockBean WatchlistRepository watchRepo;
     @MockBean UserRepository userRepo;
+    @MockBean StockRepository stockRepo;
 
     @Test
     public void search_requiresAuth() throws Exception {
@@ -45,4 +52,22 @@ public class StockControllerTest {
                 .andExpect(status().isOk())
                 .andExpect(jsonPath("$.ticker").value("F"));
     }
+
+    @Test
+    public void watchlistPrices_returnsCachedPricePerEntry() throws Exception {
+        when(userRepo.findByToken("good-token")).thenReturn(Optional.of(new User("u","h","good-token")));
+        when(watchRepo.findAllByOrderByAddedAtDesc())
+                .thenReturn(List.of(new WatchlistEntry("F", 1L), new WatchlistEntry("GM", 2L)));
+        // GM has no cached price yet; it is left out rather than fetched
+        when(stockRepo.findAllById(List.of("F", "GM"))).thenReturn(List.of(new StockEntity("F", 9.99, 1234L)));
+
+        mvc.perform(get("/watchlist/prices").header("Authorization", "Bearer good-token"))
+                .andExpect(status().isOk())
+                .andExpect(jsonPath("$.length()").value(1))
+                .andExpect(jsonPath("$[0].ticker").value("F"))
+                .andExpect(jsonPath("$[0].price").value(9.99))
+                // stamped at send time like live ticks, not with the cached fetch time
+                .andExpect(jsonPath("$[0].timestamp").value(greaterThan(1234L)));
+        verify(stockService, never()).getStock(anyString());
+    }
 }
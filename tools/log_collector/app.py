@@ -1,43 +1,262 @@
 from flask import Flask, request, jsonify, Response
-from collections import deque
-import threading
-from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
+import json
+import os
+import time
+from collections import Counter as Tally
+from prometheus_client import Counter, Gauge, generate_latest, CONTENT_TYPE_LATEST
+
+from ingest import LINES_TYPE, Acks, BatchError, read_body, read_lines
+from livetail import LiveTail
+from logstore import LogStore
+from parsing import Pipeline
+from rules import RuleSet
 
 app = Flask(__name__)
-# store last 2000 lines per app
-storage = {}
-lock = threading.Lock()
+# sealed segment files go here, one directory per app ('' keeps logs in memory only)
+LOG_DATA_DIR = os.environ.get('LOG_DATA_DIR', './data/logs')
+# lines kept in memory per app (the hot tail when LOG_DATA_DIR is set) and lines per segment
+LOG_MAX_LINES = int(os.environ.get('LOG_MAX_LINES', '50000'))
+LOG_SEGMENT_LINES = int(os.environ.get('LOG_SEGMENT_LINES', '1000'))
+# lines per compressed block inside a segment file
+LOG_BLOCK_LINES = int(os.environ.get('LOG_BLOCK_LINES', '256'))
+# disk retention per app (0 disables either limit) and how often it is checked
+LOG_RETENTION_MB = float(os.environ.get('LOG_RETENTION_MB', '512'))
+LOG_RETENTION_HOURS = float(os.environ.get('LOG_RETENTION_HOURS', '72'))
+LOG_RETENTION_INTERVAL = int(os.environ.get('LOG_RETENTION_INTERVAL', '60'))
+# default and maximum number of lines /logs returns per app
+LOG_QUERY_LIMIT = int(os.environ.get('LOG_QUERY_LIMIT', '200'))
+LOG_QUERY_MAX_LIMIT = int(os.environ.get('LOG_QUERY_MAX_LIMIT', '5000'))
+# /logs/stream: lines queued per client before the oldest are dropped, open
+# stream cap (each holds a server thread) and keepalive interval in seconds
+LOG_STREAM_BUFFER = int(os.environ.get('LOG_STREAM_BUFFER', '1000'))
+LOG_STREAM_MAX_CLIENTS = int(os.environ.get('LOG_STREAM_MAX_CLIENTS', '32'))
+LOG_STREAM_KEEPALIVE = float(os.environ.get('LOG_STREAM_KEEPALIVE', '15'))
+# parser chain applied to every line at ingest ('none' to only detect levels) and an
+# optional JSON file with per-app chains and custom regex profiles (see parsing.py)
+LOG_PARSERS = os.environ.get('LOG_PARSERS')
+LOG_PARSE_CONFIG = os.environ.get('LOG_PARSE_CONFIG')
+# log-derived metric and alert rules: a JSON file path or inline JSON (see rules.py)
+LOG_RULES = os.environ.get('LOG_RULES')
+# largest decompressed batch accepted by /ingest
+LOG_INGEST_MAX_MB = float(os.environ.get('LOG_INGEST_MAX_MB', '64'))
+
+storage = LogStore(max_lines=LOG_MAX_LINES, segment_lines=LOG_SEGMENT_LINES, data_dir=LOG_DATA_DIR or None,
+                   block_lines=LOG_BLOCK_LINES, retention_bytes=int(LOG_RETENTION_MB * 1024 * 1024),
+                   retention_age=LOG_RETENTION_HOURS * 3600)
+_last_retention = time.time()
+tail = LiveTail(buffer=LOG_STREAM_BUFFER)
+acks = Acks()
+pipeline = Pipeline.from_config(LOG_PARSERS, LOG_PARSE_CONFIG)
+rules = RuleSet.from_config(LOG_RULES)
 
 # Prometheus metric: total log lines received per app
 LOG_LINES = Counter('log_lines_total', 'Total log lines received', ['app'])
+STREAM_CLIENTS = Gauge('log_stream_clients', 'Open /logs/stream connections')
+STREAM_CLIENTS.set_function(tail.count)
+STREAM_DROPPED = Counter('log_stream_dropped_lines_total', 'Lines dropped because a /logs/stream client fell behind')
+LEVEL_LINES = Counter('log_lines_by_level_total', 'Log lines received per app and level', ['app', 'level'])
+PARSED_LINES = Counter('log_parsed_lines_total', 'Log lines per app and the parser that recognised them',
+                       ['app', 'parser'])
+INGEST_BYTES = Counter('log_ingest_bytes_total', 'Request body bytes received on /ingest', ['encoding'])
+INGEST_DUPLICATES = Counter('log_ingest_duplicate_batches_total', 'Retried batches acknowledged without storing them again')
+
+
+def _read_batch():
+    # (app, sender, seq, lines); seq is None for batches without one
+    if request.mimetype == LINES_TYPE:
+        seq = request.headers.get('X-Log-Seq')
+        lines = []
+        for chunk in read_lines(request.stream, request.headers.get('Content-Encoding'),
+                                int(LOG_INGEST_MAX_MB * 1024 * 1024)):
+            lines += chunk
+        return (request.headers.get('X-Log-App') or 'unknown', request.headers.get('X-Log-Sender') or '',
+                int(seq) if seq else None, lines)
+    # original format: {"app": "name", "logs": ["line", ...]}, optionally with "sender" and "seq"
+    encoding = request.headers.get('Content-Encoding')
+    if encoding and encoding != 'identity':
+        data = json.loads(read_body(request.stream, encoding, int(LOG_INGEST_MAX_MB * 1024 * 1024)) or b'{}')
+    else:
+        data = request.get_json() or {}
+    seq = data.get('seq')
+    return data.get('app', 'unknown'), str(data.get('sender', '')), int(seq) if seq is not None else None, \
+        data.get('logs', [])
 
 
 @app.route('/ingest', methods=['POST'])
 def ingest():
-    data = request.get_json() or {}
-    appname = data.get('app', 'unknown')
-    logs = data.get('logs', [])
-    with lock:
-        dq = storage.setdefault(appname, deque(maxlen=2000))
-        for l in logs:
-            dq.append({'ts': None, 'line': l})
-        # update prometheus counter by number of lines received
-        if logs:
-            try:
-                LOG_LINES.labels(app=appname).inc(len(logs))
-            except Exception:
-                pass
-    return ('', 204)
+    """Store a batch of lines for one app.
+
+    Accepts the original JSON body or newline-delimited lines (see ingest.py),
+    gzip/zstd compressed. Batches carrying a sequence number are answered
+    with ``{"ack": seq}`` once stored; a retried batch is acknowledged again
+    without being stored twice.
+    """
+    global _last_retention
+    try:
+        appname, sender, seq, logs = _read_batch()
+    except (BatchError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        INGEST_BYTES.labels(encoding=request.headers.get('Content-Encoding', 'identity')).inc(
+            request.content_length or 0)
+    except Exception:
+        pass
+    if seq is not None and not acks.reserve(appname, sender, seq):
+        INGEST_DUPLICATES.inc()
+        return jsonify({'ack': seq, 'lines': 0, 'duplicate': True})
+    try:
+        logs = [line if isinstance(line, str) else str(line) for line in logs]
+        # parsed once here; the store and the live tail reuse level and fields
+        parsed = [pipeline.parse(appname, line) for line in logs]
+        now = time.time()
+        # the store locks per app, so sidecars of different apps ingest in parallel
+        storage.append(appname, logs, now, parsed)
+    except BaseException:
+        # nothing was acknowledged, so the sender's retry must be stored
+        if seq is not None:
+            acks.release(appname, sender)
+        raise
+    if seq is not None:
+        acks.record(appname, sender, seq)
+    dropped = tail.publish(appname, logs, now, parsed)
+    if dropped:
+        STREAM_DROPPED.inc(dropped)
+    # update prometheus counter by number of lines received
+    if logs:
+        try:
+            LOG_LINES.labels(app=appname).inc(len(logs))
+            for level, n in Tally(p[0] or 'none' for p in parsed).items():
+                LEVEL_LINES.labels(app=appname, level=level).inc(n)
+            for name, n in Tally(p[2] for p in parsed).items():
+                PARSED_LINES.labels(app=appname, parser=name).inc(n)
+        except Exception:
+            pass
+    if rules.rules:
+        try:
+            rules.observe(appname, logs, parsed, now)
+        except Exception as e:
+            print('rules error', e)
+    # age-based retention also has to run for apps that stopped logging
+    if LOG_RETENTION_INTERVAL > 0 and now - _last_retention >= LOG_RETENTION_INTERVAL:
+        _last_retention = now
+        try:
+            storage.apply_retention(now)
+        except Exception as e:
+            print('retention error', e)
+    if seq is None:
+        return ('', 204)
+    return jsonify({'ack': seq, 'lines': len(logs)})
+
+
+def _where_args():
+    # field.<name>=<value> filters on parsed fields
+    return {k[6:]: v for k, v in request.args.items() if k.startswith('field.') and len(k) > 6} or None
+
+
+def _time_arg(value, now):
+    # epoch seconds, or a negative number of seconds relative to now
+    if value in (None, ''):
+        return None
+    t = float(value)
+    return now + t if t < 0 else t
 
 
 @app.route('/logs', methods=['GET'])
 def get_logs():
-    # return all apps and latest lines
-    with lock:
-        out = {k: list(v)[-200:] for k, v in storage.items()}
+    """Newest matching lines per app.
+
+    Query args: ``app``, ``since``/``until`` (epoch seconds, or negative for
+    seconds ago), ``q`` (all words must appear), ``level`` (minimum level),
+    ``field.<name>`` (parsed field equals the value, e.g. ``field.status=500``)
+    and ``limit`` (lines per app). With no args this is the tail of every app.
+    """
+    now = time.time()
+    try:
+        since = _time_arg(request.args.get('since'), now)
+        until = _time_arg(request.args.get('until'), now)
+        limit = int(request.args.get('limit', LOG_QUERY_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'since, until and limit must be numbers'}), 400
+    limit = max(1, min(limit, LOG_QUERY_MAX_LIMIT))
+    try:
+        out = storage.query(app=request.args.get('app') or None, since=since, until=until,
+                            q=request.args.get('q'), level=request.args.get('level'), limit=limit,
+                            where=_where_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(out)
 
 
+@app.route('/logs/stream', methods=['GET'])
+def stream_logs():
+    """Follow new lines as they are ingested.
+
+    Filters as for /logs (``app``, ``q``, ``level``, ``field.<name>``);
+    ``tail=N`` first sends the last N matching lines. Server-sent events when the client accepts
+    ``text/event-stream`` or passes ``format=sse``, otherwise NDJSON. A client
+    that falls more than LOG_STREAM_BUFFER lines behind loses the oldest ones
+    and receives a ``{"dropped": n}`` notice instead.
+    """
+    fmt = request.args.get('format') or ('sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson')
+    if fmt not in ('sse', 'ndjson'):
+        return jsonify({'error': 'format must be sse or ndjson'}), 400
+    try:
+        backlog = max(0, min(int(request.args.get('tail', 0)), LOG_QUERY_MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'tail must be a number'}), 400
+    if tail.count() >= LOG_STREAM_MAX_CLIENTS:
+        return Response('too many log streams\n', status=503, headers={'Retry-After': '10'})
+    appname = request.args.get('app') or None
+    q = request.args.get('q')
+    level = request.args.get('level')
+    where = _where_args()
+    try:
+        # subscribe before reading the backlog so nothing falls in between
+        client = tail.subscribe(appname, q, level, where)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    first = []
+    if backlog:
+        found = storage.query(app=appname, q=q, level=level, limit=backlog, where=where)
+        first = sorted(({'app': a, **e} for a, entries in found.items() for e in entries), key=lambda e: e['ts'])
+        first = first[-backlog:]
+
+    def encode(entries):
+        if fmt == 'sse':
+            return ''.join(f"data: {json.dumps(e)}\n\n" for e in entries)
+        return ''.join(json.dumps(e) + '\n' for e in entries)
+
+    def gen():
+        try:
+            if first:
+                yield encode(first)
+            while True:
+                entries, dropped = client.read(LOG_STREAM_KEEPALIVE)
+                if dropped:
+                    notice = json.dumps({'dropped': dropped})
+                    yield f"event: dropped\ndata: {notice}\n\n" if fmt == 'sse' else notice + '\n'
+                if entries:
+                    yield encode(entries)
+                elif not dropped:
+                    # keepalive; also how a closed connection is noticed
+                    yield ': keepalive\n\n' if fmt == 'sse' else '\n'
+        finally:
+            tail.unsubscribe(client)
+
+    mimetype = 'text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    return Response(gen(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/rules', methods=['GET'])
+def get_rules():
+    """Configured rules and the alert windows that currently have matches."""
+    return jsonify({
+        'rules': [{'name': r.name, 'type': r.type, 'labels': r.label_names, 'window': r.window,
+                   'threshold': r.threshold} for r in rules.rules],
+        'alerts': rules.state(),
+    })
+
+
 @app.route('/metrics', methods=['GET'])
 def metrics():
     # Expose Prometheus metrics
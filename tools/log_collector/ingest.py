@@ -0,0 +1,151 @@
+"""Decoding of the compressed batch format sent by log_sidecar.
+
+A batch is one POST to /ingest with ``Content-Type: application/x-log-lines``:
+the body is the UTF-8 log lines, each terminated by ``\n``, optionally
+compressed as a whole with ``Content-Encoding: gzip`` (or ``zstd`` when the
+zstandard module is installed). The app name, a sender id and a per-sender
+batch sequence number travel in the ``X-Log-App``, ``X-Log-Sender`` and
+``X-Log-Seq`` headers.
+
+The body is decompressed and split into lines chunk by chunk as it is read,
+so neither the compressed nor the decompressed body is ever held in one
+piece. Splitting happens in C (``bytes.rfind``/``str.split``), so unlike
+JSON or length-prefixed frames there is nothing to parse per line. The
+collector answers with the sequence number it stored; ``Acks`` remembers
+the last one per sender so a batch the sidecar retries after a lost ack is
+acknowledged again but not stored twice.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+LINES_TYPE = 'application/x-log-lines'
+CHUNK = 64 * 1024
+
+
+class BatchError(ValueError):
+    """The body could not be decoded (bad encoding, truncated or too large)."""
+
+
+def encodings():
+    return ['identity', 'gzip', 'deflate'] + (['zstd'] if zstandard is not None else [])
+
+
+def _decompressor(encoding):
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return None
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise BatchError(f'unsupported Content-Encoding {encoding!r} (expected one of {", ".join(encodings())})')
+
+
+def _inflate(stream, encoding, max_bytes):
+    dec = _decompressor(encoding)
+    total = 0
+    while True:
+        chunk = stream.read(CHUNK)
+        if not chunk:
+            break
+        if dec is not None:
+            try:
+                chunk = dec.decompress(chunk)
+            except Exception as e:
+                raise BatchError(f'corrupt {encoding} body: {e}')
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise BatchError(f'batch larger than {max_bytes} bytes')
+        if chunk:
+            yield chunk
+    if dec is not None:
+        tail = dec.flush()
+        if tail:
+            yield tail
+        if not getattr(dec, 'eof', True):
+            raise BatchError(f'truncated {encoding} body')
+
+
+def read_lines(stream, encoding=None, max_bytes=0):
+    """Yield lists of lines of a batch read from the file-like ``stream``.
+
+    A last line without its newline is still returned (``curl --data-binary``
+    of a file); truncated compressed bodies raise BatchError instead.
+    """
+    rest = b''
+    for chunk in _inflate(stream, encoding, max_bytes):
+        cut = chunk.rfind(b'\n')
+        if cut < 0:
+            rest += chunk
+            continue
+        # only complete lines are decoded, so a multi-byte character is never split
+        yield (rest + chunk[:cut]).decode('utf-8', 'replace').split('\n')
+        rest = chunk[cut + 1:]
+    if rest:
+        yield [rest.decode('utf-8', 'replace')]
+
+
+def read_body(stream, encoding=None, max_bytes=0):
+    """The whole decompressed body (for compressed JSON batches)."""
+    return b''.join(_inflate(stream, encoding, max_bytes))
+
+
+def encode_lines(lines):
+    """The uncompressed body for ``lines`` (what log_sidecar sends).
+
+    Newlines inside a line would split it in two, so they are replaced.
+    """
+    return ''.join(line.replace('\n', ' ') + '\n' for line in lines).encode('utf-8', 'replace')
+
+
+class Acks:
+    """Last stored batch sequence number per (app, sender), LRU-bounded.
+
+    ``reserve`` checks a batch and claims it in one step; the claim is
+    either committed with ``record`` once the lines are stored or dropped
+    with ``release`` if storing failed. A retry that races the original
+    waits for it, then is acknowledged as a duplicate or stores the batch
+    itself.
+    """
+
+    def __init__(self, max_senders=10000):
+        self.max_senders = max_senders
+        self._seen = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+    def reserve(self, app, sender, seq):
+        """Claim ``seq`` for storing; False if it was stored already."""
+        key = (app, sender)
+        with self._lock:
+            while key in self._pending:
+                self._done.wait()
+            last = self._seen.get(key)
+            if last is not None and seq <= last:
+                return False
+            self._pending.add(key)
+            return True
+
+    def release(self, app, sender):
+        with self._lock:
+            self._pending.discard((app, sender))
+            self._done.notify_all()
+
+    def record(self, app, sender, seq):
+        key = (app, sender)
+        with self._lock:
+            self._seen[key] = max(seq, self._seen.get(key, seq))
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_senders:
+                self._seen.popitem(last=False)
+            self._pending.discard(key)
+            self._done.notify_all()
@@ -0,0 +1,110 @@
+"""Fan-out of freshly ingested lines to /logs/stream clients.
+
+Every client registers its filters (app, words, minimum level, field
+values) and gets a bounded queue. Ingest checks each line against the
+filters once and appends matches without ever blocking: when a client's
+queue is full the oldest pending line is dropped and counted, and the
+client is told how many it missed the next time it reads. A slow on-call terminal therefore
+loses lines instead of slowing down ingest for everybody.
+"""
+import threading
+from collections import deque
+
+from logstore import LEVELS, detect_level, normalize_level, tokenize
+
+
+class TailClient:
+    """One /logs/stream subscriber: its filters and pending lines."""
+
+    def __init__(self, app=None, q=None, level=None, buffer=1000, where=None):
+        self.app = app
+        self.where = where or {}
+        self.tokens = tokenize(q) if q else set()
+        self.min_level = None
+        if level:
+            lv = normalize_level(level)
+            if lv is None:
+                raise ValueError(f'unknown level {level!r} (expected one of {", ".join(LEVELS)})')
+            self.min_level = LEVELS.index(lv)
+        self._pending = deque(maxlen=max(buffer, 1))
+        self._cond = threading.Condition()
+        self._dropped = 0
+
+    def push(self, entries):
+        """Queue entries without blocking; returns how many were dropped."""
+        with self._cond:
+            overflow = max(len(self._pending) + len(entries) - self._pending.maxlen, 0)
+            self._dropped += overflow
+            self._pending.extend(entries)
+            self._cond.notify()
+        return overflow
+
+    def read(self, timeout):
+        """Wait up to ``timeout`` for lines; returns (entries, dropped since last read)."""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            entries = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        return entries, dropped
+
+
+class LiveTail:
+    """Registry of TailClients; ``publish`` is called for every ingest."""
+
+    def __init__(self, buffer=1000):
+        self.buffer = buffer
+        self._lock = threading.Lock()
+        self._clients = set()
+
+    def subscribe(self, app=None, q=None, level=None, where=None):
+        client = TailClient(app, q, level, self.buffer, where)
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, app, lines, ts, parsed=None):
+        """Queue matching lines for every client; returns how many were dropped.
+
+        ``parsed`` is the (level, fields) per line from the parse stage, if
+        it ran; otherwise levels are detected here.
+        """
+        with self._lock:
+            clients = [c for c in self._clients if c.app is None or c.app == app]
+        if not clients:
+            return 0
+        need_level = any(c.min_level is not None for c in clients)
+        need_tokens = any(c.tokens for c in clients)
+        batches = {c: [] for c in clients}
+        for i, line in enumerate(lines):
+            if not isinstance(line, str):
+                line = str(line)
+            if parsed is not None:
+                level, fields = parsed[i][0], parsed[i][1] or {}
+            else:
+                level, fields = detect_level(line), {}
+            lv = LEVELS.index(level) if need_level and level else -1
+            toks = tokenize(line) if need_tokens else None
+            entry = None
+            for c in clients:
+                if c.min_level is not None and lv < c.min_level:
+                    continue
+                if c.where and not all(fields.get(k) == v for k, v in c.where.items()):
+                    continue
+                if c.tokens and not toks.issuperset(c.tokens):
+                    continue
+                if entry is None:
+                    entry = {'app': app, 'ts': ts, 'line': line, 'level': level}
+                    if fields:
+                        entry['fields'] = fields
+                batches[c].append(entry)
+        return sum(c.push(entries) for c, entries in batches.items() if entries)
@@ -0,0 +1,596 @@
+"""Searchable log store used by the collector.
+
+Lines are kept per app in fixed-size segments. Each segment records the
+receive time of every line (non-decreasing, so a time range is a bisect),
+its detected level and an inverted index from lower-cased word tokens to
+line offsets. Queries walk segments newest first, skip the ones outside the
+time range and only look at lines whose tokens match, so finding the last
+few matches does not scan the whole store. Fields extracted at ingest (see
+parsing.py) are stored as dictionary-coded columns next to the lines and
+can be filtered on exactly.
+
+Without a data directory the oldest segment is dropped once an app holds
+more than ``max_lines`` lines. With one, every full segment is sealed into
+an immutable file of zlib-compressed blocks followed by a sparse index
+(per-block time range, highest level and a bloom filter of its tokens);
+queries read those files through mmap and only decompress blocks the index
+cannot rule out. Only the newest ``max_lines`` per app stay in memory as
+the hot tail, lines of the open segment are appended to a small write-ahead
+file so a restart loses nothing, and sealed files are deleted by size and
+age.
+
+The store is thread-safe with one lock per app, so ingests for different
+apps never wait on each other. Readers only take an app's lock long enough
+to snapshot its segment list and the current length of the open segment;
+segments are append-only (sealed files immutable), so the search itself
+runs without any lock on that consistent prefix.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from urllib.parse import quote, unquote
+
+LEVELS = ['debug', 'info', 'warning', 'error', 'critical']
+_LEVEL_ALIASES = {'trace': 'debug', 'warn': 'warning', 'err': 'error', 'crit': 'critical', 'fatal': 'critical'}
+_LEVEL_RE = re.compile(r'\b(TRACE|DEBUG|INFO|WARN(?:ING)?|ERR(?:OR)?|CRIT(?:ICAL)?|FATAL)\b', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'\w+')
+# tokens longer than this (hashes, base64 blobs) are not indexed
+MAX_TOKEN_LEN = 64
+
+
+def normalize_level(name):
+    """Map a level name or alias to one of LEVELS (None if unknown)."""
+    if not name:
+        return None
+    name = str(name).lower()
+    name = _LEVEL_ALIASES.get(name, name)
+    return name if name in LEVELS else None
+
+
+def detect_level(line):
+    m = _LEVEL_RE.search(line)
+    return normalize_level(m.group(1)) if m else None
+
+
+def tokenize(text):
+    return {t for t in _TOKEN_RE.findall(text.lower()) if len(t) <= MAX_TOKEN_LEN}
+
+
+class Segment:
+    """Up to ``capacity`` consecutive lines of one app plus their indexes.
+
+    Parsed fields are kept as columns: one array of value codes per field
+    name (0 where a line lacks the field) into a dictionary of the distinct
+    values shared by all columns of the segment, so repeated loggers,
+    methods or status codes cost four bytes a line.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = array('d')
+        self.levels = array('b')
+        self.lines = []
+        self.postings = {}
+        self.columns = {}
+        self.values = [None]
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def full(self):
+        return len(self.lines) >= self.capacity
+
+    def add(self, ts, line, level, fields=None):
+        i = len(self.lines)
+        self.ts.append(ts)
+        self.levels.append(LEVELS.index(level) if level else -1)
+        if fields or self.columns:
+            self._add_fields(i, fields or {})
+        self.lines.append(line)
+        for tok in tokenize(line):
+            p = self.postings.get(tok)
+            if p is None:
+                p = self.postings[tok] = array('I')
+            p.append(i)
+
+    def _add_fields(self, i, fields):
+        for name, col in self.columns.items():
+            if name not in fields:
+                col.append(0)
+        for name, value in fields.items():
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.values)
+                self.values.append(value)
+            col = self.columns.get(name)
+            if col is None:
+                # readers may look at this column already, so fill it before publishing
+                col = array('I', [0]) * i
+                col.append(code)
+                self.columns[name] = col
+            else:
+                col.append(code)
+
+    def fields(self, i):
+        out = {}
+        for name, col in list(self.columns.items()):
+            if i < len(col) and col[i]:
+                out[name] = self.values[col[i]]
+        return out
+
+    def entry(self, i):
+        lv = self.levels[i]
+        e = {'ts': self.ts[i], 'line': self.lines[i], 'level': LEVELS[lv] if lv >= 0 else None}
+        if self.columns:
+            fields = self.fields(i)
+            if fields:
+                e['fields'] = fields
+        return e
+
+    def search(self, since, until, tokens, min_level, end=None, where=None):
+        """Yield offsets of matching lines among the first ``end``, newest first."""
+        end = len(self.lines) if end is None else end
+        if not end or self.ts[end - 1] < since or self.ts[0] > until:
+            return
+        checks = []
+        for name, value in (where or {}).items():
+            col = self.columns.get(name)
+            code = self._codes.get(value)
+            if col is None or code is None:
+                return
+            checks.append((col, code))
+        lo = bisect_left(self.ts, since, 0, end)
+        hi = bisect_right(self.ts, until, lo, end)
+        if tokens:
+            lists = [self.postings.get(t) for t in tokens]
+            if any(p is None for p in lists):
+                return
+            # walk the rarest token's postings and check the rest per line
+            p = min(lists, key=len)
+            rest = [t for t in tokens if self.postings[t] is not p]
+            candidates = p[bisect_left(p, lo):bisect_left(p, hi)]
+        else:
+            rest = []
+            candidates = range(lo, hi)
+        for i in reversed(candidates):
+            if min_level is not None and self.levels[i] < min_level:
+                continue
+            if checks and not all(i < len(col) and col[i] == code for col, code in checks):
+                continue
+            if rest and not tokenize(self.lines[i]).issuperset(rest):
+                continue
+            yield i
+
+    def find(self, since, until, tokens, min_level, end=None, where=None):
+        """Yield matching entries, newest first."""
+        for i in self.search(since, until, tokens, min_level, end, where):
+            yield self.entry(i)
+
+
+_SEG_MAGIC = b'LOGSEG1\n'
+_IDX_MAGIC = b'LOGIDX1\n'
+_TRAILER = struct.Struct('<Q8s')
+_RECORD = struct.Struct('<dbI')
+BLOOM_BITS = 2048
+_BLOOM_SEEDS = (0, 0x9E3779B9, 0x7F4A7C15)
+
+
+def _bloom_positions(tok):
+    data = tok.encode('utf-8')
+    return [zlib.crc32(data, seed) % BLOOM_BITS for seed in _BLOOM_SEEDS]
+
+
+def _bloom_has(bits, tokens):
+    return all(bits[h >> 3] & (1 << (h & 7)) for t in tokens for h in _bloom_positions(t))
+
+
+def _block_columns(segment, lo, hi):
+    """Field columns of lines lo..hi re-coded against a block-local value list."""
+    if not segment.columns:
+        return None
+    values = []
+    codes = {}
+    columns = {}
+    for name, col in segment.columns.items():
+        out = []
+        for c in col[lo:hi]:
+            if c:
+                v = segment.values[c]
+                code = codes.get(v)
+                if code is None:
+                    values.append(v)
+                    code = codes[v] = len(values)
+                c = code
+            out.append(c)
+        if any(out):
+            columns[name] = out
+    return {'values': values, 'columns': columns} if columns else None
+
+
+class DiskSegment:
+    """A sealed segment file, read through mmap.
+
+    Layout: magic, zlib-compressed blocks of (ts, level, length, utf-8 line)
+    records, optionally followed inside the block by the block's field
+    columns as JSON, a JSON index with one [offset, length, first_ts,
+    last_ts, lines, max_level, bloom, records_length] entry per block, then
+    the index offset and a trailing magic. Files written before fields
+    existed have no records_length and no columns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_SEG_MAGIC)] != _SEG_MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a log segment')
+        idx_off, magic = _TRAILER.unpack(self._map[-_TRAILER.size:])
+        if magic != _IDX_MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} has no index (incomplete write?)')
+        index = json.loads(self._map[idx_off:len(self._map) - _TRAILER.size])
+        self.blocks = [(b[0], b[1], b[2], b[3], b[4], b[5], bytes.fromhex(b[6]), b[7] if len(b) > 7 else None)
+                       for b in index['blocks']]
+        self.first_ts = self.blocks[0][2] if self.blocks else 0.0
+        self.last_ts = self.blocks[-1][3] if self.blocks else 0.0
+        self.count = sum(b[4] for b in self.blocks)
+        self.size = len(self._map)
+
+    @classmethod
+    def write(cls, path, segment, block_lines=256, level=6):
+        """Seal an in-memory Segment into ``path`` and open it."""
+        tmp = path + '.tmp'
+        blocks = []
+        with open(tmp, 'wb') as f:
+            f.write(_SEG_MAGIC)
+            for lo in range(0, len(segment), block_lines):
+                hi = min(lo + block_lines, len(segment))
+                buf = bytearray()
+                bloom = bytearray(BLOOM_BITS // 8)
+                for i in range(lo, hi):
+                    data = segment.lines[i].encode('utf-8', 'replace')
+                    buf += _RECORD.pack(segment.ts[i], segment.levels[i], len(data))
+                    buf += data
+                    for tok in tokenize(segment.lines[i]):
+                        for h in _bloom_positions(tok):
+                            bloom[h >> 3] |= 1 << (h & 7)
+                records_len = len(buf)
+                columns = _block_columns(segment, lo, hi)
+                if columns:
+                    buf += json.dumps(columns, separators=(',', ':')).encode('utf-8')
+                comp = zlib.compress(bytes(buf), level)
+                blocks.append([f.tell(), len(comp), segment.ts[lo], segment.ts[hi - 1], hi - lo,
+                               max(segment.levels[lo:hi]), bloom.hex(), records_len])
+                f.write(comp)
+            idx_off = f.tell()
+            f.write(json.dumps({'blocks': blocks}, separators=(',', ':')).encode('utf-8'))
+            f.write(_TRAILER.pack(idx_off, _IDX_MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def _records(self, off, n, records_len):
+        """([(ts, level, line)], {field: [value per line]}) of one block."""
+        data = zlib.decompress(self._map[off:off + n])
+        end = len(data) if records_len is None else records_len
+        out = []
+        pos = 0
+        while pos < end:
+            ts, lv, size = _RECORD.unpack_from(data, pos)
+            pos += _RECORD.size
+            out.append((ts, lv, data[pos:pos + size].decode('utf-8', 'replace')))
+            pos += size
+        columns = {}
+        if end < len(data):
+            cols = json.loads(data[end:])
+            values = [None] + cols['values']
+            columns = {name: [values[c] for c in codes] for name, codes in cols['columns'].items()}
+        return out, columns
+
+    def find(self, since, until, tokens, min_level, end=None, where=None):
+        """Yield matching entries, newest first, decompressing only blocks
+        whose index entry may match."""
+        if self.last_ts < since or self.first_ts > until:
+            return
+        for off, n, first, last, _count, max_level, bloom, records_len in reversed(self.blocks):
+            if last < since or first > until:
+                continue
+            if min_level is not None and max_level < min_level:
+                continue
+            if tokens and not _bloom_has(bloom, tokens):
+                continue
+            records, columns = self._records(off, n, records_len)
+            if where and not all(name in columns for name in where):
+                continue
+            for i in range(len(records) - 1, -1, -1):
+                ts, lv, line = records[i]
+                if ts < since or ts > until:
+                    continue
+                if min_level is not None and lv < min_level:
+                    continue
+                if where and not all(columns[k][i] == v for k, v in where.items()):
+                    continue
+                if tokens and not tokenize(line).issuperset(tokens):
+                    continue
+                e = {'ts': ts, 'line': line, 'level': LEVELS[lv] if lv >= 0 else None}
+                fields = {name: col[i] for name, col in columns.items() if col[i] is not None}
+                if fields:
+                    e['fields'] = fields
+                yield e
+
+    def close(self):
+        try:
+            self._map.close()
+        except Exception:
+            pass
+
+    def remove(self):
+        # unlink only: a reader may still hold this segment in its snapshot,
+        # and the mapping is released once the last reference goes away
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AppLog:
+    """Segments of one app, oldest first.
+
+    ``segments`` is the in-memory tail; with a ``directory`` every full
+    segment is also sealed to disk and ``disk`` lists the sealed files.
+    """
+
+    def __init__(self, max_lines, segment_lines, directory=None, block_lines=256,
+                 retention_bytes=0, retention_age=0):
+        self.segment_lines = max(segment_lines, 1)
+        self.max_segments = max(max_lines // self.segment_lines, 1)
+        self.segments = deque()
+        self.last_ts = 0.0
+        self.directory = directory
+        self.block_lines = max(block_lines, 1)
+        self.retention_bytes = retention_bytes
+        self.retention_age = retention_age
+        self.disk = []
+        self._seqs = deque()
+        self._next_seq = 0
+        self._wal = None
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._open_disk()
+
+    def _seg_path(self, seq):
+        return os.path.join(self.directory, f'{seq:012d}.seg')
+
+    def _open_disk(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith('.seg'):
+                continue
+            try:
+                seg = DiskSegment(path)
+            except Exception as e:
+                print('segment load error', path, e)
+                continue
+            self.disk.append((int(name[:-4]), seg))
+            self._next_seq = int(name[:-4]) + 1
+            self.last_ts = max(self.last_ts, seg.last_ts)
+        # replay the open segment; its first line records which segment it belongs to
+        wal = os.path.join(self.directory, 'active.wal')
+        pending = []
+        try:
+            with open(wal, encoding='utf-8') as f:
+                head = json.loads(f.readline() or 'null')
+                if head and head.get('seq') == self._next_seq:
+                    for line in f:
+                        try:
+                            pending.append(json.loads(line))
+                        except ValueError:
+                            break  # torn final write
+        except FileNotFoundError:
+            pass
+        self._start_wal()
+        for rec in pending:
+            if len(rec) > 2:
+                self.append(rec[1], rec[0], rec[2], rec[3])
+            else:
+                self.append(rec[1], rec[0], detect_level(rec[1]))
+        # the fresh WAL now holds the replayed lines; flush so a second crash keeps them
+        self._wal.flush()
+
+    def _start_wal(self):
+        if self._wal is not None:
+            self._wal.close()
+        self._wal = open(os.path.join(self.directory, 'active.wal'), 'w', encoding='utf-8')
+        self._wal.write(json.dumps({'seq': self._next_seq}) + '\n')
+        self._wal.flush()
+
+    def append(self, line, ts, level, fields=None):
+        # receive time, kept non-decreasing so each segment stays sorted
+        ts = max(ts, self.last_ts)
+        self.last_ts = ts
+        if not self.segments or self.segments[-1].full():
+            self.segments.append(Segment(self.segment_lines))
+            self._seqs.append(self._next_seq)
+            while len(self.segments) > self.max_segments:
+                self.segments.popleft()
+                self._seqs.popleft()
+        self.segments[-1].add(ts, line, level, fields)
+        if self._wal is not None:
+            self._wal.write(json.dumps([ts, line, level, fields] if fields else [ts, line]) + '\n')
+            if self.segments[-1].full():
+                self._seal()
+
+    def extend(self, lines, ts, parsed=None):
+        """Append lines received at ``ts``; returns how many were stored.
+
+        ``parsed`` optionally holds a (level, fields) pair per line from the
+        parse stage; without it the level is detected from the text.
+        """
+        n = 0
+        with self.lock:
+            for i, line in enumerate(lines):
+                if not isinstance(line, str):
+                    line = str(line)
+                if parsed is not None:
+                    level, fields = parsed[i][0], parsed[i][1]
+                else:
+                    level, fields = detect_level(line), None
+                self.append(line, ts, level, fields)
+                n += 1
+            if self._wal is not None:
+                self._wal.flush()
+        return n
+
+    def _seal(self):
+        seq = self._next_seq
+        seg = DiskSegment.write(self._seg_path(seq), self.segments[-1], self.block_lines)
+        # a new list, so a snapshot taken earlier keeps iterating the old one
+        self.disk = self.disk + [(seq, seg)]
+        self._next_seq = seq + 1
+        self._start_wal()
+        self._apply_retention(time.time())
+
+    def apply_retention(self, now=None):
+        """Delete the oldest sealed files beyond the size and age budget."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._apply_retention(now)
+
+    def _apply_retention(self, now):
+        total = sum(seg.size for _, seg in self.disk)
+        while self.disk:
+            seq, seg = self.disk[0]
+            too_big = self.retention_bytes > 0 and total > self.retention_bytes
+            too_old = self.retention_age > 0 and seg.last_ts < now - self.retention_age
+            if not (too_big or too_old):
+                break
+            total -= seg.size
+            seg.remove()
+            self.disk = self.disk[1:]
+        # the hot tail may still hold lines of a deleted file; drop those too
+        oldest = self.disk[0][0] if self.disk else self._next_seq
+        while self._seqs and self._seqs[0] < oldest and len(self.segments) > 1:
+            self.segments.popleft()
+            self._seqs.popleft()
+
+    def snapshot(self):
+        """[(segment, lines visible)] newest first, taken under the lock."""
+        with self.lock:
+            hot_from = self._seqs[0] if self._seqs else self._next_seq
+            hot = [(seg, len(seg)) for seg in reversed(self.segments)]
+            disk = self.disk
+        # once the log is open, self.disk is only ever replaced (by _seal and
+        # retention), never mutated in place, so this list is stable
+        return hot + [(seg, len(seg)) for seq, seg in reversed(disk) if seq < hot_from]
+
+    def __len__(self):
+        return sum(n for _, n in self.snapshot())
+
+    def search(self, since, until, tokens, min_level, limit, where=None):
+        """Newest ``limit`` matches, returned oldest first."""
+        out = []
+        for seg, end in self.snapshot():
+            for entry in seg.find(since, until, tokens, min_level, end, where):
+                out.append(entry)
+                if len(out) >= limit:
+                    return out[::-1]
+        return out[::-1]
+
+    def close(self):
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        for _, seg in self.disk:
+            seg.close()
+
+
+class LogStore:
+    """All apps' logs, searchable by app, time range, words and level.
+
+    With ``data_dir`` each app gets a subdirectory of sealed segment files;
+    apps found there are reopened at start.
+    """
+
+    def __init__(self, max_lines=50000, segment_lines=1000, data_dir=None, block_lines=256,
+                 retention_bytes=0, retention_age=0):
+        self.max_lines = max_lines
+        self.segment_lines = segment_lines
+        self.data_dir = data_dir
+        self.block_lines = block_lines
+        self.retention_bytes = retention_bytes
+        self.retention_age = retention_age
+        self.apps = {}
+        self._lock = threading.Lock()
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+            for name in sorted(os.listdir(data_dir)):
+                if os.path.isdir(os.path.join(data_dir, name)):
+                    self._open(unquote(name))
+
+    def _open(self, app):
+        directory = os.path.join(self.data_dir, quote(app, safe='')) if self.data_dir else None
+        log = self.apps[app] = AppLog(self.max_lines, self.segment_lines, directory, self.block_lines,
+                                      self.retention_bytes, self.retention_age)
+        return log
+
+    def append(self, app, lines, now=None, parsed=None):
+        """Store lines received for ``app`` and return how many were kept."""
+        now = time.time() if now is None else now
+        log = self.apps.get(app)
+        if log is None:
+            with self._lock:
+                log = self.apps.get(app)
+                if log is None:
+                    log = self._open(app)
+        return log.extend(lines, now, parsed)
+
+    def apply_retention(self, now=None):
+        for log in list(self.apps.values()):
+            log.apply_retention(now)
+
+    def query(self, app=None, since=None, until=None, q=None, level=None, limit=200, where=None):
+        """{app: [entry, ...]} with each app's newest ``limit`` matches.
+
+        ``q`` matches lines containing all of its words (case-insensitive);
+        ``level`` keeps lines at that level or more severe; ``where`` keeps
+        lines whose parsed fields have exactly these values.
+        """
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        tokens = sorted(tokenize(q)) if q else []
+        min_level = None
+        if level:
+            lv = normalize_level(level)
+            if lv is None:
+                raise ValueError(f'unknown level {level!r} (expected one of {", ".join(LEVELS)})')
+            min_level = LEVELS.index(lv)
+        names = [app] if app else sorted(list(self.apps))
+        out = {}
+        for name in names:
+            log = self.apps.get(name)
+            if log is not None:
+                out[name] = log.search(since, until, tokens, min_level, limit, where)
+        return out
+
+    def close(self):
+        for log in list(self.apps.values()):
+            with log.lock:
+                log.close()
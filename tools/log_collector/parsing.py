@@ -0,0 +1,182 @@
+r"""Structured parsing of log lines at ingest.
+
+Every line is run through a chain of parsers once, when it arrives. The
+first parser that recognises the line returns its fields; the level comes
+from the ``level`` field if there is one and from the text otherwise. The
+fields are stored next to the line (see logstore.Segment), so queries can
+filter on them and nobody downstream has to parse the tail again.
+
+Built-in parsers: ``json`` (one object per line), ``logfmt``, ``django``
+(the helpsite ``LOGGING`` format ``%(asctime)s %(levelname)s %(name)s
+%(message)s``), ``gunicorn_access`` (gunicorn's default access log format;
+the level follows the status code) and ``gunicorn_error``. More can be
+added with ``@parser('name')`` or as named-group regexes in a JSON config
+file that also picks the chain per app::
+
+    {"profiles": {"worker": "(?P<worker>worker-\\d+) (?P<event>\\w+)"},
+     "apps": {"helpsite": ["django", "gunicorn_access"], "jobs": ["worker"],
+              "*": ["json", "logfmt"]}}
+
+Field names are normalised (``levelname`` -> ``level``, ``name`` ->
+``logger``, ``requestId`` -> ``request_id``), timestamps and the message
+itself are not kept as fields since the line already holds them, and
+values are stored as strings.
+"""
+import json
+import re
+
+from logstore import detect_level, normalize_level
+
+PARSERS = {}
+DEFAULT_CHAIN = ['json', 'django', 'gunicorn_access', 'gunicorn_error', 'logfmt']
+# per line, to keep one odd line from bloating the store
+MAX_FIELDS = 32
+MAX_VALUE_LEN = 256
+
+_ALIASES = {
+    'levelname': 'level', 'severity': 'level', 'lvl': 'level', 'loglevel': 'level',
+    'name': 'logger', 'logger_name': 'logger', 'loggername': 'logger',
+    'requestid': 'request_id', 'req_id': 'request_id', 'reqid': 'request_id', 'x_request_id': 'request_id',
+    'traceid': 'trace_id', 'status_code': 'status', 'statuscode': 'status',
+}
+_DROP = {'message', 'msg', 'time', 'timestamp', 'asctime', '@timestamp', 'ts', 'created'}
+_KEYS = {}  # raw key -> normalised key; the same few keys repeat on every line
+
+
+def parser(name):
+    """Register ``fn(line) -> dict or None`` as parser ``name``."""
+    def register(fn):
+        PARSERS[name] = fn
+        return fn
+    return register
+
+
+def regex_parser(pattern):
+    """A parser returning the named groups of ``pattern`` (matched at the start)."""
+    rx = re.compile(pattern)
+
+    def parse(line):
+        m = rx.match(line)
+        return m.groupdict() if m else None
+    return parse
+
+
+def _key(raw):
+    key = _KEYS.get(raw)
+    if key is None:
+        key = str(raw).strip().lower().replace('-', '_')
+        key = _ALIASES.get(key, key)
+        if len(_KEYS) < 10000:
+            _KEYS[raw] = key
+    return key
+
+
+def _normalize(raw):
+    fields = {}
+    for key, value in raw.items():
+        if value is None or value == '' or value == '-':
+            continue
+        key = _key(key)
+        if key in _DROP:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (dict, list)):
+            continue
+        value = str(value)
+        fields[key] = value[:MAX_VALUE_LEN]
+        if len(fields) >= MAX_FIELDS:
+            break
+    return fields
+
+
+@parser('json')
+def parse_json(line):
+    if not line.startswith('{'):
+        return None
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+_LOGFMT_RE = re.compile(r'([A-Za-z_][\w.\-]*)=("(?:[^"\\]|\\.)*"|\S*)')
+
+
+@parser('logfmt')
+def parse_logfmt(line):
+    eq = line.find('=')
+    if eq < 0:
+        return None
+    # start at the word holding the first '=' instead of trying every position
+    pairs = _LOGFMT_RE.findall(line, line.rfind(' ', 0, eq) + 1)
+    if len(pairs) < 2:
+        return None
+    return {k: (v[1:-1].replace('\\"', '"') if v.startswith('"') else v) for k, v in pairs}
+
+
+PARSERS['django'] = regex_parser(
+    r'(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) (?P<level>[A-Z]+) (?P<logger>\S+) ')
+PARSERS['gunicorn_error'] = regex_parser(
+    r'\[(?P<time>[^\]]+)\] \[(?P<pid>\d+)\] \[(?P<level>[A-Z]+)\] ')
+_ACCESS_RE = re.compile(
+    r'(?P<remote>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>[^ "?]*)\S* [^"]*" (?P<status>\d{3}) (?P<bytes>\d+|-)'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?')
+
+
+@parser('gunicorn_access')
+def parse_gunicorn_access(line):
+    m = _ACCESS_RE.match(line)
+    if not m:
+        return None
+    fields = m.groupdict()
+    status = fields['status']
+    fields['level'] = 'error' if status[0] == '5' else 'warning' if status[0] == '4' else 'info'
+    return fields
+
+
+class Pipeline:
+    """The parser chain per app; ``parse`` is called for every ingested line."""
+
+    def __init__(self, chain=None, apps=None, profiles=None):
+        for name, pattern in (profiles or {}).items():
+            PARSERS[name] = regex_parser(pattern)
+        apps = dict(apps or {})
+        default = apps.pop('*', chain if chain is not None else DEFAULT_CHAIN)
+        self._chains = {app: self._resolve(names) for app, names in apps.items()}
+        self._default = self._resolve(default)
+
+    @staticmethod
+    def _resolve(names):
+        unknown = [n for n in names if n not in PARSERS]
+        if unknown:
+            raise ValueError(f'unknown parser {", ".join(unknown)} (known: {", ".join(sorted(PARSERS))})')
+        return [(n, PARSERS[n]) for n in names]
+
+    @classmethod
+    def from_config(cls, chain=None, path=None):
+        """Pipeline from a comma-separated default chain ('none' for no
+        parsing) and an optional JSON config file."""
+        if chain is not None:
+            chain = [] if chain.strip() in ('', 'none') else [n.strip() for n in chain.split(',') if n.strip()]
+        config = {}
+        if path:
+            with open(path) as f:
+                config = json.load(f)
+        return cls(chain, config.get('apps'), config.get('profiles'))
+
+    def parse(self, app, line):
+        """(level, fields, parser name) for one line; fields is None and the
+        parser name 'none' when no parser recognised it."""
+        for name, fn in self._chains.get(app, self._default):
+            try:
+                raw = fn(line)
+            except Exception:
+                raw = None
+            if raw:
+                fields = _normalize(raw)
+                level = normalize_level(fields.pop('level', None)) or detect_level(line)
+                return level, fields or None, name
+        return detect_level(line), None, 'none'
@@ -0,0 +1,253 @@
+r"""Metrics and alerts derived from log lines, evaluated at ingest.
+
+Rules come from a JSON file (or inline JSON) named by ``LOG_RULES``::
+
+    {"rules": [
+      {"name": "helpsite_http_errors", "type": "counter",
+       "help": "5xx responses in the helpsite access log",
+       "app": "helpsite", "fields": {"status": "5\\d\\d"},
+       "labels": {"status": "$status", "path": "$path"},
+       "alert": {"window": 300, "threshold": 20}},
+      {"name": "worker_job_seconds", "type": "histogram",
+       "regex": "job (?P<job>\\w+) done in (?P<ms>\\d+)ms",
+       "value": "ms", "scale": 0.001, "labels": {"job": "$job"},
+       "buckets": [0.1, 0.5, 1, 5, 30]}
+    ]}
+
+A line matches a rule when all of its conditions hold: ``app`` (a name or
+a list of names), ``level`` (minimum level), ``fields`` (parsed field
+values, each a regex that must match the whole value) and ``regex``
+(searched in the line; its named groups can be used like fields). Label
+values are ``$name`` references to the app, level, a parsed field or a
+named group, or literals. A counter counts matching lines; a histogram
+observes the number found in ``value`` (a leading number, so ``35ms``
+works) times ``scale``.
+
+With ``alert`` the rule also keeps a sliding window of matches per label
+set: ``<name>_window`` exports how many matched in the last ``window``
+seconds and ``<name>_firing`` is 1 while that count is at or above
+``threshold``. Both are computed at scrape time, so a firing alert clears
+on its own once the window moves past the burst.
+
+All regexes are compiled once when the rules are loaded, and increments
+are summed per batch before they reach the Prometheus client.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter as Tally, deque
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+from logstore import LEVELS, normalize_level
+
+# label sets per rule; further combinations are folded into "__other__"
+MAX_SERIES = 1000
+_NAME_RE = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*\Z')
+_NUMBER_RE = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+
+
+class Window:
+    """Matches per second over the last ``seconds``."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._buckets = deque()
+        self._total = 0
+
+    def add(self, now, n):
+        sec = int(now)
+        if self._buckets and self._buckets[-1][0] == sec:
+            self._buckets[-1][1] += n
+        else:
+            self._buckets.append([sec, n])
+        self._total += n
+        self.count(now)
+
+    def count(self, now):
+        cutoff = now - self.seconds
+        while self._buckets and self._buckets[0][0] <= cutoff:
+            self._total -= self._buckets.popleft()[1]
+        return self._total
+
+
+class Rule:
+    def __init__(self, spec, registry, lock=None):
+        self.name = spec['name']
+        if not _NAME_RE.match(self.name):
+            raise ValueError(f'invalid rule name {self.name!r}')
+        self.type = spec.get('type', 'counter')
+        if self.type not in ('counter', 'histogram'):
+            raise ValueError(f'rule {self.name}: type must be counter or histogram')
+        apps = spec.get('app')
+        self.apps = None if apps is None else {apps} if isinstance(apps, str) else set(apps)
+        self.min_level = None
+        if spec.get('level'):
+            lv = normalize_level(spec['level'])
+            if lv is None:
+                raise ValueError(f'rule {self.name}: unknown level {spec["level"]!r}')
+            self.min_level = LEVELS.index(lv)
+        self.fields = [(k, re.compile(v)) for k, v in (spec.get('fields') or {}).items()]
+        self.regex = re.compile(spec['regex']) if spec.get('regex') else None
+        labels = spec.get('labels') or {}
+        for label in labels:
+            if not _NAME_RE.match(label) or label.startswith('__'):
+                raise ValueError(f'rule {self.name}: invalid label {label!r}')
+        self.label_names = list(labels)
+        self.label_sources = [(v[1:], None) if v.startswith('$') else (None, v) for v in labels.values()]
+        self.value = spec.get('value')
+        self.scale = float(spec.get('scale', 1))
+        doc = spec.get('help') or f'Log lines matching rule {self.name}'
+        if self.type == 'histogram':
+            if not self.value:
+                raise ValueError(f'rule {self.name}: a histogram needs "value"')
+            kwargs = {'buckets': spec['buckets']} if spec.get('buckets') else {}
+            self.metric = Histogram(self.name, doc, self.label_names, registry=registry, **kwargs)
+        else:
+            self.metric = Counter(self.name, doc, self.label_names, registry=registry)
+        alert = spec.get('alert')
+        self.window = float(alert['window']) if alert else None
+        self.threshold = float(alert['threshold']) if alert else None
+        self.windows = {}
+        self._series = set()
+        # shared with the RuleSet's alert windows; guards _series across concurrent ingests
+        self._lock = lock or threading.Lock()
+
+    def match(self, app, line, level, fields):
+        """The named values of a matching line (fields plus regex groups), or None."""
+        if self.min_level is not None and (level is None or LEVELS.index(level) < self.min_level):
+            return None
+        for name, rx in self.fields:
+            value = fields.get(name) if fields else None
+            if value is None or not rx.fullmatch(value):
+                return None
+        values = dict(fields) if fields else {}
+        if self.regex is not None:
+            m = self.regex.search(line)
+            if m is None:
+                return None
+            values.update((k, v) for k, v in m.groupdict().items() if v is not None)
+        values['app'] = app
+        values['level'] = level or 'none'
+        return values
+
+    def labels_for(self, values):
+        key = tuple(values.get(ref, '') if ref else literal for ref, literal in self.label_sources)
+        if key in self._series:
+            return key
+        with self._lock:
+            if key not in self._series:
+                if len(self._series) >= MAX_SERIES:
+                    return tuple('__other__' for _ in key)
+                self._series.add(key)
+        return key
+
+    def number(self, values):
+        m = _NUMBER_RE.match(values.get(self.value) or '')
+        return float(m.group(1)) * self.scale if m else None
+
+
+class RuleSet:
+    """Compiled rules; ``observe`` runs on every ingested batch and the
+    instance is registered as a collector for the alert window gauges."""
+
+    def __init__(self, specs, registry=None):
+        registry = REGISTRY if registry is None else registry
+        self._lock = threading.Lock()
+        self.rules = [Rule(spec, registry, self._lock) for spec in specs]
+        names = [r.name for r in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError('rule names must be unique')
+        if any(r.window for r in self.rules):
+            registry.register(self)
+
+    @classmethod
+    def from_config(cls, value, registry=None):
+        """Rules from a JSON file path or inline JSON (empty: no rules)."""
+        if not value:
+            return cls([], registry)
+        if value.lstrip().startswith('{'):
+            config = json.loads(value)
+        else:
+            with open(os.path.expanduser(value)) as f:
+                config = json.load(f)
+        return cls(config.get('rules', []), registry)
+
+    def observe(self, app, lines, parsed, now=None):
+        """Evaluate every rule against a batch of lines of ``app``."""
+        now = time.time() if now is None else now
+        for rule in self.rules:
+            if rule.apps is not None and app not in rule.apps:
+                continue
+            counts = Tally()
+            observations = []
+            for i, line in enumerate(lines):
+                level, fields = parsed[i][0], parsed[i][1]
+                values = rule.match(app, line, level, fields)
+                if values is None:
+                    continue
+                key = rule.labels_for(values)
+                if rule.type == 'histogram':
+                    x = rule.number(values)
+                    if x is None:
+                        continue
+                    observations.append((key, x))
+                counts[key] += 1
+            for key, x in observations:
+                (rule.metric.labels(*key) if key else rule.metric).observe(x)
+            if rule.type == 'counter':
+                for key, n in counts.items():
+                    (rule.metric.labels(*key) if key else rule.metric).inc(n)
+            if rule.window and counts:
+                self._track(rule, counts, now)
+
+    def _track(self, rule, counts, now):
+        with self._lock:
+            for key, n in counts.items():
+                w = rule.windows.get(key)
+                if w is None:
+                    w = rule.windows[key] = Window(rule.window)
+                was = w.count(now) >= rule.threshold
+                w.add(now, n)
+                if not was and w.count(now) >= rule.threshold:
+                    print('alert firing', rule.name, dict(zip(rule.label_names, key)), w.count(now),
+                          f'matches in {rule.window:g}s')
+
+    def state(self, now=None):
+        """[{rule, labels, count, firing}] for every alert window."""
+        now = time.time() if now is None else now
+        out = []
+        with self._lock:
+            for rule in self.rules:
+                if not rule.window:
+                    continue
+                for key, w in list(rule.windows.items()):
+                    n = w.count(now)
+                    if not n:
+                        del rule.windows[key]  # idle series stop being exported
+                        continue
+                    out.append({'rule': rule.name, 'labels': dict(zip(rule.label_names, key)), 'count': n,
+                                'window': rule.window, 'threshold': rule.threshold,
+                                'firing': n >= rule.threshold})
+        return out
+
+    def collect(self):
+        state = self.state()
+        for rule in self.rules:
+            if not rule.window:
+                continue
+            count = GaugeMetricFamily(f'{rule.name}_window', f'Matches of {rule.name} in the last {rule.window:g}s',
+                                      labels=rule.label_names)
+            firing = GaugeMetricFamily(f'{rule.name}_firing',
+                                       f'1 while {rule.name} matched at least {rule.threshold:g} times in '
+                                       f'{rule.window:g}s', labels=rule.label_names)
+            for s in state:
+                if s['rule'] == rule.name:
+                    values = [s['labels'][n] for n in rule.label_names]
+                    count.add_metric(values, s['count'])
+                    firing.add_metric(values, 1 if s['firing'] else 0)
+            yield count
+            yield firing
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the collector imports its modules by plain name (as it runs from this
+# directory) and reads its settings at import time; keep logs in memory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_DATA_DIR', '')
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import app as collector
+
+
+class SlowStore:
+    """Stands in for the LogStore; append() blocks until released."""
+
+    def __init__(self, fail=False):
+        self.release = threading.Event()
+        self.appending = threading.Event()
+        self.fail = fail
+        self.stored = []
+
+    def append(self, app, lines, now=None, parsed=None):
+        self.appending.set()
+        self.release.wait(10)
+        if self.fail:
+            raise OSError('disk full')
+        self.stored.append(list(lines))
+        return len(lines)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(collector, 'acks', collector.Acks())
+    monkeypatch.setitem(collector.app.config, 'PROPAGATE_EXCEPTIONS', False)
+    return collector.app.test_client()
+
+
+def _post(client, out, seq=1):
+    resp = client.post('/ingest', json={'app': 'web', 'sender': 's1', 'seq': seq, 'logs': ['a', 'b']})
+    out.append((resp.status_code, resp.get_json()))
+
+
+def _race(client, store):
+    out = []
+    first = threading.Thread(target=_post, args=(client, out))
+    first.start()
+    assert store.appending.wait(5)
+    # the sidecar retries the same batch while the first request is still storing it
+    retry = threading.Thread(target=_post, args=(client, out))
+    retry.start()
+    retry.join(0.2)
+    assert retry.is_alive()
+    store.release.set()
+    first.join(5)
+    retry.join(5)
+    return out
+
+
+def test_concurrent_retry_is_stored_once(client, monkeypatch):
+    store = SlowStore()
+    monkeypatch.setattr(collector, 'storage', store)
+
+    out = _race(client, store)
+
+    assert store.stored == [['a', 'b']]
+    assert sorted(out, key=lambda r: 'duplicate' in r[1]) == [
+        (200, {'ack': 1, 'lines': 2}), (200, {'ack': 1, 'lines': 0, 'duplicate': True})]
+
+
+def test_failed_store_releases_the_batch_for_the_retry(client, monkeypatch):
+    store = SlowStore(fail=True)
+    monkeypatch.setattr(collector, 'storage', store)
+
+    out = _race(client, store)
+
+    # the retry waited for the failed attempt, then stored the batch itself
+    # (this fake fails every append, so it also answers 500)
+    assert [status for status, _ in out] == [500, 500]
+    store.fail = False
+    out = []
+    _post(client, out)
+    assert out == [(200, {'ack': 1, 'lines': 2})]
+    assert store.stored == [['a', 'b']]
@@ -0,0 +1,29 @@
+import json
+import os
+
+from logstore import AppLog
+
+
+def _lines(log):
+    return [e['line'] if isinstance(e, dict) else e[1] for e in log.search(float('-inf'), float('inf'), [], None, 100)]
+
+
+def test_wal_replays_unsealed_lines_after_a_crash(tmp_path):
+    log = AppLog(max_lines=100, segment_lines=4, directory=str(tmp_path))
+    log.extend(['one', 'two', 'three', 'four', 'ERROR five'], 100.0)
+    # the process dies without close(): one sealed segment and a WAL holding the fifth line,
+    # plus a torn record from a write that never finished
+    with open(os.path.join(str(tmp_path), 'active.wal'), 'a', encoding='utf-8') as f:
+        f.write('[101.0, "si')
+
+    reopened = AppLog(max_lines=100, segment_lines=4, directory=str(tmp_path))
+
+    assert _lines(reopened) == ['one', 'two', 'three', 'four', 'ERROR five']
+    assert len(reopened.disk) == 1
+    # the replayed line is written to the fresh WAL again, so a second crash keeps it
+    with open(os.path.join(str(tmp_path), 'active.wal'), encoding='utf-8') as f:
+        head, *records = [json.loads(line) for line in f]
+    assert head == {'seq': 1}
+    assert [r[1] for r in records] == ['ERROR five']
+    reopened.close()
+    log.close()
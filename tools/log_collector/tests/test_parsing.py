@@ -0,0 +1,67 @@
+import pytest
+
+import parsing
+from parsing import MAX_VALUE_LEN, Pipeline
+
+
+@pytest.fixture
+def pipeline():
+    return Pipeline()
+
+
+def test_json_normalises_keys_and_level(pipeline):
+    line = ('{"time": "2024-05-01T12:00:00Z", "levelname": "WARN", "msg": "slow query", '
+            '"requestId": "r1", "cached": true, "ctx": {"a": 1}, "user": "-"}')
+    assert pipeline.parse('api', line) == ('warning', {'request_id': 'r1', 'cached': 'true'}, 'json')
+
+
+def test_logfmt_unquotes_values(pipeline):
+    line = 'ts=2024-05-01T12:00:00Z level=err path="/a b" note="say \\"hi\\"" user_id=42'
+    assert pipeline.parse('api', line) == (
+        'error', {'path': '/a b', 'note': 'say "hi"', 'user_id': '42'}, 'logfmt')
+
+
+def test_django(pipeline):
+    line = '2024-05-01 12:00:00,123 ERROR helpsite.views Internal Server Error: /tickets/'
+    assert pipeline.parse('helpsite', line) == ('error', {'logger': 'helpsite.views'}, 'django')
+
+
+def test_gunicorn_access_level_follows_status(pipeline):
+    line = '10.0.0.1 - - [01/May/2024:12:00:00 +0000] "GET /api/items?page=2 HTTP/1.1" 404 12 "-" "curl/8.0"'
+    level, fields, name = pipeline.parse('helpsite', line)
+    assert (level, name) == ('warning', 'gunicorn_access')
+    assert fields == {'remote': '10.0.0.1', 'method': 'GET', 'path': '/api/items', 'status': '404',
+                      'bytes': '12', 'agent': 'curl/8.0'}
+
+
+def test_gunicorn_error(pipeline):
+    line = '[2024-05-01 12:00:00 +0000] [42] [CRITICAL] WORKER TIMEOUT (pid:43)'
+    assert pipeline.parse('helpsite', line) == ('critical', {'pid': '42'}, 'gunicorn_error')
+
+
+@pytest.mark.parametrize('line, level', [
+    ('{"level": "error", "msg": ', 'error'),  # torn JSON
+    ('[]', None),
+    ('10.0.0.1 - - [bad] "GET / HTTP/1.1" abc', None),
+    ('retrying in 5s, WARN only once', 'warning'),
+    ('a=1 but only one pair', None),
+])
+def test_unrecognised_lines_keep_the_raw_line(pipeline, line, level):
+    # no fields; the level, if any, is detected from the text
+    assert pipeline.parse('api', line) == (level, None, 'none')
+
+
+def test_long_values_are_cut_and_unknown_levels_fall_back(pipeline):
+    level, fields, _ = pipeline.parse('api', '{"level": "loud", "detail": "%s ERROR"}' % ('x' * 1000))
+    assert len(fields["detail"]) == MAX_VALUE_LEN
+    assert level == 'error'
+
+
+def test_custom_profile_per_app(monkeypatch):
+    monkeypatch.setattr(parsing, 'PARSERS', dict(parsing.PARSERS))
+    p = Pipeline(apps={'jobs': ['worker']}, profiles={'worker': r'(?P<worker>worker-\d+) (?P<event>\w+)'})
+    assert p.parse('jobs', 'worker-3 started job 9') == (None, {'worker': 'worker-3', 'event': 'started'}, 'worker')
+    # other apps keep the default chain
+    assert p.parse('api', 'worker-3 started job 9') == (None, None, 'none')
+    with pytest.raises(ValueError):
+        Pipeline(chain=['nope'])
@@ -0,0 +1,32 @@
+import sys
+import threading
+
+from prometheus_client import CollectorRegistry
+
+import rules
+
+
+def test_label_cap_holds_under_concurrent_ingests(monkeypatch):
+    monkeypatch.setattr(rules, 'MAX_SERIES', 50)
+    interval = sys.getswitchinterval()
+    # switch threads as often as possible so check-then-add races show up
+    sys.setswitchinterval(1e-6)
+    try:
+        ruleset = rules.RuleSet([{'name': 'hits_total', 'regex': r'user=(?P<user>\w+)', 'labels': {'user': '$user'}}],
+                                CollectorRegistry())
+        start = threading.Barrier(8)
+
+        def ingest(n):
+            start.wait()
+            lines = [f'user=u{n}_{i}' for i in range(200)]
+            ruleset.observe('web', lines, [(None, None)] * len(lines), 0)
+
+        threads = [threading.Thread(target=ingest, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert len(ruleset.rules[0]._series) == 50
@@ -1,47 +1,164 @@
 import os
 import time
 import json
+import gzip
+import random
+import signal
+import socket
+import threading
 import requests
 
+from spool import Spool
+from tailer import Tailer
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for LOG_ENCODING=zstd
+    zstandard = None
+
+# a file or a glob (e.g. /var/log/app/*.log); every matching file is followed
 LOG_PATH = os.environ.get('LOG_PATH', '/var/log/app.log')
 APP_NAME = os.environ.get('APP_NAME', 'unknown')
 COLLECTOR = os.environ.get('COLLECTOR_URL', 'http://collector:5000/ingest')
+# gzip or zstd compressed newline-delimited lines, 'identity' for uncompressed
+# lines, or 'json' for the original {"app", "logs"} body older collectors expect
+ENCODING = os.environ.get('LOG_ENCODING', 'gzip')
+COMPRESS_LEVEL = int(os.environ.get('LOG_COMPRESS_LEVEL', '6'))
+# a batch is sent once it holds FLUSH_MAX_LINES lines or FLUSH_MAX_BYTES bytes, or
+# its first line is REPORT_INTERVAL seconds old, whichever comes first
+FLUSH_MAX_LINES = int(os.environ.get('FLUSH_MAX_LINES', '5000'))
+FLUSH_MAX_BYTES = int(os.environ.get('FLUSH_MAX_BYTES', str(1024 * 1024)))
+REPORT_INTERVAL = float(os.environ.get('REPORT_INTERVAL', '5'))
+# unacknowledged batches wait here (mount a volume to keep them across restarts)
+SPOOL_DIR = os.environ.get('SPOOL_DIR', '/tmp/log-sidecar-spool')
+SPOOL_MAX_MB = float(os.environ.get('SPOOL_MAX_MB', '100'))
+# read offsets per file, saved after every spooled batch so a restart resumes there
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', os.path.join(SPOOL_DIR, 'offsets.json'))
+# read size per file; on the very first start existing files are read from the
+# end unless TAIL_FROM=start
+READ_CHUNK_KB = int(os.environ.get('READ_CHUNK_KB', '256'))
+TAIL_FROM = os.environ.get('TAIL_FROM', 'end')
+# retry delay after a failed send doubles from RETRY_MIN up to RETRY_MAX seconds
+RETRY_MIN = float(os.environ.get('RETRY_MIN', '1'))
+RETRY_MAX = float(os.environ.get('RETRY_MAX', '60'))
+# on SIGTERM, keep trying to deliver the spool for this many seconds
+SHUTDOWN_GRACE = float(os.environ.get('SHUTDOWN_GRACE', '5'))
+# identifies this sidecar's batch sequence to the collector (new on every start)
+SENDER = f'{socket.gethostname()}-{os.getpid()}-{int(time.time())}'
+
+def encode_batch(lines, seq, encoding=ENCODING):
+    """(body, headers) for one batch in the given encoding."""
+    if encoding == 'json':
+        body = json.dumps({'app': APP_NAME, 'logs': lines, 'sender': SENDER, 'seq': seq}).encode('utf-8')
+        return body, {'Content-Type': 'application/json'}
+    out = ''.join(line.replace('\n', ' ') + '\n' for line in lines).encode('utf-8', 'replace')
+    headers = {'Content-Type': 'application/x-log-lines', 'X-Log-App': APP_NAME,
+               'X-Log-Sender': SENDER, 'X-Log-Seq': str(seq)}
+    if encoding == 'gzip':
+        body = gzip.compress(out, COMPRESS_LEVEL)
+    elif encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('LOG_ENCODING=zstd needs the zstandard package')
+        body = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(out)
+    else:
+        return out, headers
+    headers['Content-Encoding'] = encoding
+    return body, headers
+
+def post_batch(session, seq, headers, body):
+    """POST one encoded batch. True once the collector acknowledged ``seq``,
+    False if it rejected the batch for good; raises if it should be retried."""
+    resp = session.post(COLLECTOR, data=body, headers=headers, timeout=10)
+    if resp.status_code == 204:
+        return True  # collector without acks
+    if 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+        return False
+    resp.raise_for_status()
+    if resp.json().get('ack') != seq:
+        raise ValueError(f'collector acknowledged {resp.text!r} for batch {seq}')
+    return True
+
+def send_spooled(spool, wake, session, stop=None):
+    """Send spooled batches oldest first, backing off while the collector fails."""
+    delay = 0.0
+    while stop is None or not stop.is_set():
+        wake.clear()
+        batch = spool.oldest()
+        if batch is None:
+            wake.wait(1.0)
+            continue
+        seq, headers, body = batch
+        try:
+            if not post_batch(session, seq, headers, body):
+                print('batch', seq, 'rejected by collector, dropping it')
+            spool.remove(seq)
+            delay = 0.0
+        except Exception as e:
+            delay = min(max(delay * 2, RETRY_MIN), RETRY_MAX)
+            print('send error', e, f'- {len(spool)} batches spooled, retrying in {delay:.0f}s')
+            # jitter so sidecars restarted together do not retry in lockstep
+            (stop or threading.Event()).wait(delay * random.uniform(0.5, 1.0))
+
+def spool_batch(spool, wake, lines):
+    seq = spool.next_seq()
+    body, headers = encode_batch(lines, seq)
+    dropped = spool.put(seq, body, headers)
+    if dropped:
+        print('spool full, dropped', dropped, 'oldest batches')
+    wake.set()
 
-def follow(path):
-    try:
-        f = open(path, 'r')
-    except FileNotFoundError:
-        # create empty file and open
-        open(path, 'a').close()
-        f = open(path, 'r')
-    # seek to end
-    f.seek(0, 2)
-    while True:
-        line = f.readline()
-        if line:
-            yield line
-        else:
-            time.sleep(0.5)
-
-def batch_and_send(iterator, interval=60):
+def batch_and_send(tailer, spool, wake, stop, max_lines=FLUSH_MAX_LINES, max_bytes=FLUSH_MAX_BYTES,
+                   max_latency=REPORT_INTERVAL):
+    """Group tailed lines into batches and spool them for sending until
+    ``stop`` is set. Read offsets are checkpointed after each spooled batch."""
     buffer = []
-    last_send = time.time()
-    for line in iterator:
-        buffer.append(line.rstrip('\n'))
-        now = time.time()
-        if now - last_send >= interval:
-            payload = {'app': APP_NAME, 'logs': buffer[-1000:]}  # cap
-            try:
-                requests.post(COLLECTOR, json=payload, timeout=5)
-            except Exception:
-                pass
+    size = 0
+    first = 0.0
+    tick = min(1.0, max_latency)
+    while not stop.is_set():
+        lines = tailer.read()
+        if lines:
+            if not buffer:
+                first = time.monotonic()
+            buffer += lines
+            # FLUSH_MAX_BYTES is a body size, so count encoded bytes, not characters
+            size += sum(len(line.encode('utf-8', 'replace')) for line in lines) + len(lines)
+        # a quiet file still gets its partial batch out after max_latency
+        if buffer and (len(buffer) >= max_lines or size >= max_bytes
+                       or time.monotonic() - first >= max_latency):
+            spool_batch(spool, wake, buffer)
+            tailer.checkpoint()
             buffer = []
-            last_send = now
+            size = 0
+        if not lines:
+            tailer.wait(tick)
+    if buffer:
+        spool_batch(spool, wake, buffer)
+    tailer.checkpoint()
 
 def main():
-    tail = follow(LOG_PATH)
-    # Start sending in a simple loop; this is per-pod sidecar so it only reports its app
-    batch_and_send(tail, interval=int(os.environ.get('REPORT_INTERVAL', '60')))
+    spool = Spool(SPOOL_DIR, int(SPOOL_MAX_MB * 1024 * 1024))
+    wake = threading.Event()
+    stop = threading.Event()
+    session = requests.Session()  # keep the connection to the collector open
+    # only the sender thread posts (a Session is not shared across threads); it
+    # keeps running through the shutdown grace period and stops after it
+    stop_sending = threading.Event()
+    sender = threading.Thread(target=send_spooled, args=(spool, wake, session, stop_sending), daemon=True)
+    sender.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    tailer = Tailer(LOG_PATH, CHECKPOINT_PATH, READ_CHUNK_KB * 1024, start_at_end=TAIL_FROM != 'start')
+    # this is per-pod sidecar so it only reports its app
+    batch_and_send(tailer, spool, wake, stop)
+    tailer.close()
+    # last chance to deliver what is left before the pod goes away
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    while len(spool) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    stop_sending.set()
+    wake.set()
+    sender.join(max(0.0, deadline - time.monotonic()))
 
 if __name__ == '__main__':
     main()
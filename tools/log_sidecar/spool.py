@@ -0,0 +1,94 @@
+"""On-disk queue of batches the collector has not acknowledged yet.
+
+Every batch is written here (fsynced) before it is sent and deleted once the
+collector acknowledges it, so a collector outage or a sidecar restart only
+delays lines instead of losing them. Each file keeps the exact body and
+headers (including sender id and sequence number) it was first encoded
+with, so a resend is recognised by the collector as a duplicate if the
+earlier attempt did get through. When the spool outgrows ``max_bytes`` the
+oldest batches are dropped.
+"""
+import json
+import os
+import threading
+
+
+class Spool:
+    def __init__(self, directory, max_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._files = []
+        self._sizes = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+            elif name.endswith('.batch'):
+                self._files.append(name)
+                self._sizes[name] = os.path.getsize(path)
+        self._next = int(self._files[-1][:-6]) + 1 if self._files else 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+    def size(self):
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def next_seq(self):
+        """Number for the next batch (increasing, also across restarts)."""
+        with self._lock:
+            seq = self._next
+            self._next += 1
+        return seq
+
+    def put(self, seq, body, headers):
+        """Durably queue an encoded batch; returns how many old batches were dropped."""
+        name = f'{seq:012d}.batch'
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps({'seq': seq, 'headers': headers}).encode('utf-8') + b'\n')
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dropped = 0
+        with self._lock:
+            self._files.append(name)
+            self._sizes[name] = os.path.getsize(path)
+            while self.max_bytes and len(self._files) > 1 and sum(self._sizes.values()) > self.max_bytes:
+                self._remove(self._files[0])
+                dropped += 1
+        return dropped
+
+    def oldest(self):
+        """(seq, headers, body) of the oldest queued batch, or None."""
+        while True:
+            with self._lock:
+                if not self._files:
+                    return None
+                name = self._files[0]
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    meta = json.loads(f.readline())
+                    return meta['seq'], meta['headers'], f.read()
+            except (OSError, ValueError, KeyError) as e:
+                print('spool read error', name, e)
+                self.remove(int(name[:-6]))
+
+    def remove(self, seq):
+        with self._lock:
+            self._remove(f'{seq:012d}.batch')
+
+    def _remove(self, name):
+        if name in self._sizes:
+            self._files.remove(name)
+            del self._sizes[name]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,214 @@
+"""Follow every file matching a glob across rotation, truncation and restarts.
+
+Files are tracked by (device, inode) rather than by name. When a path
+starts pointing at a new inode (logrotate's rename-and-create) or goes
+away, the old file is kept open and read to the end before it is dropped,
+and the new file is read from its first byte. A file that shrinks below
+the read position, or no longer has a line end where the last line read
+ended (copytruncate followed by a quick write), is re-read from the start.
+
+``read()`` returns the complete lines available right now, reading each
+file in large chunks with ``os.read`` and splitting them in C instead of
+calling ``readline()`` per line. ``checkpoint()`` atomically writes the
+offset just past the last line returned for every file, keyed by inode,
+so a restarted sidecar resumes exactly there; a rotated file that no
+longer matches the glob is found again by its inode and finished first.
+Call it only once the returned lines are safe (spooled), so a crash
+re-reads lines instead of losing them.
+"""
+import glob
+import json
+import os
+import time
+
+from watch import Watcher
+
+# a "line" without a newline is cut here so one runaway write cannot grow memory
+MAX_LINE_BYTES = 1024 * 1024
+
+
+class _File:
+    def __init__(self, path, fd, key, offset):
+        self.path = path
+        self.fd = fd
+        self.key = key
+        self.offset = offset  # just past the last complete line returned
+        self.partial = b''
+        self.last_byte = None  # byte just before offset, to notice rewrites
+        self.rotated_at = None
+        os.lseek(fd, offset, os.SEEK_SET)
+
+
+class Tailer:
+    def __init__(self, pattern, checkpoint_path=None, chunk_size=256 * 1024, start_at_end=True,
+                 rotate_grace=5.0, rescan=1.0):
+        self.pattern = pattern
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.rotate_grace = rotate_grace
+        self.rescan = rescan
+        self.files = {}
+        self.watcher = Watcher()
+        self._next_scan = 0.0
+        self._changed = True
+        saved = self._load_checkpoint()
+        if not glob.has_magic(pattern) and not os.path.exists(pattern):
+            # create empty file so there is something to follow
+            open(pattern, 'a').close()
+        # without a checkpoint start at the end of existing files, like tail -f;
+        # with one, files it does not know were created while we were away
+        self._scan(saved, start_at_end and saved is None)
+
+    def _load_checkpoint(self):
+        if not self.checkpoint_path:
+            return None
+        try:
+            with open(self.checkpoint_path) as f:
+                entries = json.load(f)['files']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print('checkpoint load error', self.checkpoint_path, e)
+            return None
+        return {(e['dev'], e['ino']): e for e in entries}
+
+    def _open(self, path, key, offset):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            print('open error', path, e)
+            return None
+        st = os.fstat(fd)
+        if (st.st_dev, st.st_ino) != key:
+            os.close(fd)  # replaced between stat and open; the next scan picks it up
+            return None
+        if offset > st.st_size:
+            offset = 0  # truncated (or a reused inode) while we were away
+        tf = self.files[key] = _File(path, fd, key, offset)
+        self.watcher.add(os.path.dirname(os.path.abspath(path)))
+        return tf
+
+    def _scan(self, saved=None, at_end=False):
+        found = []
+        for path in sorted(glob.glob(self.pattern)):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((path, (st.st_dev, st.st_ino), st.st_size))
+        seen = {key for _, key, _ in found}
+        if saved:
+            # rotated away while we were down: find the old file by inode and
+            # open it before its successor, so its lines are returned first
+            for key, entry in saved.items():
+                if key in seen or key in self.files:
+                    continue
+                path = self._find_inode(os.path.dirname(entry['path']), key)
+                if path:
+                    tf = self._open(path, key, entry['offset'])
+                    if tf:
+                        tf.rotated_at = time.monotonic()
+        for path, key, size in found:
+            if key in self.files:
+                continue
+            if saved and key in saved:
+                offset = saved[key]['offset']
+            else:
+                offset = size if at_end else 0
+            self._open(path, key, offset)
+        now = time.monotonic()
+        for key, tf in self.files.items():
+            if key not in seen and tf.rotated_at is None:
+                tf.rotated_at = now
+        if not glob.has_magic(self.pattern):
+            # watch the directory even while the file does not exist yet
+            self.watcher.add(os.path.dirname(os.path.abspath(self.pattern)))
+        self._next_scan = now + self.rescan
+
+    @staticmethod
+    def _find_inode(directory, key):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if (st.st_dev, st.st_ino) == key:
+                        return entry.path
+        except OSError:
+            pass
+        return None
+
+    def _read_file(self, tf):
+        """(lines, hit_eof) for one chunk of ``tf``."""
+        pos = tf.offset + len(tf.partial)
+        # shorter than what we read, or rewritten where the last line returned ended
+        if os.fstat(tf.fd).st_size < pos or (tf.last_byte and os.pread(tf.fd, 1, tf.offset - 1) != tf.last_byte):
+            print('truncated, reading from the start', tf.path)
+            os.lseek(tf.fd, 0, os.SEEK_SET)
+            tf.offset = 0
+            tf.partial = b''
+            tf.last_byte = None
+        data = os.read(tf.fd, self.chunk_size)
+        if not data:
+            return [], True
+        buf = tf.partial + data if tf.partial else data
+        cut = buf.rfind(b'\n')
+        if cut < 0:
+            if len(buf) < MAX_LINE_BYTES:
+                tf.partial = buf
+                return [], False
+            cut = len(buf)
+        lines = buf[:cut].decode('utf-8', 'replace').split('\n')
+        end = min(cut + 1, len(buf))
+        tf.offset += end
+        tf.last_byte = buf[end - 1:end]
+        tf.partial = buf[end:]
+        return lines, len(data) < self.chunk_size
+
+    def read(self):
+        """Complete lines that are available now (at most one chunk per file)."""
+        if self._changed or time.monotonic() >= self._next_scan:
+            self._changed = False
+            self._scan()
+        out = []
+        for key, tf in list(self.files.items()):
+            try:
+                lines, eof = self._read_file(tf)
+            except OSError as e:
+                print('read error', tf.path, e)
+                lines, eof = [], True
+            out += lines
+            if eof and tf.rotated_at is not None and time.monotonic() - tf.rotated_at >= self.rotate_grace:
+                # the writer has moved on to the new file
+                if tf.partial:
+                    out.append(tf.partial.decode('utf-8', 'replace'))
+                    tf.offset += len(tf.partial)
+                os.close(tf.fd)
+                del self.files[key]
+        return out
+
+    def wait(self, timeout):
+        """Sleep until a watched directory changes or ``timeout`` passes."""
+        if self.watcher.wait(timeout):
+            self._changed = True
+
+    def checkpoint(self):
+        """Persist the offsets of every line returned by read() so far."""
+        if not self.checkpoint_path:
+            return
+        entries = [{'path': tf.path, 'dev': tf.key[0], 'ino': tf.key[1], 'offset': tf.offset}
+                   for tf in self.files.values()]
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'files': entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def close(self):
+        for tf in self.files.values():
+            os.close(tf.fd)
+        self.files.clear()
+        self.watcher.close()
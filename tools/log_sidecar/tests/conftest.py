@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the sidecar imports its modules by plain name, as it runs from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
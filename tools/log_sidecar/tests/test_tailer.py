@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import tailer
+from tailer import Tailer
+
+
+def _write(path, text, mode='a'):
+    with open(path, mode) as f:
+        f.write(text)
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = str(tmp_path / 'app.log')
+    _write(path, 'a\nb\n', 'w')
+    return path
+
+
+def _open(path, checkpoint=None, **kwargs):
+    kwargs.setdefault('start_at_end', False)
+    return Tailer(path, checkpoint, rotate_grace=0, rescan=0, **kwargs)
+
+
+def _drain(t, reads=20):
+    # read() returns at most one chunk per file, possibly no complete line yet
+    out = []
+    for _ in range(reads):
+        out += t.read()
+    return out
+
+
+def test_rename_and_create_reads_old_file_then_new(log):
+    t = _open(log)
+    assert _drain(t) == ['a', 'b']
+
+    _write(log, 'c\n')
+    os.rename(log, log + '.1')
+    _write(log, 'd\n', 'w')
+
+    assert _drain(t) == ['c', 'd']
+    # the rotated file is finished and dropped
+    assert [tf.path for tf in t.files.values()] == [log]
+    t.close()
+
+
+def test_truncate_and_rewrite_starts_over(log):
+    t = _open(log)
+    assert _drain(t) == ['a', 'b']
+
+    # shorter than what was read
+    _write(log, 'x\n', 'w')
+    assert _drain(t) == ['x']
+
+    # copytruncate followed by a quick write that is already longer again
+    _write(log, 'xyz\nw\n', 'w')
+    assert _drain(t) == ['xyz', 'w']
+    t.close()
+
+
+def test_restart_from_checkpoint_loses_and_repeats_nothing(log, tmp_path):
+    checkpoint = str(tmp_path / 'offsets.json')
+    t = _open(log, checkpoint)
+    assert _drain(t) == ['a', 'b']
+    t.checkpoint()
+    _write(log, 'c\n')
+    # read but never spooled: must come back after the restart
+    assert _drain(t) == ['c']
+    t.close()
+    _write(log, 'd\n')
+
+    t = _open(log, checkpoint, start_at_end=True)
+    assert _drain(t) == ['c', 'd']
+    t.close()
+
+
+def test_restart_finishes_a_file_rotated_while_down(log, tmp_path):
+    checkpoint = str(tmp_path / 'offsets.json')
+    t = _open(log, checkpoint)
+    assert _drain(t) == ['a', 'b']
+    t.checkpoint()
+    t.close()
+
+    _write(log, 'c\n')
+    # the rotated name no longer matches the pattern; it is found by inode
+    os.rename(log, str(tmp_path / 'app.log-20240101'))
+    _write(log, 'd\n', 'w')
+
+    t = _open(log, checkpoint, start_at_end=True)
+    assert _drain(t) == ['c', 'd']
+    t.close()
+
+
+def test_runaway_line_is_cut(log, monkeypatch):
+    monkeypatch.setattr(tailer, 'MAX_LINE_BYTES', 16)
+    t = _open(log, chunk_size=8)
+    assert _drain(t) == ['a', 'b']
+
+    _write(log, 'x' * 20 + '\nend\n')
+    lines = _drain(t)
+    assert ''.join(lines[:-1]) == 'x' * 20
+    assert all(len(line) <= 16 for line in lines) and lines[-1] == 'end'
+    t.close()
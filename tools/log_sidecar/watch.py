@@ -0,0 +1,90 @@
+"""Wait for changes in a directory without sleep-polling.
+
+On Linux this uses inotify through libc (no extra package), so a write to a
+watched log wakes the tailer immediately and an idle file costs nothing.
+Elsewhere, or if inotify is unavailable (e.g. the watch limit is reached),
+``wait`` falls back to sleeping ``poll_interval`` seconds.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+DIR_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class Watcher:
+    """Directories to watch; ``wait(timeout)`` returns once one changed."""
+
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self.fd = None
+        self._watched = set()
+        libc = _libc()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self._libc = libc
+                self.fd = fd
+
+    @property
+    def polling(self):
+        return self.fd is None
+
+    def add(self, directory):
+        """Watch ``directory``; False if it cannot be watched (then wait polls)."""
+        directory = os.path.abspath(directory)
+        if directory in self._watched:
+            return True
+        if self.fd is None:
+            return False
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), DIR_EVENTS)
+        if wd < 0:
+            print('inotify watch failed', directory, os.strerror(ctypes.get_errno()))
+            self.close()
+            return False
+        self._watched.add(directory)
+        return True
+
+    def wait(self, timeout):
+        """Block until a watched directory changes or ``timeout`` passes;
+        True if something (may have) changed."""
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return True
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        # the events themselves are not needed, callers re-check their files
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._watched.clear()